@@ -0,0 +1,53 @@
+-- Скрипт для помесячной сводки посещаемости (отчёты /reports/attendance)
+
+-- 1. Сводная таблица: число отметок present/absent по студенту, предмету, группе и месяцу
+CREATE TABLE IF NOT EXISTS attendance_monthly_summary (
+    student_id INTEGER NOT NULL,
+    subject_id INTEGER NOT NULL,
+    group_id INTEGER NOT NULL,
+    month DATE NOT NULL,
+    present INTEGER NOT NULL DEFAULT 0,
+    absent INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, subject_id, group_id, month)
+);
+CREATE INDEX IF NOT EXISTS attendance_summary_group_month_idx ON attendance_monthly_summary (group_id, month);
+CREATE INDEX IF NOT EXISTS attendance_summary_subject_month_idx ON attendance_monthly_summary (subject_id, month);
+-- Индекс для неполных месяцев на границах диапазона, которые считаются по самой таблице attendance
+CREATE INDEX IF NOT EXISTS attendance_date_idx ON attendance (attendance_date);
+
+-- 2. Триггер на attendance: старая строка вычитается из сводки, новая прибавляется.
+-- INSERT ... ON CONFLICT DO UPDATE при смене статуса срабатывает как UPDATE и переносит отметку между счётчиками
+CREATE OR REPLACE FUNCTION attendance_summary_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.student_id IS NOT NULL AND OLD.subject_id IS NOT NULL AND OLD.group_id IS NOT NULL THEN
+        UPDATE attendance_monthly_summary
+        SET present = present - (OLD.status = 'present')::int,
+            absent = absent - (OLD.status = 'absent')::int
+        WHERE student_id = OLD.student_id AND subject_id = OLD.subject_id AND group_id = OLD.group_id
+            AND month = date_trunc('month', OLD.attendance_date)::date;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.student_id IS NOT NULL AND NEW.subject_id IS NOT NULL AND NEW.group_id IS NOT NULL THEN
+        INSERT INTO attendance_monthly_summary (student_id, subject_id, group_id, month, present, absent)
+        VALUES (NEW.student_id, NEW.subject_id, NEW.group_id, date_trunc('month', NEW.attendance_date)::date,
+                (NEW.status = 'present')::int, (NEW.status = 'absent')::int)
+        ON CONFLICT (student_id, subject_id, group_id, month) DO UPDATE
+        SET present = attendance_monthly_summary.present + EXCLUDED.present,
+            absent = attendance_monthly_summary.absent + EXCLUDED.absent;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS attendance_summary_trigger ON attendance;
+CREATE TRIGGER attendance_summary_trigger
+AFTER INSERT OR UPDATE OR DELETE ON attendance
+FOR EACH ROW EXECUTE FUNCTION attendance_summary_apply();
+
+-- 3. Первичное заполнение (и восстановление после ручных правок в обход триггера)
+TRUNCATE attendance_monthly_summary;
+INSERT INTO attendance_monthly_summary (student_id, subject_id, group_id, month, present, absent)
+SELECT student_id, subject_id, group_id, date_trunc('month', attendance_date)::date,
+       COUNT(*) FILTER (WHERE status = 'present'), COUNT(*) FILTER (WHERE status = 'absent')
+FROM attendance
+WHERE student_id IS NOT NULL AND subject_id IS NOT NULL AND group_id IS NOT NULL
+GROUP BY student_id, subject_id, group_id, date_trunc('month', attendance_date);
@@ -0,0 +1,58 @@
+-- Скрипт для перевода face_encoding (JSONB или FLOAT[]) в бинарный столбец face_encoding_bin (BYTEA)
+-- Формат: 128 значений float4 в сетевом порядке байт (float4send), 512 байт на эмбеддинг
+
+-- 1. Добавление бинарного столбца; исходный столбец становится необязательным на период двойного чтения
+ALTER TABLE faces ADD COLUMN IF NOT EXISTS face_encoding_bin BYTEA;
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT FROM information_schema.columns
+        WHERE table_name = 'faces' AND column_name = 'face_encoding'
+    ) THEN
+        ALTER TABLE faces ALTER COLUMN face_encoding DROP NOT NULL;
+    END IF;
+END $$;
+
+-- 2. Заполнение face_encoding_bin из исходного столбца
+DO $$
+DECLARE
+    source_type TEXT;
+BEGIN
+    SELECT data_type INTO source_type
+    FROM information_schema.columns
+    WHERE table_name = 'faces' AND column_name = 'face_encoding';
+
+    IF source_type = 'jsonb' THEN
+        EXECUTE $sql$
+            UPDATE faces SET face_encoding_bin = (
+                SELECT string_agg(float4send(e.value::float4), ''::bytea ORDER BY e.ordinality)
+                FROM jsonb_array_elements_text(face_encoding) WITH ORDINALITY AS e(value, ordinality)
+            )
+            WHERE face_encoding_bin IS NULL AND jsonb_typeof(face_encoding) = 'array'
+        $sql$;
+    ELSIF source_type = 'ARRAY' THEN
+        EXECUTE $sql$
+            UPDATE faces SET face_encoding_bin = (
+                SELECT string_agg(float4send(e.value::float4), ''::bytea ORDER BY e.ordinality)
+                FROM unnest(face_encoding) WITH ORDINALITY AS e(value, ordinality)
+            )
+            WHERE face_encoding_bin IS NULL AND face_encoding IS NOT NULL
+        $sql$;
+    ELSE
+        RAISE NOTICE 'Столбец face_encoding не найден, переносить нечего';
+    END IF;
+END $$;
+
+-- 3. GIN-индекс по JSONB не используется поиском похожих лиц
+DROP INDEX IF EXISTS faces_encoding_gin;
+
+-- 4. Проверка: строки без бинарного эмбеддинга и строки неверной длины
+SELECT COUNT(*) FILTER (WHERE face_encoding_bin IS NULL) AS without_bin,
+       COUNT(*) FILTER (WHERE octet_length(face_encoding_bin) NOT IN (512, 1024)) AS wrong_length
+FROM faces;
+
+-- 5. После завершения периода двойного чтения (все API-процессы читают face_encoding_bin,
+--    переменная окружения WRITE_JSONB_ENCODING=0) выполнить вручную:
+-- ALTER TABLE faces ALTER COLUMN face_encoding_bin SET NOT NULL;
+-- ALTER TABLE faces DROP COLUMN face_encoding;
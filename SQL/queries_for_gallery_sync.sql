@@ -0,0 +1,45 @@
+-- Скрипт для журнала изменений таблицы faces (инкрементальное обновление галереи лиц в API)
+
+-- 1. Таблица журнала
+CREATE TABLE IF NOT EXISTS faces_changes (
+    change_id BIGSERIAL PRIMARY KEY,
+    face_id INTEGER NOT NULL,
+    operation CHAR(1) NOT NULL,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 2. Триггер на faces: каждая вставка, изменение и удаление записывается в журнал
+CREATE OR REPLACE FUNCTION faces_log_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO faces_changes (face_id, operation) VALUES (OLD.face_id, 'D');
+        RETURN OLD;
+    END IF;
+    INSERT INTO faces_changes (face_id, operation) VALUES (NEW.face_id, LEFT(TG_OP, 1));
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS faces_changes_trigger ON faces;
+CREATE TRIGGER faces_changes_trigger
+AFTER INSERT OR UPDATE OR DELETE ON faces
+FOR EACH ROW EXECUTE FUNCTION faces_log_change();
+
+-- 3. Триггер на students: смена ФИО или группы затрагивает все лица студента
+CREATE OR REPLACE FUNCTION students_log_faces_change() RETURNS trigger AS $$
+BEGIN
+    IF NEW.full_name IS DISTINCT FROM OLD.full_name OR NEW.group_id IS DISTINCT FROM OLD.group_id THEN
+        INSERT INTO faces_changes (face_id, operation)
+        SELECT face_id, 'U' FROM faces WHERE student_id = NEW.student_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS students_faces_changes_trigger ON students;
+CREATE TRIGGER students_faces_changes_trigger
+AFTER UPDATE ON students
+FOR EACH ROW EXECUTE FUNCTION students_log_faces_change();
+
+-- 4. Очистка старых записей журнала (API-процессы, отставшие дольше, перезагружают галерею целиком)
+DELETE FROM faces_changes WHERE changed_at < CURRENT_TIMESTAMP - INTERVAL '24 hours';
@@ -0,0 +1,20 @@
+-- Скрипт для шаблонов студентов (сопоставление по одному вектору на студента, GALLERY_MATCH_MODE=templates)
+
+-- 1. Таблица шаблонов: среднее эмбеддингов студента без выбросов (float32 в сетевом порядке байт, как face_encoding_bin)
+-- и радиус - наибольшее расстояние от среднего до учтённых эмбеддингов
+CREATE TABLE IF NOT EXISTS face_templates (
+    student_id INTEGER PRIMARY KEY REFERENCES students(student_id) ON DELETE CASCADE,
+    template_bin BYTEA NOT NULL,
+    radius REAL NOT NULL,
+    encodings_count INTEGER NOT NULL,
+    inliers_count INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 2. Шаблоны рассчитываются в Python (main_encoding.refresh_student_templates) в тех же транзакциях,
+-- что изменяют faces. При каждом запуске API (init_db) рассчитываются шаблоны студентов с фотографиями,
+-- у которых шаблона нет. Студенты, требующие расчёта:
+-- SELECT DISTINCT f.student_id
+-- FROM faces f
+-- LEFT JOIN face_templates t ON t.student_id = f.student_id
+-- WHERE f.student_id IS NOT NULL AND t.student_id IS NULL;
@@ -169,6 +169,23 @@ function loadGroupsForStudentModal() {
     .catch(error => console.error('Error loading groups for student modal:', error));
 }
 
+// Загрузка всех страниц списка: следующая страница запрашивается по next_cursor, пока он есть
+function fetchAllPages(url, key, items = []) {
+    return fetch(url)
+    .then(response => {
+        if (!response.ok) throw new Error('Ошибка сети');
+        return response.json();
+    })
+    .then(data => {
+        if (data.error) return data;
+        items.push(...data[key]);
+        if (!data.next_cursor) return { [key]: items };
+        const base = url.replace(/([?&])cursor=[^&]*&?/, '$1').replace(/[?&]$/, '');
+        const separator = base.includes('?') ? '&' : '?';
+        return fetchAllPages(`${base}${separator}cursor=${encodeURIComponent(data.next_cursor)}`, key, items);
+    });
+}
+
 // Загрузка таблицы посещаемости
 function loadAttendance() {
     const groupId = document.getElementById('group-filter').value;
@@ -189,11 +206,7 @@ function loadAttendance() {
     showLoader('attendance-loader');
     let url = `${API_BASE_URL}/attendance?group_id=${groupId}&subject_id=${subjectId}&date=${date}`;
 
-    fetch(url)
-    .then(response => {
-        if (!response.ok) throw new Error('Failed to load attendance');
-        return response.json();
-    })
+    fetchAllPages(url, 'attendance')
     .then(data => {
         const tbody = document.getElementById('attendance-table-body');
         tbody.innerHTML = '';
@@ -238,22 +251,33 @@ function loadAttendance() {
     .finally(() => hideLoader('attendance-loader'));
 }
 
-// Загрузка таблицы студентов
-function loadStudents() {
+// Курсор следующей страницы студентов (null - страниц больше нет)
+let studentsNextCursor = null;
+
+// Загрузка таблицы студентов постранично; append=true дописывает следующую страницу
+function loadStudents(append = false) {
     const groupId = document.getElementById('student-group-filter').value;
-    let url = `${API_BASE_URL}/students`;
-    if (groupId) url += `?group_id=${groupId}`;
+    const params = new URLSearchParams();
+    if (groupId) params.append('group_id', groupId);
+    if (append && studentsNextCursor) params.append('cursor', studentsNextCursor);
+    const query = params.toString();
+    const url = `${API_BASE_URL}/students${query ? `?${query}` : ''}`;
+    const loadMoreBtn = document.getElementById('students-load-more');
 
     showLoader('students-loader');
     fetch(url)
     .then(response => response.json())
     .then(data => {
+        if (data.error) throw new Error(data.error);
         const tbody = document.getElementById('students-table-body');
-        tbody.innerHTML = '';
+        if (!append) tbody.innerHTML = '';
+        const offset = tbody.children.length;
+        studentsNextCursor = data.next_cursor;
+        loadMoreBtn.style.display = studentsNextCursor ? 'inline-block' : 'none';
         data.students.forEach((student, index) => {
             const tr = document.createElement('tr');
             tr.innerHTML = `
-            <td>${index + 1}</td>
+            <td>${offset + index + 1}</td>
             <td>${student.full_name}</td>
             <td>${student.group_name}</td>
             <td>${student.has_photo ? `<img src="/uploads/${student.image_id}.png" class="student-photo" alt="Фото студента">` : 'Нет фото'}</td>
@@ -273,55 +297,41 @@ function loadStudents() {
 }
 
 // Загрузка логов
-function loadLogs() {
+// Курсор следующей страницы логов (null - страниц больше нет)
+let logsNextCursor = null;
+
+// Загрузка логов от новых к старым; фильтрация и постраничная выдача на сервере
+function loadLogs(append = false) {
+    const params = new URLSearchParams();
+    const level = document.getElementById('logs-level-filter').value;
+    const search = document.getElementById('logs-search').value.trim();
+    if (level) params.append('level', level);
+    if (search) params.append('q', search);
+    if (append && logsNextCursor) params.append('cursor', logsNextCursor);
+    const loadMoreBtn = document.getElementById('logs-load-more');
+
     showLoader('logs-loader');
-    fetch(`${API_BASE_URL}/logs`)
-    .then(response => {
-        if (!response.ok) throw new Error('Failed to load logs');
-        return response.json();
-    })
+    fetch(`${API_BASE_URL}/logs?${params.toString()}`)
+    .then(response => response.json())
     .then(data => {
         const tbody = document.getElementById('logs-table-body');
-        tbody.innerHTML = '';
+        if (!append) tbody.innerHTML = '';
         if (data.error) {
             tbody.innerHTML = `<tr><td colspan="4">${data.error}</td></tr>`;
+            loadMoreBtn.style.display = 'none';
             return;
         }
+        const offset = tbody.children.length;
+        logsNextCursor = data.next_cursor;
+        loadMoreBtn.style.display = logsNextCursor ? 'inline-block' : 'none';
 
-        const parsedLogs = data.logs.map(log => {
-            const parts = log.match(/^(\S+ \S+,\d{3}) - (\w+) - (.+)$/);
-            if (!parts) {
-                return {
-                    timestamp: '',
-                    level: 'UNKNOWN',
-                    message: log,
-                    raw: log
-                };
-            }
-            return {
-                timestamp: parts[1].replace(',', '.'),
-                                         level: parts[2],
-                                         message: parts[3],
-                                         raw: log
-            };
-        });
-
-        parsedLogs.sort((a, b) => {
-            const timeA = a.timestamp ? new Date(a.timestamp).getTime() : 0;
-            const timeB = b.timestamp ? new Date(b.timestamp).getTime() : 0;
-            if (timeA !== timeB) {
-                return timeB - timeA;
-            }
-            const levelPriority = { 'ERROR': 3, 'WARNING': 2, 'INFO': 1, 'UNKNOWN': 0 };
-            return (levelPriority[b.level] || 0) - (levelPriority[a.level] || 0);
-        });
-
-        parsedLogs.forEach((log, index) => {
+        data.logs.forEach((log, index) => {
+            const level = log.level || 'UNKNOWN';
             const tr = document.createElement('tr');
             tr.innerHTML = `
-            <td>${index + 1}</td>
-            <td>${log.timestamp.replace('.', ',') || 'Неизвестно'}</td>
-            <td class="log-level-${log.level.toLowerCase()}">${log.level}</td>
+            <td>${offset + index + 1}</td>
+            <td>${log.timestamp || 'Неизвестно'}</td>
+            <td class="log-level-${level.toLowerCase()}">${level}</td>
             <td>${log.message}</td>
             `;
             tbody.appendChild(tr);
@@ -334,6 +344,9 @@ function loadLogs() {
     .finally(() => hideLoader('logs-loader'));
 }
 
+document.getElementById('logs-level-filter').addEventListener('change', () => loadLogs());
+document.getElementById('logs-search').addEventListener('input', debounce(() => loadLogs(), 300));
+
 // Применение фильтров посещаемости
 function applyFilters() {
     saveFilters();
@@ -391,11 +404,7 @@ function confirmAttendance() {
 
     showLoader('attendance-loader');
 
-    fetch(`${API_BASE_URL}/attendance?group_id=${groupId}&subject_id=${subjectId}&date=${date}`)
-    .then(response => {
-        if (!response.ok) throw new Error('Ошибка сети');
-        return response.json();
-    })
+    fetchAllPages(`${API_BASE_URL}/attendance?group_id=${groupId}&subject_id=${subjectId}&date=${date}`, 'attendance')
     .then(data => {
         if (data.error) {
             alert('Ошибка: ' + data.error);
@@ -643,6 +652,47 @@ document.getElementById('upload-photo-form').addEventListener('submit', function
     .finally(() => hideLoader('upload-photo-loader')); // Скрываем спиннер
 });
 
+// Построчное чтение потока NDJSON
+function readNdjson(response, onMessage) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    function pump() {
+        return reader.read().then(({ done, value }) => {
+            buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => onMessage(JSON.parse(line)));
+            if (done) {
+                if (buffer.trim()) onMessage(JSON.parse(buffer));
+                return;
+            }
+            return pump();
+        });
+    }
+    return pump();
+}
+
+// Отрисовка результата распознавания одного лица
+function renderFaceResult(resultsDiv, result) {
+    const div = document.createElement('div');
+    div.className = 'face-result';
+    let statusText = '';
+    if (result.status === 'present') {
+        statusText = 'Присутствовал';
+    } else if (result.status === 'unknown') {
+        statusText = 'Неизвестный';
+    } else if (result.status === 'other_group') {
+        statusText = 'Другая группа';
+    }
+    div.innerHTML = `
+    <img src="${API_BASE_URL}${result.face_image_url}" class="face-image" loading="lazy">
+    <p>${result.matches.length > 0 ? result.matches[0].full_name : 'Неизвестный'}</p>
+    <p>Статус: ${statusText}</p>
+    `;
+    resultsDiv.appendChild(div);
+}
+
 // Обработка формы загрузки изображения для посещаемости
 let lastProcessedResults = null;
 
@@ -663,40 +713,35 @@ document.getElementById('attendance-form').addEventListener('submit', function(e
     formData.append('subject_id', subjectId);
     formData.append('date', date);
     formData.append('group_id', groupId);
+    formData.append('mode', 'stream');
+
+    const resultsDiv = document.getElementById('face-results');
+    resultsDiv.innerHTML = '';
+    lastProcessedResults = [];
 
     showLoader('modal-loader');
     fetch(`${API_BASE_URL}/process_image`, {
         method: 'POST',
         body: formData
     })
-    .then(response => response.json())
-    .then(data => {
-        const resultsDiv = document.getElementById('face-results');
-        resultsDiv.innerHTML = '';
-        if (data.error) {
-            resultsDiv.innerHTML = `<p>Ошибка: ${data.error}</p>`;
-        } else {
-            lastProcessedResults = data.results;
-            data.results.forEach(result => {
-                const div = document.createElement('div');
-                div.className = 'face-result';
-                let statusText = '';
-                if (result.status === 'present') {
-                    statusText = 'Присутствовал';
-                } else if (result.status === 'unknown') {
-                    statusText = 'Неизвестный';
-                } else if (result.status === 'other_group') {
-                    statusText = 'Другая группа';
-                }
-                div.innerHTML = `
-                <img src="${result.face_image_path.replace('/opt/lampp/htdocs/', '/')}" class="face-image">
-                <p>${result.matches.length > 0 ? result.matches[0].full_name : 'Неизвестный'}</p>
-                <p>Статус: ${statusText}</p>
-                `;
-                resultsDiv.appendChild(div);
+    .then(response => {
+        // Ошибки входных данных приходят обычным JSON до начала потока
+        if (!response.ok || !response.body) {
+            return response.json().then(data => {
+                resultsDiv.innerHTML = `<p>Ошибка: ${data.error}</p>`;
             });
-            document.getElementById('confirm-modal-attendance').style.display = 'block';
         }
+        // Лица отрисовываются по мере распознавания
+        return readNdjson(response, message => {
+            if (message.type === 'face') {
+                lastProcessedResults.push(message.result);
+                renderFaceResult(resultsDiv, message.result);
+            } else if (message.type === 'error') {
+                resultsDiv.insertAdjacentHTML('beforeend', `<p>Ошибка: ${message.error}</p>`);
+            } else if (message.type === 'done') {
+                document.getElementById('confirm-modal-attendance').style.display = 'block';
+            }
+        });
     })
     .catch(error => {
         alert('Ошибка обработки изображения: ' + error.message);
@@ -715,26 +760,36 @@ document.getElementById('confirm-modal-attendance').addEventListener('click', fu
         return;
     }
 
-    showLoader('modal-loader');
-    const promises = lastProcessedResults
+    const records = lastProcessedResults
     .filter(result => result.status === 'present' && result.matches.length > 0)
-    .map(result => {
-        return fetch(`${API_BASE_URL}/mark_attendance`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                student_id: result.matches[0].student_id,
-                subject_id: subjectId,
-                attendance_date: date,
-                group_id: groupId,
-                status: 'present'
-            })
-        }).then(response => response.json());
-    });
+    .map(result => ({
+        student_id: result.matches[0].student_id,
+        subject_id: subjectId,
+        attendance_date: date,
+        group_id: groupId,
+        status: 'present'
+    }));
+
+    if (records.length === 0) {
+        alert('Нет распознанных студентов для отметки');
+        return;
+    }
 
-    Promise.all(promises)
-    .then(results => {
-        const errors = results.filter(r => r.status !== 'success').map(r => r.error);
+    // Все распознанные студенты отмечаются одним запросом
+    showLoader('modal-loader');
+    fetch(`${API_BASE_URL}/bulk_mark_attendance`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ records: records })
+    })
+    .then(response => response.json())
+    .then(data => {
+        const errors = (data.results || [])
+        .filter(r => r.status === 'invalid')
+        .map(r => `${records[r.index].student_id}: ${r.error}`);
+        if (data.error && errors.length === 0) {
+            errors.push(data.error);
+        }
         if (errors.length > 0) {
             alert('Ошибки при отметке: ' + errors.join(', '));
         } else {
@@ -119,6 +119,7 @@
                             </thead>
                             <tbody id="students-table-body"></tbody>
                         </table>
+                        <button class="btn btn-primary" id="students-load-more" style="display: none;" onclick="loadStudents(true)">Показать ещё</button>
                     </div>
 
                     <!-- Модальное окно для добавления студента -->
@@ -160,6 +161,15 @@
                     <div class="page-header">
                         <h1 class="page-title">Логи системы</h1>
                     </div>
+                    <div class="filter-controls">
+                        <select id="logs-level-filter">
+                            <option value="">Все уровни</option>
+                            <option value="ERROR">Ошибки</option>
+                            <option value="WARNING,ERROR">Предупреждения и ошибки</option>
+                            <option value="INFO">Информация</option>
+                        </select>
+                        <input type="text" id="logs-search" placeholder="Поиск по сообщению">
+                    </div>
                     <div class="loader" id="logs-loader" style="display: none;"></div>
                     <div class="table-container">
                         <table class="logs-table">
@@ -173,6 +183,7 @@
                             </thead>
                             <tbody id="logs-table-body"></tbody>
                         </table>
+                        <button class="btn btn-primary" id="logs-load-more" style="display: none;" onclick="loadLogs(true)">Показать ещё</button>
                     </div>
                 </div>
             </main>
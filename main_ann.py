@@ -0,0 +1,189 @@
+import numpy as np
+import os
+import logging
+import tempfile
+from typing import List, Tuple
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Число списков IVF-индекса: IVF_LISTS_FACTOR * sqrt(N)
+IVF_LISTS_FACTOR = 4
+# Сколько ближайших списков просматривается на один запрос
+IVF_NPROBE = 8
+IVF_TRAIN_ITERATIONS = 10
+# Размер обучающей выборки k-means на один список
+IVF_TRAIN_SAMPLE_PER_LIST = 64
+# Сколько строк обрабатывается за один шаг при назначении списков
+ASSIGN_BLOCK_ROWS = 65536
+
+
+# Попарные евклидовы расстояния между векторами запроса и векторами базы
+def pairwise_distances(queries: np.ndarray, vectors: np.ndarray, vectors_sq_norms: np.ndarray = None) -> np.ndarray:
+    if vectors_sq_norms is None:
+        vectors_sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+    query_sq_norms = np.einsum('ij,ij->i', queries, queries)
+    # |a - b|^2 = |a|^2 + |b|^2 - 2ab, одно матричное умножение вместо цикла по строкам
+    squared = query_sq_norms[:, None] + vectors_sq_norms[None, :] - 2.0 * (queries @ vectors.T)
+    np.maximum(squared, 0.0, out=squared)
+    return np.sqrt(squared, out=squared)
+
+
+# Номер ближайшего центроида для каждого вектора
+def nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+        stop = min(start + ASSIGN_BLOCK_ROWS, len(vectors))
+        assignment[start:stop] = pairwise_distances(vectors[start:stop], centroids, centroid_sq_norms).argmin(axis=1)
+    return assignment
+
+
+# Обучение центроидов k-means (алгоритм Ллойда)
+def kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = IVF_TRAIN_ITERATIONS, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = nearest_centroid(vectors, centroids)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Пустые кластеры получают случайный вектор выборки
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+# Приближённый поиск ближайших соседей: инвертированные списки по центроидам k-means (IVF)
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, nprobe: int = IVF_NPROBE):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        dim = self.centroids.shape[1]
+        self._list_ids = [np.empty(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        self._list_vectors = [np.empty((0, dim), dtype=np.float32) for _ in range(len(self.centroids))]
+        self._list_of = {}
+
+    def __len__(self):
+        return len(self._list_of)
+
+    # Обучение центроидов на выборке из базы
+    @classmethod
+    def train(cls, vectors: np.ndarray, seed: int = 0) -> 'IVFIndex':
+        n_lists = max(1, min(len(vectors), int(IVF_LISTS_FACTOR * np.sqrt(len(vectors)))))
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(vectors), n_lists * IVF_TRAIN_SAMPLE_PER_LIST)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = kmeans(sample, n_lists, seed=seed)
+        logger.info(f"Обучен IVF-индекс: {n_lists} списков на выборке из {sample_size} векторов")
+        return cls(centroids)
+
+    # Добавление векторов; уже существующие id заменяются
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        self.remove([face_id for face_id in ids.tolist() if face_id in self._list_of])
+        assignment = nearest_centroid(vectors, self.centroids)
+        for list_no in np.unique(assignment).tolist():
+            mask = assignment == list_no
+            self._list_ids[list_no] = np.concatenate([self._list_ids[list_no], ids[mask]])
+            self._list_vectors[list_no] = np.concatenate([self._list_vectors[list_no], vectors[mask]])
+        self._list_of.update(zip(ids.tolist(), assignment.tolist()))
+
+    def remove(self, ids: List[int]):
+        by_list = {}
+        for face_id in ids:
+            list_no = self._list_of.pop(int(face_id), None)
+            if list_no is not None:
+                by_list.setdefault(list_no, []).append(int(face_id))
+        for list_no, list_ids in by_list.items():
+            keep = ~np.isin(self._list_ids[list_no], list_ids)
+            self._list_ids[list_no] = self._list_ids[list_no][keep]
+            self._list_vectors[list_no] = self._list_vectors[list_no][keep]
+
+    # Поиск соседей в пределах tolerance: для каждого запроса список (id, расстояние) по возрастанию
+    def search(self, queries: np.ndarray, tolerance: float, top_k: int = None) -> List[List[Tuple[int, float]]]:
+        queries = np.asarray(queries, dtype=np.float32)
+        hits = [[] for _ in range(len(queries))]
+        if len(queries) == 0 or len(self) == 0:
+            return hits
+        nprobe = min(self.nprobe, len(self.centroids))
+        centroid_distances = pairwise_distances(queries, self.centroids)
+        probes = np.argpartition(centroid_distances, nprobe - 1, axis=1)[:, :nprobe]
+        # Запросы группируются по спискам, чтобы каждый список сканировался одним матричным умножением
+        for list_no in np.unique(probes).tolist():
+            list_ids = self._list_ids[list_no]
+            if len(list_ids) == 0:
+                continue
+            query_idx = np.flatnonzero((probes == list_no).any(axis=1))
+            distances = pairwise_distances(queries[query_idx], self._list_vectors[list_no])
+            qi, vi = np.nonzero(distances <= tolerance)
+            for a, b in zip(qi.tolist(), vi.tolist()):
+                hits[query_idx[a]].append((int(list_ids[b]), float(distances[a, b])))
+        for i, query_hits in enumerate(hits):
+            query_hits.sort(key=lambda hit: hit[1])
+            if top_k is not None:
+                hits[i] = query_hits[:top_k]
+        return hits
+
+    # Все id и векторы индекса (копия, пригодная для сохранения вне блокировки)
+    def export(self) -> dict:
+        lengths = [len(list_ids) for list_ids in self._list_ids]
+        return {
+            'centroids': self.centroids.copy(),
+            'nprobe': np.int64(self.nprobe),
+            'ids': np.concatenate(self._list_ids),
+            'vectors': np.concatenate(self._list_vectors),
+            'lists': np.repeat(np.arange(len(self._list_ids), dtype=np.int64), lengths)
+        }
+
+    # Сохранение индекса на диск (атомарная замена файла). Временный файл уникален для каждого сохранения,
+    # поэтому параллельные сохранения, в том числе из разных процессов, не пишут в один и тот же файл
+    @staticmethod
+    def save_exported(data: dict, path: str):
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logger.info(f"IVF-индекс сохранён: {path}, {len(data['ids'])} векторов")
+
+    def save(self, path: str):
+        self.save_exported(self.export(), path)
+
+    @classmethod
+    def load(cls, path: str) -> 'IVFIndex':
+        with np.load(path) as data:
+            index = cls(data['centroids'], int(data['nprobe']))
+            ids, vectors, lists = data['ids'], data['vectors'], data['lists']
+        order = np.argsort(lists, kind='stable')
+        ids, vectors, lists = ids[order], vectors[order], lists[order]
+        bounds = np.searchsorted(lists, np.arange(len(index.centroids) + 1))
+        for list_no in range(len(index.centroids)):
+            index._list_ids[list_no] = ids[bounds[list_no]:bounds[list_no + 1]]
+            index._list_vectors[list_no] = vectors[bounds[list_no]:bounds[list_no + 1]]
+        index._list_of = dict(zip(ids.tolist(), lists.tolist()))
+        logger.info(f"IVF-индекс загружен: {path}, {len(index)} векторов")
+        return index
+
+
+# Полнота приближённого поиска относительно точного перебора
+def measure_recall(approximate: List[List[Tuple[int, float]]], exact: List[List[Tuple[int, float]]]) -> float:
+    found = 0
+    total = 0
+    for approximate_hits, exact_hits in zip(approximate, exact):
+        expected = set(face_id for face_id, _ in exact_hits)
+        total += len(expected)
+        found += len(expected & set(face_id for face_id, _ in approximate_hits))
+    return found / total if total else 1.0
@@ -1,20 +1,29 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import face_recognition
 import psycopg2
-import numpy as np
 import os
 import logging
 from logging.handlers import RotatingFileHandler
 from typing import List
-from PIL import Image
-from datetime import datetime
-import threading
-import time
-import asyncio
-import uuid
+import io
 import json
-from main_encoding import extract_face_encodings, save_face_encodings, process_single_image, has_student_photo, delete_student_photos
+from datetime import date
+from main_encoding import extract_face_encodings, save_face_encodings, process_single_image, has_student_photo, delete_student_photos, delete_student_faces, remove_student_files, check_image_id_exists, content_image_id, refresh_student_templates
+from main_gallery import get_gallery, GALLERY_CHANGES_RETENTION_HOURS, GALLERY_MATCH_MODES
+from main_db import get_db_connection, get_pool
+from main_workers import get_encoding_engine, ENCODING_BATCH_SIZE
+from main_face_cache import get_face_cache, content_hash, cache_key
+from main_detection import detect_faces, DETECTION_MODE, DETECTION_MODES
+from main_jobs import get_job_queue, QueueFullError
+from main_attendance import upsert_attendance, mark_recognized
+from main_pagination import parse_page, parse_fields, encode_cursor, PaginationError
+from main_reports import attendance_report, REPORT_GROUPINGS
+from main_response_cache import cached_response, get_response_cache
+from main_metrics import get_metrics, StageTimer
+from main_cleanup import start_orphan_sweep
+from main_crops import get_crop_store, THUMBNAIL_FORMATS, THUMBNAIL_SIZE, THUMBNAIL_MAX_SIZE, CROP_IMAGE_TTL
+from main_logs import LogQuery, parse_log_time, LOG_LEVELS, LOG_DEFAULT_LIMIT, LOG_MAX_LIMIT
 from psycopg2.extras import Json
 
 # Настройка логирования
@@ -68,10 +77,24 @@ def init_db():
             CREATE TABLE IF NOT EXISTS faces (
                 face_id SERIAL PRIMARY KEY,
                 student_id INTEGER REFERENCES students(student_id),
-                face_encoding JSONB NOT NULL,
+                face_encoding JSONB,
+                face_encoding_bin BYTEA,
                 image_id TEXT NOT NULL
             );
         """)
+        # Для баз со старой схемой: бинарный столбец и необязательный JSONB на период двойного чтения
+        cursor.execute("ALTER TABLE faces ADD COLUMN IF NOT EXISTS face_encoding_bin BYTEA")
+        cursor.execute("""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT FROM information_schema.columns
+                    WHERE table_name = 'faces' AND column_name = 'face_encoding'
+                ) THEN
+                    ALTER TABLE faces ALTER COLUMN face_encoding DROP NOT NULL;
+                END IF;
+            END $$;
+        """)
         logger.info("Таблица faces проверена/создана")
 
         cursor.execute("""
@@ -88,25 +111,150 @@ def init_db():
         """)
         logger.info("Таблица attendance проверена/создана")
 
-        # Создание GIN-индекса для face_encoding
+        # Индексы для постраничной выдачи по (full_name, student_id), проверки наличия фото и поиска по image_id
+        cursor.execute("CREATE INDEX IF NOT EXISTS students_name_idx ON students (full_name, student_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS students_group_name_idx ON students (group_id, full_name, student_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS faces_student_id_idx ON faces (student_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS faces_image_id_idx ON faces (image_id)")
+        logger.info("Индексы students и faces проверены/созданы")
+
+        # Шаблоны студентов (среднее эмбеддингов и радиус) для сопоставления по одному вектору на студента.
+        # Пересчитываются в транзакциях, изменяющих faces; при запуске рассчитываются для студентов с фотографиями,
+        # у которых шаблона нет (новая или очищенная таблица)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS face_templates (
+                student_id INTEGER PRIMARY KEY REFERENCES students(student_id) ON DELETE CASCADE,
+                template_bin BYTEA NOT NULL,
+                radius REAL NOT NULL,
+                encodings_count INTEGER NOT NULL,
+                inliers_count INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cursor.execute("""
+            SELECT DISTINCT f.student_id
+            FROM faces f
+            LEFT JOIN face_templates t ON t.student_id = f.student_id
+            WHERE f.student_id IS NOT NULL AND t.student_id IS NULL
+        """)
+        missing_templates = [row[0] for row in cursor.fetchall()]
+        if missing_templates:
+            refreshed = refresh_student_templates(cursor, missing_templates)
+            logger.info(f"Рассчитано недостающих шаблонов студентов: {refreshed}")
+        logger.info("Таблица face_templates проверена/создана")
+
+        # Помесячная сводка посещаемости для отчётов, поддерживается триггером на attendance
+        cursor.execute("SELECT to_regclass('attendance_monthly_summary') IS NULL")
+        summary_created = cursor.fetchone()[0]
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS attendance_monthly_summary (
+                student_id INTEGER NOT NULL,
+                subject_id INTEGER NOT NULL,
+                group_id INTEGER NOT NULL,
+                month DATE NOT NULL,
+                present INTEGER NOT NULL DEFAULT 0,
+                absent INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (student_id, subject_id, group_id, month)
+            );
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS attendance_summary_group_month_idx ON attendance_monthly_summary (group_id, month)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS attendance_summary_subject_month_idx ON attendance_monthly_summary (subject_id, month)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS attendance_date_idx ON attendance (attendance_date)")
+        # Старая строка вычитается из сводки, новая прибавляется; upsert со сменой статуса срабатывает как UPDATE
         cursor.execute("""
-            DO $$ 
+            CREATE OR REPLACE FUNCTION attendance_summary_apply() RETURNS trigger AS $$
             BEGIN
-                IF NOT EXISTS (
-                    SELECT FROM pg_indexes 
-                    WHERE schemaname = 'public' 
-                    AND tablename = 'faces' 
-                    AND indexname = 'faces_encoding_gin'
-                ) THEN
-                    CREATE INDEX faces_encoding_gin 
-                    ON faces 
-                    USING GIN (face_encoding);
-                    COMMENT ON INDEX faces_encoding_gin 
-                    IS 'GIN-индекс для ускорения поиска по эмбеддингам лиц в столбце face_encoding (JSONB)';
+                IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.student_id IS NOT NULL AND OLD.subject_id IS NOT NULL AND OLD.group_id IS NOT NULL THEN
+                    UPDATE attendance_monthly_summary
+                    SET present = present - (OLD.status = 'present')::int,
+                        absent = absent - (OLD.status = 'absent')::int
+                    WHERE student_id = OLD.student_id AND subject_id = OLD.subject_id AND group_id = OLD.group_id
+                        AND month = date_trunc('month', OLD.attendance_date)::date;
                 END IF;
-            END $$;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.student_id IS NOT NULL AND NEW.subject_id IS NOT NULL AND NEW.group_id IS NOT NULL THEN
+                    INSERT INTO attendance_monthly_summary (student_id, subject_id, group_id, month, present, absent)
+                    VALUES (NEW.student_id, NEW.subject_id, NEW.group_id, date_trunc('month', NEW.attendance_date)::date,
+                            (NEW.status = 'present')::int, (NEW.status = 'absent')::int)
+                    ON CONFLICT (student_id, subject_id, group_id, month) DO UPDATE
+                    SET present = attendance_monthly_summary.present + EXCLUDED.present,
+                        absent = attendance_monthly_summary.absent + EXCLUDED.absent;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cursor.execute("""
+            DROP TRIGGER IF EXISTS attendance_summary_trigger ON attendance;
+            CREATE TRIGGER attendance_summary_trigger
+            AFTER INSERT OR UPDATE OR DELETE ON attendance
+            FOR EACH ROW EXECUTE FUNCTION attendance_summary_apply();
+        """)
+        if summary_created:
+            # Первичное заполнение сводки из уже накопленной посещаемости
+            cursor.execute("""
+                INSERT INTO attendance_monthly_summary (student_id, subject_id, group_id, month, present, absent)
+                SELECT student_id, subject_id, group_id, date_trunc('month', attendance_date)::date,
+                       COUNT(*) FILTER (WHERE status = 'present'), COUNT(*) FILTER (WHERE status = 'absent')
+                FROM attendance
+                WHERE student_id IS NOT NULL AND subject_id IS NOT NULL AND group_id IS NOT NULL
+                GROUP BY student_id, subject_id, group_id, date_trunc('month', attendance_date)
+            """)
+        logger.info("Сводка attendance_monthly_summary и триггер проверены/созданы")
+
+        # GIN-индекс по JSONB не помогает поиску похожих лиц и только замедляет запись
+        cursor.execute("DROP INDEX IF EXISTS faces_encoding_gin")
+        logger.info("GIN-индекс faces_encoding_gin удалён")
+
+        # Журнал изменений faces для инкрементального обновления галереи лиц в API-процессах
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS faces_changes (
+                change_id BIGSERIAL PRIMARY KEY,
+                face_id INTEGER NOT NULL,
+                operation CHAR(1) NOT NULL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION faces_log_change() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    INSERT INTO faces_changes (face_id, operation) VALUES (OLD.face_id, 'D');
+                    RETURN OLD;
+                END IF;
+                INSERT INTO faces_changes (face_id, operation) VALUES (NEW.face_id, LEFT(TG_OP, 1));
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cursor.execute("""
+            DROP TRIGGER IF EXISTS faces_changes_trigger ON faces;
+            CREATE TRIGGER faces_changes_trigger
+            AFTER INSERT OR UPDATE OR DELETE ON faces
+            FOR EACH ROW EXECUTE FUNCTION faces_log_change();
         """)
-        logger.info("GIN-индекс faces_encoding_gin проверен/создан")
+        # Смена ФИО или группы студента меняет метаданные всех его строк в галерее
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION students_log_faces_change() RETURNS trigger AS $$
+            BEGIN
+                IF NEW.full_name IS DISTINCT FROM OLD.full_name OR NEW.group_id IS DISTINCT FROM OLD.group_id THEN
+                    INSERT INTO faces_changes (face_id, operation)
+                    SELECT face_id, 'U' FROM faces WHERE student_id = NEW.student_id;
+                END IF;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cursor.execute("""
+            DROP TRIGGER IF EXISTS students_faces_changes_trigger ON students;
+            CREATE TRIGGER students_faces_changes_trigger
+            AFTER UPDATE ON students
+            FOR EACH ROW EXECUTE FUNCTION students_log_faces_change();
+        """)
+        cursor.execute(
+            "DELETE FROM faces_changes WHERE changed_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'",
+            (GALLERY_CHANGES_RETENTION_HOURS,)
+        )
+        logger.info("Журнал faces_changes и триггеры проверены/созданы")
 
         conn.commit()
         logger.info("Инициализация базы данных завершена")
@@ -118,70 +266,9 @@ def init_db():
         if conn:
             conn.close()
 
-# Подключение к PostgreSQL с настройкой JSONB
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(
-            dbname="attendance",
-            user="dmitry",
-            password="dmitry",
-            host="localhost",
-            port="5432"
-        )
-        # Отключение автоматической десериализации JSONB
-        psycopg2.extras.register_default_jsonb(conn, globally=False, loads=lambda x: x)
-        return conn
-    except psycopg2.Error as e:
-        logger.error(f"Ошибка подключения к БД: {e}")
-        raise ValueError(f"Не удалось подключиться к базе данных: {str(e)}")
-
-# Функция для сохранения обрезанных лиц
-def save_cropped_faces(image_path: str, locations: List[tuple], filename: str) -> List[str]:
-    faces_dir = "/opt/lampp/htdocs/faces"
-    os.makedirs(faces_dir, exist_ok=True)
-    face_paths = []
-    try:
-        image = Image.open(image_path)
-        for i, (top, right, bottom, left) in enumerate(locations):
-            face_image = image.crop((left, top, right, bottom))
-            face_id = str(uuid.uuid4())
-            face_path = os.path.join(faces_dir, f"{face_id}.png")
-            face_image.save(face_path)
-            face_paths.append(face_path)
-            logger.info(f"Сохранено обрезанное лицо: {face_path}")
-        return face_paths
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении обрезанных лиц: {e}")
-        return []
-
-# Функция для отложенного удаления файлов
-def delayed_delete(file_paths, delay_seconds):
-    logger.info(f"Запуск отложенного удаления для {file_paths} через {delay_seconds} секунд")
-    try:
-        time.sleep(delay_seconds)
-        for file_path in file_paths:
-            if os.path.exists(file_path):
-                logger.info(f"Попытка удаления файла: {file_path}")
-                os.remove(file_path)
-                logger.info(f"Файл {file_path} удалён после задержки")
-            else:
-                logger.warning(f"Файл не найден: {file_path}")
-    except Exception as e:
-        logger.error(f"Ошибка при отложенном удалении файлов: {e}")
-
-# Асинхронная обработка пакета лиц
-async def process_encoding_batch(image_path: str, batch_locations: List[tuple], batch_index: int) -> List[np.ndarray]:
-    try:
-        image = face_recognition.load_image_file(image_path)
-        encodings = face_recognition.face_encodings(image, known_face_locations=batch_locations)
-        logger.info(f"Обработан пакет {batch_index}: найдено {len(encodings)} лиц")
-        return encodings
-    except Exception as e:
-        logger.error(f"Ошибка обработки пакета {batch_index}: {e}")
-        return []
-
 # Маршрут для получения списка групп
 @app.route('/groups', methods=['GET'])
+@cached_response('groups')
 def get_groups():
     try:
         conn = get_db_connection()
@@ -196,6 +283,7 @@ def get_groups():
 
 # Маршрут для получения списка предметов
 @app.route('/subjects', methods=['GET'])
+@cached_response('subjects')
 def get_subjects():
     try:
         conn = get_db_connection()
@@ -208,37 +296,63 @@ def get_subjects():
         logger.error(f"Ошибка получения предметов: {e}")
         return jsonify({'error': str(e)}), 500
 
-# Маршрут для получения списка студентов
+# Поля ответа /students и выражения SELECT для полей, кроме ключа сортировки (student_id, full_name).
+# Наличие фото - EXISTS по индексу faces(student_id), без размножения строк соединением с faces
+STUDENT_FIELDS = ('student_id', 'full_name', 'group_id', 'group_name', 'has_photo', 'image_id')
+STUDENT_COLUMNS = {
+    'group_id': "s.group_id",
+    'group_name': "g.group_name",
+    'has_photo': "EXISTS (SELECT 1 FROM faces f WHERE f.student_id = s.student_id)",
+    'image_id': "(SELECT f.image_id FROM faces f WHERE f.student_id = s.student_id ORDER BY f.face_id DESC LIMIT 1)"
+}
+# Группа целиком обычно помещается на одну страницу посещаемости
+ATTENDANCE_PAGE_SIZE = 500
+ATTENDANCE_LIST_FIELDS = ('attendance_id', 'student_id', 'full_name', 'group_name', 'date', 'subject_name', 'status')
+
+# Маршрут для получения списка студентов.
+# Постранично по (full_name, student_id): limit, cursor из next_cursor предыдущей страницы, fields - набор полей
 @app.route('/students', methods=['GET'])
+@cached_response('students')
 def get_students():
     group_id = request.args.get('group_id')
     try:
+        limit, after = parse_page(request.args, (str, int))
+        fields = parse_fields(request.args, STUDENT_FIELDS)
+        extra = [field for field in fields if field in STUDENT_COLUMNS]
         conn = get_db_connection()
         cursor = conn.cursor()
-        query = """
-            SELECT s.student_id, s.full_name, g.group_name, f.image_id
+        query = f"""
+            SELECT {', '.join(['s.student_id', 's.full_name'] + [STUDENT_COLUMNS[field] for field in extra])}
             FROM students s
             LEFT JOIN groups g ON s.group_id = g.group_id
-            LEFT JOIN faces f ON s.student_id = f.student_id
         """
+        conditions = []
         params = []
         if group_id:
-            query += " WHERE s.group_id = %s"
+            conditions.append("s.group_id = %s")
             params.append(group_id)
-        query += " ORDER BY s.full_name ASC"
+        if after:
+            conditions.append("(s.full_name, s.student_id) > (%s, %s)")
+            params.extend(after)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # Лишняя строка показывает, есть ли следующая страница
+        query += " ORDER BY s.full_name ASC, s.student_id ASC LIMIT %s"
+        params.append(limit + 1)
         cursor.execute(query, params)
-        students = [
-            {
-                'student_id': row[0],
-                'full_name': row[1],
-                'group_name': row[2] or 'Без группы',
-                'has_photo': bool(row[3]),
-                'image_id': row[3]
-            }
-            for row in cursor.fetchall()
-        ]
+        rows = cursor.fetchall()
         conn.close()
-        return jsonify({'students': students}), 200
+
+        next_cursor = encode_cursor([rows[limit - 1][1], rows[limit - 1][0]]) if len(rows) > limit else None
+        students = []
+        for row in rows[:limit]:
+            student = {'student_id': row[0], 'full_name': row[1], **dict(zip(extra, row[2:]))}
+            if 'group_name' in student:
+                student['group_name'] = student['group_name'] or 'Без группы'
+            students.append({field: student[field] for field in fields})
+        return jsonify({'students': students, 'next_cursor': next_cursor}), 200
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Ошибка получения студентов: {e}")
         return jsonify({'error': str(e)}), 500
@@ -263,6 +377,7 @@ def add_student():
         student_id = cursor.fetchone()[0]
         conn.commit()
         conn.close()
+        get_response_cache().invalidate('students')
         return jsonify({'student_id': student_id, 'status': 'success'}), 201
     except psycopg2.Error as e:
         logger.error(f"Ошибка добавления студента: {e}")
@@ -277,13 +392,17 @@ def delete_student(student_id):
 
         # Удаление связанных записей в attendance
         cursor.execute("DELETE FROM attendance WHERE student_id = %s", (student_id,))
-        # Удаление связанных записей в faces и файлов в Uploads
-        delete_student_photos(student_id)
+        # Удаление связанных записей в faces в той же транзакции (одно соединение пула на запрос)
+        image_ids = delete_student_faces(cursor, student_id)
         # Удаление студента
         cursor.execute("DELETE FROM students WHERE student_id = %s", (student_id,))
 
         conn.commit()
         conn.close()
+        # Файлы в Uploads удаляются после фиксации: при откате строки faces остаются со своими файлами
+        remove_student_files(image_ids)
+        get_gallery().request_sync()
+        get_response_cache().invalidate('students')
         return jsonify({'status': 'success'}), 200
     except psycopg2.Error as e:
         logger.error(f"Ошибка удаления студента student_id {student_id}: {e}")
@@ -301,17 +420,23 @@ def upload_student_photo():
 
     file = request.files['image']
     student_id = request.form['student_id']
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    image_id = f"{timestamp}_{os.path.splitext(file.filename)[0]}"
     uploads_dir = "uploads"
     os.makedirs(uploads_dir, exist_ok=True)
-    image_path = os.path.join(uploads_dir, f"{image_id}.png")
 
     try:
-        file.save(image_path)
+        # image_id по хэшу содержимого: повторная загрузка той же фотографии не создаёт дубликатов
+        data = file.read()
+        image_id = content_image_id(int(student_id), content_hash(data))
+        image_path = os.path.join(uploads_dir, f"{image_id}.png")
+        if check_image_id_exists(image_id):
+            logger.info(f"Фотография уже загружена: image_id={image_id}")
+            return jsonify({'status': 'success', 'image_id': image_id, 'duplicate': True}), 200
+
+        with open(image_path, 'wb') as f:
+            f.write(data)
         logger.info(f"Сохранено изображение студента: {image_path}")
 
-        # Проверка количества лиц
+        # Проверка количества лиц (результат кэшируется, process_single_image не считает эмбеддинги заново)
         encodings = extract_face_encodings(image_path)
         if len(encodings) == 0:
             logger.warning(f"Лицо не найдено в изображении: {image_path}")
@@ -323,6 +448,8 @@ def upload_student_photo():
         # Обработка изображения
         success = process_single_image(image_path, int(student_id), image_id)
         if success:
+            get_gallery().request_sync()
+            get_response_cache().invalidate('students')
             return jsonify({'status': 'success', 'image_id': image_id}), 200
         else:
             logger.error(f"Не удалось обработать изображение: {image_path}")
@@ -337,6 +464,8 @@ def delete_student_photo(student_id):
     try:
         success = delete_student_photos(student_id)
         if success:
+            get_gallery().request_sync()
+            get_response_cache().invalidate('students')
             return jsonify({'status': 'success'}), 200
         else:
             return jsonify({'error': 'Не удалось удалить фото'}), 400
@@ -344,7 +473,7 @@ def delete_student_photo(student_id):
         logger.error(f"Ошибка удаления фото для student_id {student_id}: {e}")
         return jsonify({'error': str(e)}), 500
 
-# Маршрут для получения записей посещаемости
+# Маршрут для получения записей посещаемости (постранично, как /students)
 @app.route('/attendance', methods=['GET'])
 def get_attendance():
     group_id = request.args.get('group_id')
@@ -356,6 +485,8 @@ def get_attendance():
         return jsonify({'error': 'Отсутствуют обязательные параметры'}), 400
 
     try:
+        limit, after = parse_page(request.args, (str, int), default_limit=ATTENDANCE_PAGE_SIZE)
+        fields = parse_fields(request.args, ATTENDANCE_LIST_FIELDS)
         conn = get_db_connection()
         cursor = conn.cursor()
         query = """
@@ -367,12 +498,21 @@ def get_attendance():
             LEFT JOIN groups g ON s.group_id = g.group_id
             CROSS JOIN (SELECT subject_name FROM subjects WHERE subject_id = %s) sub
             WHERE s.group_id = %s
-            ORDER BY s.full_name
         """
         params = [subject_id, date, group_id, subject_id, group_id]
+        if after:
+            query += " AND (s.full_name, s.student_id) > (%s, %s)"
+            params.extend(after)
+        query += " ORDER BY s.full_name, s.student_id LIMIT %s"
+        params.append(limit + 1)
         cursor.execute(query, params)
-        attendance = [
-            {
+        rows = cursor.fetchall()
+        conn.close()
+
+        next_cursor = encode_cursor([rows[limit - 1][2], rows[limit - 1][1]]) if len(rows) > limit else None
+        attendance = []
+        for row in rows[:limit]:
+            record = {
                 'attendance_id': row[0],
                 'student_id': row[1],
                 'full_name': row[2],
@@ -381,10 +521,10 @@ def get_attendance():
                 'subject_name': row[5],
                 'status': row[6] or 'absent'
             }
-            for row in cursor.fetchall()
-        ]
-        conn.close()
-        return jsonify({'attendance': attendance}), 200
+            attendance.append({field: record[field] for field in fields})
+        return jsonify({'attendance': attendance, 'next_cursor': next_cursor}), 200
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Ошибка получения посещаемости: {e}")
         return jsonify({'error': str(e)}), 500
@@ -407,25 +547,219 @@ def update_or_create_attendance():
         return jsonify({'error': 'Недопустимый статус'}), 400
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO attendance (student_id, subject_id, group_id, attendance_date, status)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (student_id, subject_id, group_id, attendance_date)
-            DO UPDATE SET status = EXCLUDED.status
-            RETURNING attendance_id
-        """, (student_id, subject_id, group_id, attendance_date, status))
-        attendance_id = cursor.fetchone()[0]
-        conn.commit()
-        conn.close()
+        outcome = upsert_attendance([data])[0]
+        if outcome['status'] == 'invalid':
+            return jsonify({'error': outcome['error']}), 400
+        attendance_id = outcome['attendance_id']
         logger.info(f"Обновлена/создана посещаемость: student_id={student_id}, date={attendance_date}, status={status}, attendance_id={attendance_id}")
         return jsonify({'status': 'success', 'attendance_id': attendance_id}), 200
     except Exception as e:
         logger.error(f"Ошибка обновления/создания посещаемости: {e}")
         return jsonify({'error': str(e)}), 500
 
-# Маршрут для обработки изображения посещаемости
+# Ошибка входных данных распознавания (ответ 400)
+class RecognitionError(ValueError):
+    pass
+
+
+# Разбор параметров распознавания из формы запроса
+def parse_recognition_options(form) -> dict:
+    detection_mode = form.get('detection_mode', DETECTION_MODE)
+    try:
+        detection_scale = float(form['detection_scale']) if form.get('detection_scale') else None
+    except ValueError:
+        raise RecognitionError('Недопустимый масштаб обнаружения')
+    if detection_mode not in DETECTION_MODES or (detection_scale is not None and not 0 < detection_scale <= 1):
+        logger.error(f"Недопустимые параметры обнаружения: {detection_mode}, {detection_scale}")
+        raise RecognitionError('Недопустимые параметры обнаружения')
+    match_mode = form.get('match_mode') or None
+    if match_mode is not None and match_mode not in GALLERY_MATCH_MODES:
+        logger.error(f"Недопустимый режим сопоставления: {match_mode}")
+        raise RecognitionError('Недопустимый режим сопоставления')
+    return {
+        'match_scope': form.get('match_scope', 'group'),
+        'match_mode': match_mode,
+        'detection_mode': detection_mode,
+        'detection_scale': detection_scale
+    }
+
+
+# Распознавание лиц на изображении: обнаружение, эмбеддинги, обрезка и сопоставление с галереей.
+# Результат по каждому лицу отдаётся сразу после сопоставления его пакета; timer собирает длительности этапов
+def iter_recognition(image_data, group_id: str, match_scope: str = 'group', detection_mode: str = DETECTION_MODE,
+                     detection_scale: float = None, match_mode: str = None, progress=None, timer: StageTimer = None):
+    def report(stage, **info):
+        if progress:
+            progress(stage, **info)
+
+    if timer is None:
+        timer = StageTimer('recognition')
+
+    # Изображение декодируется один раз и в памяти используется для обнаружения, эмбеддингов и обрезки лиц
+    report('decoding')
+    with timer.stage('decode'):
+        data = image_data.read()
+        image = face_recognition.load_image_file(io.BytesIO(data))
+    logger.info(f"Загружено изображение: {image.shape[1]}x{image.shape[0]}")
+
+    # Повторно загруженное изображение берётся из кэша без обнаружения и расчёта эмбеддингов
+    with timer.stage('cache_lookup'):
+        key = cache_key(content_hash(data), detection_mode, detection_scale)
+        cached = get_face_cache().get(key)
+    if cached is not None:
+        locations, cached_encodings = cached
+        logger.info(f"Результат обнаружения взят из кэша: {len(locations)} лиц")
+    else:
+        # Обнаружение лиц (рамки в координатах исходного изображения при любом режиме)
+        report('detection')
+        with timer.stage('detection'):
+            locations = detect_faces(image, mode=detection_mode, scale=detection_scale)
+    timer.set(faces=len(locations), cached=cached is not None)
+    if len(locations) > 500:
+        logger.warning(f"Обнаружено {len(locations)} лиц, превышен лимит 500")
+        raise RecognitionError('Слишком много лиц в изображении (максимум 500)')
+
+    if not locations:
+        logger.warning("Лица не найдены в изображении")
+        raise RecognitionError('Лица не найдены на изображении')
+
+    report('encoding', faces=len(locations), processed=0)
+    scope_group_id = int(group_id) if match_scope == 'group' and group_id.isdigit() else None
+    # Миниатюры лиц не сохраняются: исходный файл и рамки хранятся под ключом кэша лиц,
+    # а обрезка и сжатие выполняются при запросе /faces/<image_key>/<index> в любом процессе API
+    image_key = key
+    get_crop_store().put(image_key, data, image, locations)
+    all_encodings = []
+    processed = 0
+    if cached is not None:
+        batches = (
+            (locations[i:i + ENCODING_BATCH_SIZE], cached_encodings[i:i + ENCODING_BATCH_SIZE])
+            for i in range(0, len(locations), ENCODING_BATCH_SIZE)
+        )
+    else:
+        # Пакетная обработка лиц параллельно в пуле процессов
+        batches = get_encoding_engine().iter_encode(image, locations)
+
+    # Обновление галереи из БД замеряется отдельно от сопоставления
+    with timer.stage('gallery_sync'):
+        get_gallery().ensure_fresh()
+    timer.set(gallery_size=len(get_gallery()))
+
+    while True:
+        # Ожидание очередного пакета эмбеддингов; время потребителя между пакетами не учитывается
+        with timer.stage('encoding'):
+            batch = next(batches, None)
+        if batch is None:
+            break
+        batch_locations, encodings = batch
+        all_encodings.extend(encodings)
+
+        # Сопоставление с галереей лиц: сначала среди студентов группы, затем по всей базе
+        with timer.stage('match'):
+            face_matches = get_gallery().match(encodings, tolerance=0.5, group_id=scope_group_id, mode=match_mode)
+
+        for i, matches in enumerate(face_matches):
+            index = processed + i
+            face_result = {
+                'face_id': f"{image_key}_{index}",
+                'face_image_url': f"/faces/{image_key}/{index}",
+                'status': 'unknown',
+                'matches': [
+                    {'student_id': m['student_id'], 'full_name': m['full_name'], 'group_id': m['group_id'],
+                     'distance': m['distance']}
+                    for m in matches
+                ]
+            }
+            if matches:
+                in_group = any(str(m['group_id']) == group_id for m in matches)
+                face_result['status'] = 'present' if in_group else 'other_group'
+            yield face_result
+
+        processed += len(batch_locations)
+        report('encoding', faces=len(locations), processed=processed)
+
+    if cached is None:
+        with timer.stage('cache_store'):
+            get_face_cache().put(key, locations, all_encodings)
+
+    report('done', faces=processed)
+
+
+def recognize_image(image_data, group_id: str, progress=None, **options) -> List[dict]:
+    return list(iter_recognition(image_data, group_id, progress=progress, **options))
+
+
+# Разбор параметров отметки посещаемости по результатам распознавания:
+# commit_attendance=1 записывает присутствие, dry_run=1 только показывает, что было бы записано
+def parse_attendance_options(form):
+    dry_run = form.get('dry_run', '').lower() in ('1', 'true')
+    if not dry_run and form.get('commit_attendance', '').lower() not in ('1', 'true'):
+        return None
+    try:
+        return {
+            'subject_id': int(form['subject_id']),
+            'group_id': int(form['group_id']),
+            'attendance_date': date.fromisoformat(form['date']),
+            'dry_run': dry_run
+        }
+    except ValueError:
+        raise RecognitionError('Недопустимые параметры посещаемости')
+
+
+# Распознавание с необязательной отметкой посещаемости; результат - поля ответа.
+# Длительности этапов всегда попадают в /metrics, а при timings=True - и в ответ
+def process_recognition(image_data, group_id: str, progress=None, attendance: dict = None,
+                        timings: bool = False, **options) -> dict:
+    timer = StageTimer('recognition')
+    try:
+        results = recognize_image(image_data, group_id, progress=progress, timer=timer, **options)
+        response = {'results': results}
+        if attendance is not None:
+            if progress:
+                progress('attendance', faces=len(results))
+            with timer.stage('attendance'):
+                response['attendance'] = mark_recognized(results, **attendance)
+    finally:
+        timer.finish()
+    if timings:
+        response['timings'] = timer.to_dict()
+    return response
+
+
+# Потоковая выдача результатов распознавания в формате NDJSON: строка на каждое лицо, затем итоговая строка
+# attendance - параметры отметки посещаемости, её итог добавляется в итоговую строку (как и timings)
+def stream_recognition(faces, first_result, attendance: dict = None, timer: StageTimer = None,
+                       timings: bool = False) -> Response:
+    def generate():
+        results = []
+        try:
+            if first_result is not None:
+                results.append(first_result)
+                yield json.dumps({'type': 'face', 'result': first_result}, ensure_ascii=False) + "\n"
+            for face_result in faces:
+                results.append(face_result)
+                yield json.dumps({'type': 'face', 'result': face_result}, ensure_ascii=False) + "\n"
+            done = {'type': 'done', 'faces': len(results)}
+            if attendance is not None:
+                with timer.stage('attendance'):
+                    done['attendance'] = mark_recognized(results, **attendance)
+            timer.finish()
+            if timings:
+                done['timings'] = timer.to_dict()
+            yield json.dumps(done, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"Ошибка потоковой обработки изображения: {e}")
+            yield json.dumps({'type': 'error', 'error': str(e)}, ensure_ascii=False) + "\n"
+        finally:
+            timer.finish()
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+# Маршрут для обработки изображения посещаемости.
+# mode=job ставит обработку в очередь и сразу возвращает job_id для опроса /jobs/<job_id>,
+# mode=stream отдаёт результаты по лицам в формате NDJSON по мере готовности.
+# commit_attendance=1 сразу отмечает присутствие распознанных студентов группы, dry_run=1 - предпросмотр отметки,
+# timings=1 добавляет в ответ длительности этапов обработки
 @app.route('/process_image', methods=['POST'])
 def process_image():
     if 'image' not in request.files or 'subject_id' not in request.form or 'date' not in request.form or 'group_id' not in request.form:
@@ -437,94 +771,70 @@ def process_image():
     group_id = request.form['group_id']
     file = request.files['image']
 
-    recognition_dir = "recognition"
-    os.makedirs(recognition_dir, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    image_path = os.path.join(recognition_dir, f"{timestamp}_{file.filename}")
-
     try:
-        file.save(image_path)
-        logger.info(f"Сохранено изображение: {image_path}")
-
-        # Обнаружение лиц
-        locations = face_recognition.face_locations(face_recognition.load_image_file(image_path))
-        if len(locations) > 500:
-            logger.warning(f"Обнаружено {len(locations)} лиц, превышен лимит 500")
-            os.remove(image_path)
-            return jsonify({'error': 'Слишком много лиц в изображении (максимум 500)'}), 400
-
-        if not locations:
-            logger.warning(f"Лица не найдены в изображении: {image_path}")
-            os.remove(image_path)
-            return jsonify({'error': 'Лица не найдены на изображении'}), 400
-
-        # Пакетная обработка лиц
-        batch_size = 50
-        encodings = []
-        for i in range(0, len(locations), batch_size):
-            batch_locations = locations[i:i + batch_size]
-            batch_encodings = asyncio.run(process_encoding_batch(image_path, batch_locations, i // batch_size))
-            encodings.extend(batch_encodings)
-
-        # Сохранение обрезанных лиц
-        face_paths = save_cropped_faces(image_path, locations, f"{timestamp}_{file.filename}")
-
-        # Подключение к БД
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT f.face_id, f.face_encoding, s.student_id, s.full_name, s.group_id
-            FROM faces f
-            JOIN students s ON f.student_id = s.student_id
-        """)
-        rows = cursor.fetchall()
-
-        results = []
-        for i, encoding in enumerate(encodings):
-            face_id = os.path.splitext(os.path.basename(face_paths[i]))[0] if i < len(face_paths) else str(uuid.uuid4())
-            face_result = {
-                'face_id': face_id,
-                'face_image_path': face_paths[i] if i < len(face_paths) else None,
-                'status': 'unknown',
-                'matches': []
-            }
-            for row in rows:
-                try:
-                    encoding_data = row[1]
-                    # Ожидаем строку JSON
-                    db_encoding = np.array(json.loads(encoding_data))
-                    match = face_recognition.compare_faces([db_encoding], encoding, tolerance=0.5)[0]
-                    if match:
-                        student_group_id = row[4]
-                        distance = float(face_recognition.face_distance([db_encoding], encoding)[0])
-                        face_result['matches'].append({
-                            'student_id': row[2],
-                            'full_name': row[3],
-                            'distance': distance
-                        })
-                        if str(student_group_id) == group_id:
-                            face_result['status'] = 'present'
-                        else:
-                            face_result['status'] = 'other_group'
-                except Exception as e:
-                    logger.error(f"Ошибка обработки face_encoding для face_id {row[0]}: {e}")
-                    continue
-            results.append(face_result)
-
-        conn.close()
-
-        # Запуск отложенного удаления для изображения и миниатюр
-        all_paths = [image_path] + face_paths
-        logger.info(f"Запуск отложенного удаления для путей: {all_paths}")
-        threading.Thread(target=delayed_delete, args=(all_paths, 60)).start()
+        options = parse_recognition_options(request.form)
+        attendance = parse_attendance_options(request.form)
+        timings = request.form.get('timings', '').lower() in ('1', 'true')
+        if request.form.get('mode') == 'job':
+            job = get_job_queue().submit(process_recognition, io.BytesIO(file.read()), group_id,
+                                         attendance=attendance, timings=timings, **options)
+            logger.info(f"Изображение {file.filename} поставлено в очередь, job_id={job.job_id}")
+            return jsonify({'job_id': job.job_id, 'status': job.status, 'status_url': f"/jobs/{job.job_id}"}), 202
+
+        logger.info(f"Обработка изображения {file.filename}")
+        if request.form.get('mode') == 'stream':
+            timer = StageTimer('recognition')
+            faces = iter_recognition(file.stream, group_id, timer=timer, **options)
+            # Первое лицо вычисляется до ответа, чтобы ошибки входных данных вернулись обычным статусом 400
+            try:
+                first_result = next(faces, None)
+            except Exception:
+                timer.finish()
+                raise
+            return stream_recognition(faces, first_result, attendance, timer, timings)
+
+        return jsonify(process_recognition(file.stream, group_id, attendance=attendance, timings=timings, **options)), 200
+
+    except RecognitionError as e:
+        return jsonify({'error': str(e)}), 400
+    except QueueFullError as e:
+        logger.warning(f"Отклонено задание распознавания: {e}")
+        return jsonify({'error': 'Сервер перегружен, повторите попытку позже'}), 503
+    except Exception as e:
+        logger.error(f"Ошибка обработки изображения: {e}")
+        return jsonify({'error': str(e)}), 500
 
-        return jsonify({'results': results}), 200
+# Маршрут для получения статуса и результата задания распознавания
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Задание не найдено'}), 404
+    data = job.to_dict()
+    data['queue_depth'] = get_job_queue().depth()
+    return jsonify(data), 200
+
+# Маршрут для миниатюры распознанного лица: обрезка из сохранённого изображения, ?format=jpeg|webp&size=<пикселей>
+@app.route('/faces/<image_key>/<int:index>', methods=['GET'])
+def get_face_thumbnail(image_key, index):
+    fmt = request.args.get('format', 'jpeg').lower()
+    try:
+        size = int(request.args.get('size', THUMBNAIL_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Недопустимый размер миниатюры'}), 400
+    if fmt not in THUMBNAIL_FORMATS or not 1 <= size <= THUMBNAIL_MAX_SIZE:
+        return jsonify({'error': 'Недопустимые параметры миниатюры'}), 400
 
+    try:
+        thumbnail = get_crop_store().thumbnail(image_key, index, size, fmt)
     except Exception as e:
-        logger.error(f"Ошибка обработки изображения: {e}")
-        if os.path.exists(image_path):
-            os.remove(image_path)
+        logger.error(f"Ошибка построения миниатюры {image_key}/{index}: {e}")
         return jsonify({'error': str(e)}), 500
+    if thumbnail is None:
+        return jsonify({'error': 'Изображение устарело или лицо не найдено'}), 404
+    response = Response(thumbnail, mimetype=THUMBNAIL_FORMATS[fmt][1])
+    response.headers['Cache-Control'] = f"private, max-age={int(CROP_IMAGE_TTL)}"
+    return response
 
 # Маршрут для отметки посещаемости одного студента
 @app.route('/mark_attendance', methods=['POST'])
@@ -541,18 +851,10 @@ def mark_attendance():
         return jsonify({'error': 'Отсутствуют обязательные параметры'}), 400
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO attendance (student_id, subject_id, group_id, attendance_date, status)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (student_id, subject_id, group_id, attendance_date)
-            DO UPDATE SET status = EXCLUDED.status
-            RETURNING attendance_id
-        """, (student_id, subject_id, group_id, attendance_date, status))
-        attendance_id = cursor.fetchone()[0]
-        conn.commit()
-        conn.close()
+        outcome = upsert_attendance([dict(data, status=status)])[0]
+        if outcome['status'] == 'invalid':
+            return jsonify({'error': outcome['error']}), 400
+        attendance_id = outcome['attendance_id']
         logger.info(f"Отмечена посещаемость: student_id={student_id}, date={attendance_date}, status={status}")
         return jsonify({'status': 'success', 'attendance_id': attendance_id}), 200
     except Exception as e:
@@ -564,53 +866,104 @@ def mark_attendance():
 def bulk_mark_attendance():
     data = request.get_json()
     records = data.get('records', [])
-    if not records:
+    if not records or not isinstance(records, list):
         logger.error("Отсутствуют записи для массовой отметки")
         return jsonify({'error': 'Отсутствуют записи'}), 400
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        for record in records:
-            cursor.execute("""
-                INSERT INTO attendance (student_id, subject_id, group_id, attendance_date, status)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (student_id, subject_id, group_id, attendance_date)
-                DO UPDATE SET status = EXCLUDED.status
-            """, (
-                record['student_id'],
-                record['subject_id'],
-                record['group_id'],
-                record['attendance_date'],
-                record['status']
-            ))
-        conn.commit()
-        conn.close()
-        logger.info(f"Массово отмечено {len(records)} записей посещаемости")
-        return jsonify({'status': 'success'}), 200
+        # Все записи проверяются заранее и сохраняются одним запросом; результат - по каждой записи
+        results = upsert_attendance(records)
+        invalid = [result for result in results if result['status'] == 'invalid']
+        logger.info(f"Массово отмечено {len(records) - len(invalid)} из {len(records)} записей посещаемости")
+        response = {'status': 'success' if not invalid else 'partial', 'results': results}
+        if invalid:
+            response['error'] = f"Не сохранено записей: {len(invalid)}"
+        return jsonify(response), 200
     except Exception as e:
         logger.error(f"Ошибка при массовой отметке посещаемости: {e}")
         return jsonify({'error': str(e)}), 500
 
-# Маршрут для получения логов
-@app.route('/logs', methods=['GET'])
-def get_logs():
-    log_file_path = "/home/dmitry/PycharmProjects/diploma/face_encoding.log"
+# Маршрут для отчёта о посещаемости за период: group_by=student|subject|group,
+# необязательные date_from, date_to (YYYY-MM-DD), group_id, subject_id, student_id
+@app.route('/reports/attendance', methods=['GET'])
+def get_attendance_report():
+    group_by = request.args.get('group_by', 'student')
+    if group_by not in REPORT_GROUPINGS:
+        return jsonify({'error': 'Недопустимый разрез отчёта'}), 400
     try:
-        logs = []
-        log_files = [log_file_path] + [f"{log_file_path}.{i}" for i in range(1, 6)]
-        for file in log_files:
-            if os.path.exists(file):
-                with open(file, 'r', encoding='utf-8') as f:
-                    logs.extend([line.strip() for line in f if line.strip()])
-        if not logs:
-            logger.warning("Логи не найдены")
-            return jsonify({'logs': [], 'error': 'Логи не найдены'}), 200
-        return jsonify({'logs': logs}), 200
+        date_from = date.fromisoformat(request.args['date_from']) if request.args.get('date_from') else None
+        date_to = date.fromisoformat(request.args['date_to']) if request.args.get('date_to') else None
+        filters = {
+            name: int(request.args[name]) if request.args.get(name) else None
+            for name in ('group_id', 'subject_id', 'student_id')
+        }
+    except ValueError:
+        return jsonify({'error': 'Недопустимые параметры отчёта'}), 400
+
+    try:
+        report = attendance_report(group_by, date_from, date_to, **filters)
+        return jsonify({'report': report}), 200
     except Exception as e:
-        logger.error(f"Ошибка чтения логов: {e}")
+        logger.error(f"Ошибка построения отчёта о посещаемости: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Значения, снимаемые при каждом запросе /metrics
+get_metrics().gauge('face_gallery_size', 'Число эмбеддингов в галерее лиц', lambda: len(get_gallery()))
+get_metrics().gauge('face_index_build_failures', 'Ошибок построения IVF-индекса подряд', lambda: get_gallery().index_build_failures())
+get_metrics().gauge('face_gallery_templates', 'Число шаблонов студентов в галерее лиц', lambda: get_gallery().templates_count())
+get_metrics().gauge('face_job_queue_depth', 'Заданий распознавания в очереди', lambda: get_job_queue().depth())
+for _stat in ('open', 'idle', 'in_use', 'timeouts', 'borrow_wait_max', 'borrow_wait_avg'):
+    get_metrics().gauge(f'db_pool_{_stat}', f'Пул соединений с БД: {_stat}', lambda stat=_stat: get_pool().stats()[stat])
+get_metrics().gauge('face_crop_images', 'Изображений в памяти для миниатюр лиц', lambda: len(get_crop_store()))
+
+# Метрики процесса в текстовом формате Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(get_metrics().render(), mimetype='text/plain; version=0.0.4')
+
+# Маршрут для получения логов от новых записей к старым.
+# Параметры: limit (последние N строк), level=ERROR,WARNING, since/until (ISO 8601), q - подстрока,
+# cursor - next_cursor предыдущей страницы. Ответ формируется потоком по мере чтения файлов с конца
+@app.route('/logs', methods=['GET'])
+def get_logs():
+    try:
+        limit = int(request.args.get('limit', LOG_DEFAULT_LIMIT))
+        if not 1 <= limit <= LOG_MAX_LIMIT:
+            raise PaginationError(f"limit должен быть от 1 до {LOG_MAX_LIMIT}")
+        levels = [level.strip().upper() for level in request.args.get('level', '').split(',') if level.strip()]
+        if any(level not in LOG_LEVELS for level in levels):
+            raise PaginationError('Недопустимый уровень логирования')
+        query = LogQuery(
+            file_handler.baseFilename,
+            file_handler.backupCount,
+            limit=limit,
+            levels=levels,
+            since=parse_log_time(request.args['since']) if request.args.get('since') else None,
+            until=parse_log_time(request.args['until']) if request.args.get('until') else None,
+            search=request.args.get('q'),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e) if isinstance(e, PaginationError) else 'Недопустимый limit'}), 400
+
+    if not query.files:
+        logger.warning("Логи не найдены")
+        return jsonify({'logs': [], 'next_cursor': None, 'error': 'Логи не найдены'}), 200
+
+    def generate():
+        yield '{"logs": ['
+        try:
+            for index, record in enumerate(query):
+                yield (',' if index else '') + json.dumps(record, ensure_ascii=False)
+        except Exception as e:
+            logger.error(f"Ошибка чтения логов: {e}")
+            yield f'], "next_cursor": null, "error": {json.dumps(str(e), ensure_ascii=False)}}}'
+            return
+        yield f'], "next_cursor": {json.dumps(query.next_cursor)}}}'
+
+    return Response(generate(), mimetype='application/json')
+
 if __name__ == '__main__':
     init_db()  # Инициализация таблиц при запуске
+    start_orphan_sweep()  # Удаление временных файлов, оставшихся от прошлых запусков
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,149 @@
+import logging
+from datetime import date
+from typing import List
+from psycopg2.extras import execute_values
+from main_db import get_db_connection
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+ATTENDANCE_STATUSES = ('present', 'absent')
+ATTENDANCE_FIELDS = ('student_id', 'subject_id', 'group_id', 'attendance_date', 'status')
+# Строк в одном многострочном INSERT
+ATTENDANCE_UPSERT_PAGE_SIZE = 1000
+
+# Одна вставка на весь набор: записи с несуществующими студентом, предметом или группой отсеиваются соединением,
+# xmax = 0 у только что вставленной строки отличает вставку от обновления
+ATTENDANCE_UPSERT = """
+    INSERT INTO attendance (student_id, subject_id, group_id, attendance_date, status)
+    SELECT v.student_id, v.subject_id, v.group_id, v.attendance_date, v.status
+    FROM (VALUES %s) AS v(student_id, subject_id, group_id, attendance_date, status)
+    JOIN students s ON s.student_id = v.student_id
+    JOIN subjects sub ON sub.subject_id = v.subject_id
+    JOIN groups g ON g.group_id = v.group_id
+    ON CONFLICT (student_id, subject_id, group_id, attendance_date)
+    DO UPDATE SET status = EXCLUDED.status
+    RETURNING attendance_id, student_id, subject_id, group_id, attendance_date, (xmax = 0) AS inserted
+"""
+# Отметка по распознаванию: студент должен состоять в группе, для которой отмечается посещаемость
+ATTENDANCE_UPSERT_IN_GROUP = ATTENDANCE_UPSERT.replace(
+    "JOIN students s ON s.student_id = v.student_id",
+    "JOIN students s ON s.student_id = v.student_id AND s.group_id = v.group_id"
+)
+ATTENDANCE_UPSERT_TEMPLATE = "(%s::integer, %s::integer, %s::integer, %s::date, %s::text)"
+
+
+# Проверка и приведение одной записи; возвращает (ключ со статусом, None) или (None, текст ошибки)
+def validate_record(record) -> tuple:
+    if not isinstance(record, dict):
+        return None, 'Запись должна быть объектом'
+    missing = [field for field in ATTENDANCE_FIELDS if record.get(field) in (None, '')]
+    if missing:
+        return None, f"Отсутствуют обязательные параметры: {', '.join(missing)}"
+    try:
+        student_id = int(record['student_id'])
+        subject_id = int(record['subject_id'])
+        group_id = int(record['group_id'])
+    except (TypeError, ValueError):
+        return None, 'Идентификаторы должны быть целыми числами'
+    try:
+        attendance_date = date.fromisoformat(str(record['attendance_date']))
+    except ValueError:
+        return None, f"Недопустимая дата: {record['attendance_date']}"
+    if record['status'] not in ATTENDANCE_STATUSES:
+        return None, 'Недопустимый статус'
+    return (student_id, subject_id, group_id, attendance_date, record['status']), None
+
+
+# Массовая отметка посещаемости одним запросом.
+# Результат по каждой записи в исходном порядке: inserted, updated, duplicate (перекрыта более поздней записью
+# с тем же ключом) или invalid с текстом ошибки; недопустимые записи не мешают сохранению остальных.
+# dry_run выполняет тот же запрос и откатывает транзакцию: результат показывает, что было бы записано
+# in_group=True отсеивает записи студентов не из указанной группы
+def upsert_attendance(records: List[dict], dry_run: bool = False, in_group: bool = False) -> List[dict]:
+    outcomes = [None] * len(records)
+    latest = {}
+    for index, record in enumerate(records):
+        values, error = validate_record(record)
+        if error is not None:
+            outcomes[index] = {'index': index, 'status': 'invalid', 'error': error}
+            continue
+        key = values[:4]
+        if key in latest:
+            outcomes[latest[key][0]] = {'index': latest[key][0], 'status': 'duplicate'}
+        latest[key] = (index, values)
+
+    if latest:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            rows = execute_values(
+                cursor,
+                ATTENDANCE_UPSERT_IN_GROUP if in_group else ATTENDANCE_UPSERT,
+                [values for _, values in latest.values()],
+                template=ATTENDANCE_UPSERT_TEMPLATE,
+                page_size=ATTENDANCE_UPSERT_PAGE_SIZE,
+                fetch=True
+            )
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        for attendance_id, student_id, subject_id, group_id, attendance_date, inserted in rows:
+            index, _ = latest.pop((student_id, subject_id, group_id, attendance_date))
+            outcomes[index] = {'index': index, 'status': 'inserted' if inserted else 'updated'}
+            # При dry_run вставленная строка откачена, её идентификатор не существует
+            if not (dry_run and inserted):
+                outcomes[index]['attendance_id'] = attendance_id
+        # Не вернулись только записи, отсеянные соединением со справочниками
+        for index, _ in latest.values():
+            outcomes[index] = {'index': index, 'status': 'invalid', 'error': 'Студент, предмет или группа не найдены'}
+
+    counts = {}
+    for outcome in outcomes:
+        counts[outcome['status']] = counts.get(outcome['status'], 0) + 1
+    logger.info(f"{'Проверено' if dry_run else 'Записано'} {len(records)} записей посещаемости: {counts}")
+    return outcomes
+
+
+# Отметка присутствия студентов, распознанных на фотографии группы, одним запросом.
+# Студент берётся из лучшего совпадения лица со статусом present среди студентов группы group_id
+# (при поиске по всей базе лучшее совпадение может оказаться из другой группы); несколько лиц одного студента
+# дают одну запись
+def mark_recognized(results: List[dict], subject_id: int, group_id: int, attendance_date: date,
+                    dry_run: bool = False) -> dict:
+    student_ids = []
+    for result in results:
+        if result['status'] != 'present':
+            continue
+        in_group = [match for match in result['matches'] if str(match['group_id']) == str(group_id)]
+        if in_group and in_group[0]['student_id'] not in student_ids:
+            student_ids.append(in_group[0]['student_id'])
+
+    records = [
+        {
+            'student_id': student_id,
+            'subject_id': subject_id,
+            'group_id': group_id,
+            'attendance_date': attendance_date.isoformat(),
+            'status': 'present'
+        }
+        for student_id in student_ids
+    ]
+    outcomes = upsert_attendance(records, dry_run=dry_run, in_group=True)
+    marked = [dict(outcome, student_id=records[outcome['index']]['student_id']) for outcome in outcomes]
+    for outcome in marked:
+        del outcome['index']
+    return {
+        'dry_run': dry_run,
+        'inserted': sum(1 for outcome in marked if outcome['status'] == 'inserted'),
+        'updated': sum(1 for outcome in marked if outcome['status'] == 'updated'),
+        'invalid': sum(1 for outcome in marked if outcome['status'] == 'invalid'),
+        'students': marked
+    }
@@ -0,0 +1,484 @@
+import numpy as np
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import subprocess
+import threading
+import urllib.request
+import urllib.error
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from main_gallery import FaceGallery, ENCODING_SIZE, ANN_MIN_GALLERY_SIZE
+from main_ann import IVFIndex
+
+# Разброс компонент синтетического эмбеддинга: расстояние между разными «людьми» около 1.4,
+# как у настоящих эмбеддингов dlib, а запрос с шумом QUERY_NOISE находится на расстоянии около 0.3
+ENCODING_SCALE = 0.09
+QUERY_NOISE = 0.02
+# Размер группы синтетической галереи
+BENCH_GROUP_SIZE = 30
+# Допуск, при котором изменение p50/p99 или пропускной способности считается регрессией
+REGRESSION_THRESHOLD = 0.10
+
+
+# Сводка измерений: пропускная способность и перцентили задержки в миллисекундах
+def summarize(latencies: List[float], items: int, wall: float = None) -> dict:
+    latencies = np.asarray(latencies, dtype=np.float64)
+    wall = wall if wall is not None else float(latencies.sum())
+    return {
+        'runs': int(len(latencies)),
+        'items': int(items),
+        'throughput_per_s': round(items / wall, 2) if wall > 0 else None,
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+        'mean_ms': round(float(latencies.mean()) * 1000, 3),
+        'max_ms': round(float(latencies.max()) * 1000, 3)
+    }
+
+
+# Метаданные запуска для сравнения результатов между коммитами
+def run_metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count()
+    }
+
+
+# Синтетические эмбеддинги галереи
+def synthetic_encodings(size: int, rng: np.random.Generator) -> np.ndarray:
+    return (rng.standard_normal((size, ENCODING_SIZE)) * ENCODING_SCALE).astype(np.float32)
+
+
+# Пакет запросов: доля match_ratio - зашумлённые копии строк галереи, остальные - незнакомые лица
+def synthetic_queries(encodings: np.ndarray, batch_size: int, rng: np.random.Generator, match_ratio: float = 0.8) -> tuple:
+    known = int(round(batch_size * match_ratio))
+    rows = rng.choice(len(encodings), known, replace=len(encodings) < known)
+    queries = np.concatenate([
+        encodings[rows] + rng.standard_normal((known, ENCODING_SIZE)).astype(np.float32) * QUERY_NOISE,
+        synthetic_encodings(batch_size - known, rng)
+    ])
+    return queries, rows
+
+
+# Галерея без БД: строки задаются напрямую, синхронизация с faces отключена.
+# По умолчанию каждая строка - отдельный студент
+class SyntheticGallery(FaceGallery):
+    def fill(self, encodings: np.ndarray, group_size: int = BENCH_GROUP_SIZE, student_ids: np.ndarray = None):
+        size = len(encodings)
+        if student_ids is None:
+            student_ids = np.arange(1, size + 1)
+        self._index = None
+        self._reset(size)
+        self._encodings[:size] = encodings
+        self._sq_norms[:size] = np.einsum('ij,ij->i', encodings, encodings)
+        self._face_ids[:size] = np.arange(1, size + 1)
+        self._student_ids[:size] = student_ids
+        self._group_ids[:size] = (np.asarray(student_ids) - 1) // group_size
+        self._full_names[:size] = [f"student_{student_id}" for student_id in student_ids]
+        self._student_rows = None
+        self._row_of = {face_id: row for row, face_id in enumerate(range(1, size + 1))}
+        self._size = size
+        # Индекс обучается в памяти, файл индекса рабочей галереи не затрагивается
+        if size >= ANN_MIN_GALLERY_SIZE:
+            self._index = IVFIndex.train(self.encodings)
+            self._index.add(self.face_ids, self.encodings)
+        self.loaded = True
+
+    def ensure_fresh(self):
+        pass
+
+
+# Сопоставление пакетов лиц с галереями разного размера: поиск по всей базе и по группе
+def bench_match(gallery_sizes: List[int], batch_sizes: List[int], repeats: int, seed: int) -> List[dict]:
+    rng = np.random.default_rng(seed)
+    results = []
+    for gallery_size in gallery_sizes:
+        encodings = synthetic_encodings(gallery_size, rng)
+        gallery = SyntheticGallery()
+        started = time.perf_counter()
+        gallery.fill(encodings)
+        build_seconds = time.perf_counter() - started
+        for batch_size in batch_sizes:
+            for scope in ('all', 'group'):
+                latencies = []
+                found = 0
+                expected = 0
+                for _ in range(repeats):
+                    queries, rows = synthetic_queries(encodings, batch_size, rng)
+                    group_id = int(rows[0]) // BENCH_GROUP_SIZE if scope == 'group' and len(rows) else None
+                    started = time.perf_counter()
+                    matches = gallery.match(list(queries), tolerance=0.5, group_id=group_id)
+                    latencies.append(time.perf_counter() - started)
+                    # Доля знакомых лиц, для которых лучшим совпадением оказался исходный студент
+                    for face_matches, row in zip(matches, rows):
+                        expected += 1
+                        found += bool(face_matches) and face_matches[0]['student_id'] == int(row) + 1
+                results.append({
+                    'case': f"match/{scope}/gallery={gallery_size}/batch={batch_size}",
+                    'gallery_size': gallery_size,
+                    'batch_size': batch_size,
+                    'scope': scope,
+                    'ann': gallery._index is not None,
+                    'build_s': round(build_seconds, 3),
+                    'top1_accuracy': round(found / expected, 4) if expected else None,
+                    **summarize(latencies, batch_size * repeats)
+                })
+                print(f"{results[-1]['case']}: p50={results[-1]['p50_ms']} мс, p99={results[-1]['p99_ms']} мс", file=sys.stderr)
+    return results
+
+
+# Режим templates против точного перебора всех эмбеддингов: у каждого студента photos фотографий,
+# доля outlier_ratio студентов имеет одно неудачное фото (эмбеддинг далеко от остальных).
+# Полнота - доля пар (лицо, студент) точного перебора, найденных шаблонами; кандидаты - шаблоны,
+# прошедшие порог tolerance + радиус и уточняемые по эмбеддингам
+def bench_templates(student_counts: List[int], photos: int, outlier_ratio: float, batch_size: int, repeats: int,
+                    seed: int, tolerance: float = 0.5) -> List[dict]:
+    # Импорт внутри функции: main_encoding загружает face_recognition
+    from main_encoding import compute_template, pack_encoding
+    rng = np.random.default_rng(seed)
+    results = []
+    for students in student_counts:
+        centers = synthetic_encodings(students, rng)
+        student_ids = np.repeat(np.arange(1, students + 1), photos)
+        encodings = centers[student_ids - 1] + rng.standard_normal((len(student_ids), ENCODING_SIZE)).astype(np.float32) * QUERY_NOISE
+        outliers = rng.choice(students, int(round(students * outlier_ratio)), replace=False)
+        encodings[outliers * photos] = synthetic_encodings(len(outliers), rng)
+        gallery = SyntheticGallery()
+        gallery.fill(encodings, student_ids=student_ids)
+        for student_id in range(1, students + 1):
+            template, radius, _ = compute_template(encodings[(student_id - 1) * photos:student_id * photos])
+            gallery._templates.upsert((student_id, f"student_{student_id}", (student_id - 1) // BENCH_GROUP_SIZE,
+                                       pack_encoding(template), radius))
+
+        # Одни и те же пакеты и результат точного перебора для обоих вариантов
+        batches = [synthetic_queries(encodings, batch_size, rng)[0] for _ in range(repeats)]
+        exact_results = []
+        exact_latencies = []
+        for queries in batches:
+            started = time.perf_counter()
+            exact_results.append(gallery.match(list(queries), tolerance=tolerance, mode='faces'))
+            exact_latencies.append(time.perf_counter() - started)
+
+        for rerank in (True, False):
+            latencies = []
+            expected = 0
+            found = 0
+            candidates = 0
+            faces = 0
+            for queries, exact in zip(batches, exact_results):
+                started = time.perf_counter()
+                matches = gallery.match(list(queries), tolerance=tolerance, mode='templates', rerank=rerank)
+                latencies.append(time.perf_counter() - started)
+                for exact_matches, face_matches in zip(exact, matches):
+                    exact_students = {match['student_id'] for match in exact_matches}
+                    expected += len(exact_students)
+                    found += len(exact_students & {match['student_id'] for match in face_matches})
+                candidates += sum(len(hits) for hits in gallery._templates.search(queries, tolerance, margin=rerank))
+                faces += len(queries)
+            results.append({
+                'case': f"templates/{'rerank' if rerank else 'plain'}/students={students}/photos={photos}",
+                'students': students,
+                'photos': photos,
+                'gallery_rows': len(encodings),
+                'outlier_ratio': outlier_ratio,
+                'rerank': rerank,
+                'recall_vs_exact': round(found / expected, 4) if expected else None,
+                'candidates_per_face': round(candidates / faces, 2),
+                'exact_p50_ms': round(float(np.percentile(exact_latencies, 50)) * 1000, 3),
+                **summarize(latencies, batch_size * repeats)
+            })
+            print(f"{results[-1]['case']}: полнота {results[-1]['recall_vs_exact']}, "
+                  f"кандидатов на лицо {results[-1]['candidates_per_face']}, p50={results[-1]['p50_ms']} мс", file=sys.stderr)
+    return results
+
+
+# Расчёт эмбеддингов по пакетам в пуле процессов на синтетическом изображении с заданными рамками лиц
+def bench_encode(face_counts: List[int], workers_list: List[int], repeats: int, seed: int, face_size: int = 150) -> List[dict]:
+    from main_workers import EncodingEngine
+    rng = np.random.default_rng(seed)
+    results = []
+    for faces in face_counts:
+        columns = int(np.ceil(np.sqrt(faces)))
+        rows = int(np.ceil(faces / columns))
+        image = rng.integers(0, 256, (rows * face_size, columns * face_size, 3), dtype=np.uint8)
+        locations = [
+            (r * face_size, (c + 1) * face_size, (r + 1) * face_size, c * face_size)
+            for r in range(rows) for c in range(columns)
+        ][:faces]
+        for workers in workers_list:
+            engine = EncodingEngine(workers=workers)
+            try:
+                # Прогрев: запуск процессов пула не входит в измерение
+                engine.encode(image, locations[:workers])
+                latencies = []
+                for _ in range(repeats):
+                    started = time.perf_counter()
+                    engine.encode(image, locations)
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                engine.shutdown()
+            results.append({
+                'case': f"encode/faces={faces}/workers={workers}",
+                'faces': faces,
+                'workers': workers,
+                **summarize(latencies, faces * repeats)
+            })
+            print(f"{results[-1]['case']}: p50={results[-1]['p50_ms']} мс", file=sys.stderr)
+    return results
+
+
+# Запись в БД: пакетная отметка посещаемости (одним запросом и построчно) и вставка эмбеддингов.
+# Всё выполняется в одной транзакции с откатом, синтетические строки в базе не остаются
+def bench_db(record_counts: List[int], repeats: int, seed: int) -> List[dict]:
+    from psycopg2.extras import execute_values
+    from main_db import get_db_connection
+    from main_attendance import ATTENDANCE_UPSERT, ATTENDANCE_UPSERT_TEMPLATE, ATTENDANCE_UPSERT_PAGE_SIZE
+    from main_encoding import insert_face_encodings
+    rng = np.random.default_rng(seed)
+    results = []
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        suffix = uuid.uuid4().hex[:8]
+        cursor.execute("INSERT INTO groups (group_name) VALUES (%s) RETURNING group_id", (f"bench_{suffix}",))
+        group_id = cursor.fetchone()[0]
+        cursor.execute("INSERT INTO subjects (subject_name) VALUES (%s) RETURNING subject_id", (f"bench_{suffix}",))
+        subject_id = cursor.fetchone()[0]
+        cursor.execute(
+            "INSERT INTO students (full_name, group_id) SELECT 'bench_' || i, %s FROM generate_series(1, %s) i RETURNING student_id",
+            (group_id, max(record_counts))
+        )
+        student_ids = [row[0] for row in cursor.fetchall()]
+
+        for count in record_counts:
+            for path in ('set_based', 'per_row'):
+                latencies = []
+                for repeat in range(repeats):
+                    day = f"2000-01-{repeat % 28 + 1:02d}"
+                    status = 'present' if repeat % 2 == 0 else 'absent'
+                    rows = [(student_id, subject_id, group_id, day, status) for student_id in student_ids[:count]]
+                    cursor.execute("SAVEPOINT bench")
+                    started = time.perf_counter()
+                    if path == 'set_based':
+                        execute_values(cursor, ATTENDANCE_UPSERT, rows, template=ATTENDANCE_UPSERT_TEMPLATE,
+                                       page_size=ATTENDANCE_UPSERT_PAGE_SIZE, fetch=True)
+                    else:
+                        for row in rows:
+                            cursor.execute("""
+                                INSERT INTO attendance (student_id, subject_id, group_id, attendance_date, status)
+                                VALUES (%s, %s, %s, %s, %s)
+                                ON CONFLICT (student_id, subject_id, group_id, attendance_date)
+                                DO UPDATE SET status = EXCLUDED.status
+                            """, row)
+                    latencies.append(time.perf_counter() - started)
+                    cursor.execute("ROLLBACK TO SAVEPOINT bench")
+                results.append({
+                    'case': f"db/attendance_{path}/records={count}",
+                    'records': count,
+                    **summarize(latencies, count * repeats)
+                })
+                print(f"{results[-1]['case']}: p50={results[-1]['p50_ms']} мс", file=sys.stderr)
+
+            latencies = []
+            for repeat in range(repeats):
+                encodings = synthetic_encodings(count, rng).astype(np.float64)
+                rows = [(student_ids[i], encodings[i], f"bench_{suffix}_{repeat}_{i}") for i in range(count)]
+                cursor.execute("SAVEPOINT bench")
+                started = time.perf_counter()
+                insert_face_encodings(cursor, rows)
+                latencies.append(time.perf_counter() - started)
+                cursor.execute("ROLLBACK TO SAVEPOINT bench")
+            results.append({
+                'case': f"db/insert_face_encodings/rows={count}",
+                'records': count,
+                **summarize(latencies, count * repeats)
+            })
+            print(f"{results[-1]['case']}: p50={results[-1]['p50_ms']} мс", file=sys.stderr)
+    finally:
+        conn.rollback()
+        conn.close()
+    return results
+
+
+# Тело multipart/form-data для POST-маршрутов с файлом
+def encode_multipart(fields: dict, files: dict) -> tuple:
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    for name, (filename, content) in files.items():
+        body.write(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8')
+        )
+        body.write(content)
+        body.write(b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode('utf-8'))
+    return body.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+# Нагрузка на HTTP-маршруты запущенного API: concurrency потоков отправляют requests запросов
+def bench_http(base_url: str, route: str, requests_count: int, concurrency: int, form: dict = None,
+               image_path: str = None, timeout: float = 120.0) -> dict:
+    url = base_url.rstrip('/') + route
+    if image_path:
+        with open(image_path, 'rb') as f:
+            body, content_type = encode_multipart(form or {}, {'image': (os.path.basename(image_path), f.read())})
+    elif form:
+        body, content_type = encode_multipart(form, {})
+    else:
+        body, content_type = None, None
+
+    statuses = {}
+    lock = threading.Lock()
+
+    def send(_):
+        request = urllib.request.Request(url, data=body, method='POST' if body is not None else 'GET')
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, OSError):
+            status = 'connection_error'
+        elapsed = time.perf_counter() - started
+        with lock:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(send, range(requests_count)))
+    wall = time.perf_counter() - started
+    result = {
+        'case': f"http{route}/concurrency={concurrency}",
+        'route': route,
+        'concurrency': concurrency,
+        'statuses': statuses,
+        **summarize(latencies, requests_count, wall)
+    }
+    print(f"{result['case']}: {result['throughput_per_s']} запр/с, p99={result['p99_ms']} мс, {statuses}", file=sys.stderr)
+    return result
+
+
+# Сравнение двух файлов результатов по совпадающим case: отношение p50/p99 и пропускной способности
+def compare(baseline: dict, current: dict, threshold: float = REGRESSION_THRESHOLD) -> List[dict]:
+    base_cases = {result['case']: result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        base = base_cases.get(result['case'])
+        if base is None:
+            continue
+        row = {'case': result['case']}
+        for metric in ('p50_ms', 'p99_ms', 'throughput_per_s'):
+            if base.get(metric) and result.get(metric) is not None:
+                row[metric] = round(result[metric] / base[metric], 3)
+        row['regression'] = (
+            row.get('p50_ms', 1) > 1 + threshold or row.get('p99_ms', 1) > 1 + threshold
+            or row.get('throughput_per_s', 1) < 1 - threshold
+        )
+        rows.append(row)
+    return rows
+
+
+def int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Замеры производительности распознавания, расчёта эмбеддингов и записи в БД")
+    parser.add_argument('--output', help="Файл для результатов в JSON (по умолчанию - stdout)")
+    parser.add_argument('--seed', type=int, default=0)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    match_parser = subparsers.add_parser('match', help="Сопоставление с синтетической галереей в памяти")
+    match_parser.add_argument('--gallery-sizes', type=int_list, default=[1000, 10000, 100000])
+    match_parser.add_argument('--batch-sizes', type=int_list, default=[1, 10, 50])
+    match_parser.add_argument('--repeats', type=int, default=50)
+
+    templates_parser = subparsers.add_parser('templates', help="Режим templates против точного перебора эмбеддингов")
+    templates_parser.add_argument('--students', type=int_list, default=[1000, 10000])
+    templates_parser.add_argument('--photos', type=int, default=5)
+    templates_parser.add_argument('--outlier-ratio', type=float, default=0.1)
+    templates_parser.add_argument('--batch-size', type=int, default=30)
+    templates_parser.add_argument('--repeats', type=int, default=20)
+
+    encode_parser = subparsers.add_parser('encode', help="Расчёт эмбеддингов в пуле процессов")
+    encode_parser.add_argument('--faces', type=int_list, default=[10, 50, 200])
+    encode_parser.add_argument('--workers', type=int_list, default=[1, os.cpu_count() or 1])
+    encode_parser.add_argument('--repeats', type=int, default=3)
+
+    db_parser = subparsers.add_parser('db', help="Запись посещаемости и эмбеддингов в локальный PostgreSQL (с откатом)")
+    db_parser.add_argument('--records', type=int_list, default=[30, 300])
+    db_parser.add_argument('--repeats', type=int, default=10)
+
+    http_parser = subparsers.add_parser('http', help="Нагрузка на маршруты запущенного API")
+    http_parser.add_argument('--url', default="http://localhost:5000")
+    http_parser.add_argument('--route', default="/groups")
+    http_parser.add_argument('--requests', type=int, default=200)
+    http_parser.add_argument('--concurrency', type=int_list, default=[1, 8])
+    http_parser.add_argument('--image', help="Изображение для /process_image")
+    http_parser.add_argument('--form', action='append', default=[], help="Поле формы name=value (можно повторять)")
+
+    compare_parser = subparsers.add_parser('compare', help="Сравнение двух файлов результатов")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'compare':
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, encoding='utf-8') as f:
+            current = json.load(f)
+        report = {'baseline': baseline['meta'], 'current': current['meta'], 'results': compare(baseline, current, args.threshold)}
+    else:
+        if args.benchmark == 'match':
+            results = bench_match(args.gallery_sizes, args.batch_sizes, args.repeats, args.seed)
+        elif args.benchmark == 'templates':
+            results = bench_templates(args.students, args.photos, args.outlier_ratio, args.batch_size, args.repeats, args.seed)
+        elif args.benchmark == 'encode':
+            results = bench_encode(args.faces, args.workers, args.repeats, args.seed)
+        elif args.benchmark == 'db':
+            results = bench_db(args.records, args.repeats, args.seed)
+        else:
+            form = dict(item.split('=', 1) for item in args.form)
+            results = [
+                bench_http(args.url, args.route, args.requests, concurrency, form, args.image)
+                for concurrency in args.concurrency
+            ]
+        report = {
+            'benchmark': args.benchmark,
+            'meta': run_metadata(),
+            'params': {key: value for key, value in vars(args).items() if key not in ('output', 'benchmark')},
+            'results': results
+        }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.benchmark == 'compare' and any(row['regression'] for row in report['results']):
+        sys.exit(1)
@@ -0,0 +1,56 @@
+import os
+import time
+import logging
+import threading
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Каталоги временных файлов распознавания прежних версий API: обрезанные лица писались в каталог веб-сервера,
+# исходные изображения - в каталог recognition рядом с API (относительно рабочего каталога, как и uploads)
+FACES_DIR = os.environ.get('FACES_DIR', '/opt/lampp/htdocs/faces')
+RECOGNITION_DIR = os.environ.get('RECOGNITION_DIR', 'recognition')
+# Файлы моложе этого возраста (сек) не удаляются при очистке каталогов
+CLEANUP_DELAY = float(os.environ.get('CLEANUP_DELAY', '60'))
+# Файл, который не должен удаляться при очистке каталогов
+CLEANUP_KEEP_FILES = {'remove_this_file_before_use_the_project'}
+
+
+# Удаление файла; отсутствующий файл не считается ошибкой
+def remove_file(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.error(f"Ошибка удаления файла {path}: {e}")
+        return False
+
+
+# Удаление файлов каталогов старше max_age: временные файлы, оставшиеся от прошлых запусков
+def sweep_orphans(directories: tuple = (FACES_DIR, RECOGNITION_DIR), max_age: float = CLEANUP_DELAY) -> int:
+    cutoff = time.time() - max_age
+    removed = 0
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if not entry.is_file() or entry.name in CLEANUP_KEEP_FILES:
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    removed += remove_file(entry.path)
+            except FileNotFoundError:
+                continue
+    logger.info(f"Удалено потерянных временных файлов: {removed}")
+    return removed
+
+
+# Очистка каталогов в фоновом потоке, чтобы не задерживать запуск сервера
+def start_orphan_sweep() -> threading.Thread:
+    thread = threading.Thread(target=sweep_orphans, name='orphan-sweep', daemon=True)
+    thread.start()
+    return thread
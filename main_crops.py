@@ -0,0 +1,221 @@
+import numpy as np
+import os
+import io
+import re
+import time
+import logging
+import threading
+from typing import List
+from collections import OrderedDict
+from PIL import Image
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Сколько секунд изображение хранится для выдачи миниатюр лиц
+CROP_IMAGE_TTL = float(os.environ.get('CROP_IMAGE_TTL', '300'))
+# Предельный объём декодированных изображений в памяти процесса; при превышении вытесняются давно не использованные
+CROP_CACHE_MAX_BYTES = int(os.environ.get('CROP_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Исходные изображения с рамками лиц на диске рядом с кэшем лиц: миниатюру может выдать любой процесс API
+CROP_CACHE_DIR = "cache/crops"
+# Предельный размер каталога изображений; при превышении удаляются самые старые
+CROP_DISK_MAX_BYTES = int(os.environ.get('CROP_DISK_MAX_BYTES', str(512 * 1024 * 1024)))
+# Ключ изображения - ключ кэша лиц: SHA-256 содержимого и хэш параметров обнаружения
+IMAGE_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}(_[0-9a-f]{12})?$')
+# Размер миниатюры по умолчанию и наибольший допустимый (по длинной стороне, пикселей)
+THUMBNAIL_SIZE = 160
+THUMBNAIL_MAX_SIZE = 512
+THUMBNAIL_QUALITY = 85
+# Форматы миниатюр: формат PIL и MIME-тип
+THUMBNAIL_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp')
+}
+
+
+# Миниатюра лица: вырезание по рамке (top, right, bottom, left), уменьшение до size и сжатие
+def render_thumbnail(image: np.ndarray, location: tuple, size: int = THUMBNAIL_SIZE, fmt: str = 'jpeg') -> bytes:
+    top, right, bottom, left = location
+    face_image = Image.fromarray(image[top:bottom, left:right])
+    face_image.thumbnail((size, size), Image.BILINEAR)
+    output = io.BytesIO()
+    face_image.save(output, format=THUMBNAIL_FORMATS[fmt][0], quality=THUMBNAIL_QUALITY)
+    return output.getvalue()
+
+
+# Изображения последних распознаваний с рамками лиц; миниатюры строятся по запросу.
+# Исходный файл и рамки пишутся на диск (общий для процессов), декодированные изображения
+# держатся в памяти процесса, чтобы повторные запросы не декодировали файл заново
+class CropStore:
+    def __init__(self, ttl: float = CROP_IMAGE_TTL, max_bytes: int = CROP_CACHE_MAX_BYTES,
+                 directory: str = CROP_CACHE_DIR, disk_max_bytes: int = CROP_DISK_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._disk_size = None
+        self._disk_swept_at = 0.0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _path(self, image_key: str) -> str:
+        return os.path.join(self.directory, f"{image_key}.npz")
+
+    # Удаление записи с освобождением объёма изображения и её миниатюр
+    def _drop(self, image_key: str):
+        entry = self._entries.pop(image_key)
+        self._size -= entry['image'].nbytes + sum(len(thumbnail) for thumbnail in entry['thumbnails'].values())
+
+    # Вытеснение устаревших и давно не использованных записей, кроме keep (вызывается под блокировкой)
+    def _evict(self, keep: str):
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry['expires_at'] < now and key != keep]:
+            self._drop(key)
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                self._entries.move_to_end(key)
+                key = next(iter(self._entries))
+            self._drop(key)
+
+    # Запись в память процесса; expires_at - по монотонным часам
+    def _remember(self, image_key: str, image: np.ndarray, locations: List[tuple], expires_at: float):
+        with self._lock:
+            if image_key in self._entries:
+                self._drop(image_key)
+            self._entries[image_key] = {
+                'expires_at': expires_at,
+                'image': image,
+                'locations': list(locations),
+                'thumbnails': {}
+            }
+            self._size += image.nbytes
+            # Последнее изображение сохраняется даже при превышении предела
+            self._evict(image_key)
+
+    # Сохранение изображения с рамками лиц под ключом кэша лиц: data - исходный файл для других процессов,
+    # image - уже декодированное изображение для этого процесса
+    def put(self, image_key: str, data: bytes, image: np.ndarray, locations: List[tuple]):
+        self._remember(image_key, image, locations, time.monotonic() + self.ttl)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(image_key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    locations=np.asarray(locations, dtype=np.int64).reshape(-1, 4),
+                    data=np.frombuffer(data, dtype=np.uint8)
+                )
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Ошибка записи изображения для миниатюр {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._disk_lock:
+            if self._disk_size is not None:
+                self._disk_size += os.path.getsize(path)
+            if self._disk_size is None or self._disk_size > self.disk_max_bytes or \
+                    time.monotonic() - self._disk_swept_at >= self.ttl:
+                self._evict_disk()
+
+    # Пересчёт размера по каталогу (общий для процессов): удаление устаревших и самых старых файлов
+    def _evict_disk(self):
+        self._disk_swept_at = time.monotonic()
+        cutoff = time.time() - self.ttl
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.npz'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        self._disk_size = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if mtime >= cutoff and self._disk_size <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                self._disk_size -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info(f"Изображения для миниатюр: удалено {removed} файлов, размер {self._disk_size} байт")
+
+    # Изображение, сохранённое любым процессом: (декодированное изображение, рамки) или None, если устарело
+    def _load(self, image_key: str):
+        path = self._path(image_key)
+        try:
+            age = time.time() - os.stat(path).st_mtime
+            if age > self.ttl:
+                return None
+            with np.load(path) as stored:
+                locations = [tuple(int(v) for v in box) for box in stored['locations']]
+                data = stored['data'].tobytes()
+        except FileNotFoundError:
+            return None
+        image = np.asarray(Image.open(io.BytesIO(data)).convert('RGB'))
+        self._remember(image_key, image, locations, time.monotonic() + self.ttl - age)
+        return image, locations
+
+    # Миниатюра лица с номером index; None - изображение устарело, ключ неизвестен либо номер вне диапазона
+    def thumbnail(self, image_key: str, index: int, size: int = THUMBNAIL_SIZE, fmt: str = 'jpeg'):
+        if not IMAGE_KEY_PATTERN.match(image_key):
+            return None
+        with self._lock:
+            entry = self._entries.get(image_key)
+            if entry is not None and entry['expires_at'] < time.monotonic():
+                self._drop(image_key)
+                entry = None
+            thumbnail = None
+            if entry is not None:
+                self._entries.move_to_end(image_key)
+                if not 0 <= index < len(entry['locations']):
+                    return None
+                thumbnail = entry['thumbnails'].get((index, size, fmt))
+                image, location = entry['image'], entry['locations'][index]
+        if entry is None:
+            # Изображение распознано другим процессом или вытеснено из памяти: чтение с диска без блокировки
+            loaded = self._load(image_key)
+            if loaded is None:
+                return None
+            image, locations = loaded
+            if not 0 <= index < len(locations):
+                return None
+            location = locations[index]
+        if thumbnail is None:
+            # Сжатие выполняется без блокировки; повторный запрос той же миниатюры берётся из кэша записи.
+            # Миниатюры учитываются в пределе объёма и вытесняются вместе с изображением
+            thumbnail = render_thumbnail(image, location, size, fmt)
+            with self._lock:
+                entry = self._entries.get(image_key)
+                if entry is not None and (index, size, fmt) not in entry['thumbnails']:
+                    entry['thumbnails'][(index, size, fmt)] = thumbnail
+                    self._size += len(thumbnail)
+                    self._evict(image_key)
+        return thumbnail
+
+
+_crop_store = None
+_crop_store_lock = threading.Lock()
+
+
+# Общее хранилище изображений для миниатюр лиц
+def get_crop_store() -> CropStore:
+    global _crop_store
+    with _crop_store_lock:
+        if _crop_store is None:
+            _crop_store = CropStore()
+        return _crop_store
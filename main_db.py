@@ -0,0 +1,210 @@
+import psycopg2
+import psycopg2.extras
+import psycopg2.extensions
+import os
+import logging
+import threading
+import time
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+DB_SETTINGS = {
+    'dbname': "attendance",
+    'user': "dmitry",
+    'password': "dmitry",
+    'host': "localhost",
+    'port': "5432"
+}
+# Размер пула соединений (общий для main_api и main_encoding)
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+# Сколько секунд ждать свободное соединение, прежде чем вернуть ошибку
+DB_POOL_BORROW_TIMEOUT = float(os.environ.get('DB_POOL_BORROW_TIMEOUT', '10'))
+# Соединение, простоявшее в пуле дольше (сек), перед выдачей проверяется запросом SELECT 1
+DB_POOL_HEALTH_CHECK_IDLE = 30.0
+
+
+# Новое соединение с PostgreSQL с настройкой JSONB
+def open_connection():
+    conn = psycopg2.connect(**DB_SETTINGS)
+    # Отключение автоматической десериализации JSONB
+    psycopg2.extras.register_default_jsonb(conn, globally=False, loads=lambda x: x)
+    return conn
+
+
+# Соединение из пула: close() возвращает его в пул, остальное делегируется psycopg2
+class PooledConnection:
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError("Соединение уже возвращено в пул")
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    # Страховка для маршрутов, не закрывающих соединение при исключении
+    def __del__(self):
+        if self._conn is not None:
+            logger.warning("Соединение не возвращено в пул явно, возврат при сборке мусора")
+            self.close()
+
+
+# Потокобезопасный пул соединений с проверкой живости и метриками ожидания
+class ConnectionPool:
+    def __init__(self, min_size: int = DB_POOL_MIN_SIZE, max_size: int = DB_POOL_MAX_SIZE):
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self._idle = []
+        self._opened = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'borrowed': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'borrow_wait_total': 0.0,
+            'borrow_wait_max': 0.0
+        }
+
+    # Открытие соединения на зарезервированное место; подключение идёт без блокировки пула,
+    # при ошибке место освобождается
+    def _open_reserved(self):
+        try:
+            return open_connection()
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+    # Открытие соединений до min_size. Места резервируются под блокировкой, подключение - без неё
+    def _fill_min(self):
+        while True:
+            with self._cond:
+                if self._opened >= self.min_size:
+                    return
+                self._opened += 1
+            conn = self._open_reserved()
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    # Проверка соединения перед выдачей: закрытые и не отвечающие соединения отбрасываются
+    def _healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < DB_POOL_HEALTH_CHECK_IDLE:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            if not conn.closed:
+                conn.close()
+        except psycopg2.Error:
+            pass
+        self._opened -= 1
+        self._cond.notify()
+
+    # Выдача соединения. Блокировка пула держится только на время работы со списком свободных соединений:
+    # проверка соединения и подключение к БД идут без неё и не задерживают другие get() и release()
+    def get(self) -> PooledConnection:
+        started = time.monotonic()
+        deadline = started + DB_POOL_BORROW_TIMEOUT
+        self._fill_min()
+        while True:
+            with self._cond:
+                while not self._idle and self._opened >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise ValueError(f"Нет свободных соединений с базой данных (пул {self.max_size})")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    # Место под новое соединение резервируется до подключения
+                    self._opened += 1
+                    conn = None
+            if conn is None:
+                conn = self._open_reserved()
+                with self._cond:
+                    return self._borrowed(conn, started)
+            if self._healthy(conn, idle_since):
+                with self._cond:
+                    return self._borrowed(conn, started)
+            logger.warning("Соединение из пула не прошло проверку, открывается новое")
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+                self._discard(conn)
+
+    def _borrowed(self, conn, started: float) -> PooledConnection:
+        wait = time.monotonic() - started
+        self._stats['borrowed'] += 1
+        self._stats['borrow_wait_total'] += wait
+        self._stats['borrow_wait_max'] = max(self._stats['borrow_wait_max'], wait)
+        return PooledConnection(self, conn)
+
+    # Возврат соединения: незавершённая транзакция откатывается
+    def release(self, conn):
+        try:
+            if not conn.closed and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            if conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats['open'] = self._opened
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._opened - len(self._idle)
+            stats['max_size'] = self.max_size
+        stats['borrow_wait_avg'] = stats['borrow_wait_total'] / stats['borrowed'] if stats['borrowed'] else 0.0
+        return stats
+
+    def close_all(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+# Подключение к PostgreSQL из общего пула
+def get_db_connection():
+    try:
+        return get_pool().get()
+    except psycopg2.Error as e:
+        logger.error(f"Ошибка подключения к БД: {e}")
+        raise ValueError(f"Не удалось подключиться к базе данных: {str(e)}")
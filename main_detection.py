@@ -0,0 +1,126 @@
+import face_recognition
+import numpy as np
+import logging
+from typing import List
+from PIL import Image
+from main_workers import get_encoding_engine
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+DETECTION_MODES = ('full', 'downscale', 'tiles')
+# Режим обнаружения по умолчанию: полный размер, уменьшенная копия или тайлы с перекрытием
+DETECTION_MODE = 'full'
+# В режиме downscale без явного масштаба длинная сторона уменьшается до этого размера
+DETECTION_MAX_SIDE = 1600
+# Размер тайла в пикселях исходного изображения
+DETECTION_TILE_SIZE = 1024
+# Наибольший ожидаемый размер лица (первый ряд на фото аудитории): перекрытие тайлов не меньше него,
+# чтобы каждое лицо целиком попадало хотя бы в один тайл
+DETECTION_MAX_FACE_SIZE = 320
+# Перекрытие не меньше этой доли тайла
+DETECTION_TILE_OVERLAP_FRACTION = 0.25
+DETECTION_TILE_OVERLAP = max(DETECTION_MAX_FACE_SIZE, int(DETECTION_TILE_SIZE * DETECTION_TILE_OVERLAP_FRACTION))
+DETECTION_UPSAMPLE = 1
+DETECTION_MODEL = 'hog'
+# Рамки из соседних тайлов считаются одним лицом, если пересечение занимает такую долю меньшей рамки
+DETECTION_MERGE_OVERLAP = 0.5
+
+
+# Уменьшенная копия изображения
+def resize_image(image: np.ndarray, scale: float) -> np.ndarray:
+    if scale >= 1.0:
+        return image
+    height, width = image.shape[:2]
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR))
+
+
+# Перевод рамок (top, right, bottom, left) из уменьшенной копии/тайла в координаты исходного изображения
+def map_locations(locations: List[tuple], scale: float, offset_y: int, offset_x: int, shape: tuple) -> List[tuple]:
+    height, width = shape[:2]
+    mapped = []
+    for top, right, bottom, left in locations:
+        mapped.append((
+            max(0, min(height, offset_y + int(round(top / scale)))),
+            max(0, min(width, offset_x + int(round(right / scale)))),
+            max(0, min(height, offset_y + int(round(bottom / scale)))),
+            max(0, min(width, offset_x + int(round(left / scale))))
+        ))
+    return mapped
+
+
+# Объединение дублей из зоны перекрытия тайлов: из пересекающихся рамок остаётся бо́льшая
+def merge_locations(locations: List[tuple], overlap: float = DETECTION_MERGE_OVERLAP) -> List[tuple]:
+    def area(box):
+        top, right, bottom, left = box
+        return max(0, bottom - top) * max(0, right - left)
+
+    kept = []
+    for box in sorted(locations, key=area, reverse=True):
+        duplicate = False
+        for other in kept:
+            inter_h = min(box[2], other[2]) - max(box[0], other[0])
+            inter_w = min(box[1], other[1]) - max(box[3], other[3])
+            if inter_h > 0 and inter_w > 0 and inter_h * inter_w >= overlap * max(1, min(area(box), area(other))):
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(box)
+    # Порядок сверху вниз, слева направо - как у обхода изображения
+    return sorted(kept, key=lambda box: (box[0], box[3]))
+
+
+# Координаты тайлов (y, x, высота, ширина): наименьшее число тайлов не больше tile_size, при котором
+# соседние перекрываются не меньше чем на overlap. Тайлы одного размера расставлены с равным шагом,
+# поэтому нет почти совпадающих тайлов и лишней площади обнаружения. Перекрытие ограничено половиной тайла
+def tile_grid(shape: tuple, tile_size: int = DETECTION_TILE_SIZE, overlap: int = DETECTION_TILE_OVERLAP) -> List[tuple]:
+    height, width = shape[:2]
+    overlap = min(overlap, tile_size // 2)
+
+    def spans(length):
+        if length <= tile_size:
+            return [(0, length)]
+        count = -(-(length - overlap) // (tile_size - overlap))
+        size = -(-(length + (count - 1) * overlap) // count)
+        return [(int(round(i * (length - size) / (count - 1))), size) for i in range(count)]
+
+    return [(y, x, tile_height, tile_width) for y, tile_height in spans(height) for x, tile_width in spans(width)]
+
+
+# Обнаружение лиц на одном тайле (выполняется в процессе-воркере)
+def _detect_tile(image: np.ndarray, tile: tuple, scale: float, upsample: int, model: str) -> List[tuple]:
+    y, x, height, width = tile
+    crop = resize_image(np.ascontiguousarray(image[y:y + height, x:x + width]), scale)
+    locations = face_recognition.face_locations(crop, number_of_times_to_upsample=upsample, model=model)
+    return map_locations(locations, scale, y, x, image.shape)
+
+
+# Обнаружение лиц в выбранном режиме; рамки всегда в координатах исходного изображения.
+# scale < 1 ускоряет обнаружение ценой пропуска мелких лиц
+def detect_faces(image: np.ndarray, mode: str = DETECTION_MODE, scale: float = None,
+                 upsample: int = DETECTION_UPSAMPLE, model: str = DETECTION_MODEL) -> List[tuple]:
+    if mode not in DETECTION_MODES:
+        raise ValueError(f"Неизвестный режим обнаружения: {mode}")
+    if scale is not None and not 0 < scale <= 1:
+        raise ValueError(f"Масштаб обнаружения должен быть в диапазоне (0, 1]: {scale}")
+
+    if mode == 'full':
+        return face_recognition.face_locations(image, number_of_times_to_upsample=upsample, model=model)
+
+    if mode == 'downscale':
+        if scale is None:
+            scale = min(1.0, DETECTION_MAX_SIDE / max(image.shape[:2]))
+        small = resize_image(image, scale)
+        locations = face_recognition.face_locations(small, number_of_times_to_upsample=upsample, model=model)
+        logger.info(f"Обнаружение на уменьшенной копии {small.shape[1]}x{small.shape[0]} (масштаб {scale:.2f}): {len(locations)} лиц")
+        return map_locations(locations, scale, 0, 0, image.shape)
+
+    tiles = tile_grid(image.shape)
+    tile_scale = scale or 1.0
+    tile_locations = get_encoding_engine().map_image(
+        _detect_tile, image, [(tile, tile_scale, upsample, model) for tile in tiles]
+    )
+    locations = merge_locations([box for boxes in tile_locations for box in boxes])
+    logger.info(f"Обнаружение по {len(tiles)} тайлам (масштаб {tile_scale:.2f}): {len(locations)} лиц")
+    return locations
@@ -2,37 +2,148 @@ import face_recognition
 import psycopg2
 import numpy as np
 import os
+import io
+import csv
+import json
+import time
 import logging
+import argparse
 from typing import List
-from psycopg2.extras import Json
-from datetime import datetime
+from shutil import copyfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from psycopg2.extras import Json, execute_values
+from main_db import get_db_connection
+from main_workers import ENCODING_WORKERS, START_METHOD
+from main_face_cache import get_face_cache, content_hash, cache_key
+from main_metrics import observe_stage
+from main_cleanup import remove_file
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Формат face_encoding_bin: упакованные float32 в сетевом порядке байт (как float4send в PostgreSQL).
+# 512 байт - float32, 1024 байта - float64 (float8send)
+ENCODING_STORAGE_DTYPE = np.dtype('>f4')
+# Период двойного чтения: эмбеддинг дублируется в исходный столбец face_encoding (JSONB или FLOAT[])
+# для процессов, ещё не читающих face_encoding_bin
+WRITE_JSONB_ENCODING = os.environ.get('WRITE_JSONB_ENCODING', '1').lower() in ('1', 'true')
+# Массовая загрузка: строк в одном INSERT и файлов в одной порции для процесса-воркера
+ENROLL_INSERT_BATCH_SIZE = 200
+ENROLL_CHUNK_SIZE = 4
+# Шаблон студента: эмбеддинг, удалённый от центра больше чем на медиану + TEMPLATE_OUTLIER_MADS * MAD
+# расстояний, считается выбросом (неудачное фото) и не входит в среднее и радиус
+TEMPLATE_OUTLIER_MADS = 3.0
+# С какого числа эмбеддингов студента ищутся выбросы
+TEMPLATE_MIN_ENCODINGS_FOR_OUTLIERS = 3
+# Сколько студентов пересчитывается за один запрос к faces
+TEMPLATE_REFRESH_BATCH_SIZE = 1000
 
-# Подключение к базе данных
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(
-            dbname="attendance",
-            user="dmitry",
-            password="dmitry",
-            host="localhost",
-            port="5432"
+
+# Упаковка эмбеддинга в bytea
+def pack_encoding(encoding: np.ndarray) -> bytes:
+    return np.asarray(encoding, dtype=ENCODING_STORAGE_DTYPE).tobytes()
+
+
+# Распаковка bytea без копирования (тип определяется по длине)
+def unpack_encoding(data) -> np.ndarray:
+    dtype = np.dtype('>f8') if len(data) == 128 * 8 else np.dtype('>f4')
+    return np.frombuffer(data, dtype=dtype)
+
+
+# Эмбеддинг строки faces: bytea, а для ещё не перенесённых строк - JSONB (или FLOAT[] схемы SQL/queries.sql)
+def stored_encoding(binary, jsonb) -> np.ndarray:
+    if binary is not None:
+        return unpack_encoding(binary)
+    if isinstance(jsonb, str):
+        return np.asarray(json.loads(jsonb), dtype=np.float32)
+    return np.asarray(jsonb, dtype=np.float32)
+
+
+# Шаблон студента по всем его эмбеддингам: среднее без выбросов и радиус - наибольшее расстояние
+# от среднего до оставшихся эмбеддингов. Возвращает (шаблон, радиус, число учтённых эмбеддингов)
+def compute_template(encodings: np.ndarray) -> tuple:
+    encodings = np.asarray(encodings, dtype=np.float32)
+    inliers = np.ones(len(encodings), dtype=bool)
+    template = encodings.mean(axis=0)
+    distances = np.linalg.norm(encodings - template, axis=1)
+    if len(encodings) >= TEMPLATE_MIN_ENCODINGS_FOR_OUTLIERS:
+        median = np.median(distances)
+        # 1.4826 * MAD - оценка стандартного отклонения, устойчивая к самим выбросам
+        mad = 1.4826 * np.median(np.abs(distances - median))
+        inliers = distances <= median + TEMPLATE_OUTLIER_MADS * mad
+        template = encodings[inliers].mean(axis=0)
+        distances = np.linalg.norm(encodings - template, axis=1)
+    return template, float(distances[inliers].max()), int(inliers.sum())
+
+
+# Пересчёт шаблонов студентов, чей набор эмбеддингов изменился, в транзакции вызывающего кода.
+# Строки студентов блокируются, чтобы параллельные загрузки одного студента не перезаписали шаблон друг друга
+def refresh_student_templates(cursor, student_ids) -> int:
+    student_ids = sorted(set(int(student_id) for student_id in student_ids))
+    refreshed = 0
+    for i in range(0, len(student_ids), TEMPLATE_REFRESH_BATCH_SIZE):
+        batch = student_ids[i:i + TEMPLATE_REFRESH_BATCH_SIZE]
+        cursor.execute(
+            "SELECT student_id FROM students WHERE student_id = ANY(%s) ORDER BY student_id FOR NO KEY UPDATE",
+            (batch,)
+        )
+        cursor.execute(
+            "SELECT student_id, face_encoding_bin, face_encoding FROM faces WHERE student_id = ANY(%s)",
+            (batch,)
         )
-        psycopg2.extras.register_default_jsonb(conn, globally=False, loads=lambda x: x)
-        return conn
-    except psycopg2.Error as e:
-        logger.error(f"Ошибка подключения к БД: {e}")
-        raise ValueError(f"Не удалось подключиться к базе данных: {str(e)}")
+        encodings = {}
+        for student_id, binary, jsonb in cursor.fetchall():
+            try:
+                encodings.setdefault(student_id, []).append(stored_encoding(binary, jsonb))
+            except Exception as e:
+                logger.error(f"Ошибка чтения эмбеддинга student_id={student_id} для шаблона: {e}")
+        rows = []
+        for student_id, student_encodings in encodings.items():
+            template, radius, inliers = compute_template(np.stack(student_encodings))
+            rows.append((student_id, psycopg2.Binary(pack_encoding(template)), radius, len(student_encodings), inliers))
+        # Шаблоны студентов, у которых не осталось эмбеддингов, удаляются
+        cursor.execute(
+            "DELETE FROM face_templates WHERE student_id = ANY(%s) AND NOT student_id = ANY(%s)",
+            (batch, list(encodings))
+        )
+        if rows:
+            execute_values(cursor, """
+                INSERT INTO face_templates (student_id, template_bin, radius, encodings_count, inliers_count)
+                VALUES %s
+                ON CONFLICT (student_id) DO UPDATE SET
+                    template_bin = EXCLUDED.template_bin,
+                    radius = EXCLUDED.radius,
+                    encodings_count = EXCLUDED.encodings_count,
+                    inliers_count = EXCLUDED.inliers_count,
+                    updated_at = CURRENT_TIMESTAMP
+            """, rows)
+        refreshed += len(rows)
+    return refreshed
+
+
+# Эмбеддинги лиц по содержимому файла: повторная или дублирующая загрузка берётся из кэша без обнаружения
+def encode_image_data(data: bytes, digest: str = None) -> List[np.ndarray]:
+    key = cache_key(digest or content_hash(data), 'full', None)
+    cached = get_face_cache().get(key)
+    if cached is not None:
+        return cached[1]
+    with observe_stage('enrollment', 'decode'):
+        image = face_recognition.load_image_file(io.BytesIO(data))
+    with observe_stage('enrollment', 'detection'):
+        locations = face_recognition.face_locations(image)
+    with observe_stage('enrollment', 'encoding'):
+        encodings = face_recognition.face_encodings(image, known_face_locations=locations)
+    get_face_cache().put(key, locations, encodings)
+    return encodings
 
 
 # Извлечение эмбеддингов лиц
+@observe_stage('enrollment', 'extract_face_encodings')
 def extract_face_encodings(image_path: str) -> List[np.ndarray]:
     try:
-        image = face_recognition.load_image_file(image_path)
-        encodings = face_recognition.face_encodings(image)
+        with open(image_path, 'rb') as f:
+            encodings = encode_image_data(f.read())
         logger.info(f"Найдено {len(encodings)} лиц в изображении: {image_path}")
         return encodings
     except Exception as e:
@@ -40,15 +151,18 @@ def extract_face_encodings(image_path: str) -> List[np.ndarray]:
         return []
 
 
+# image_id по содержимому: одна и та же фотография студента не сохраняется дважды
+def content_image_id(student_id: int, digest: str) -> str:
+    return f"{student_id}_{digest[:16]}"
+
+
 # Сохранение эмбеддингов лиц
+@observe_stage('enrollment', 'save_face_encodings')
 def save_face_encodings(student_id: int, encoding: np.ndarray, image_id: str) -> bool:
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO faces (student_id, face_encoding, image_id) VALUES (%s, %s, %s)",
-            (student_id, Json(encoding.tolist()), image_id)
-        )
+        insert_face_encodings(cursor, [(student_id, encoding, image_id)])
         conn.commit()
         logger.info(f"Сохранён эмбеддинг для student_id={student_id}, image_id={image_id}")
         conn.close()
@@ -108,25 +222,10 @@ def delete_student_photos(student_id: int) -> bool:
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        # Получение image_id для удаления файлов
-        cursor.execute("SELECT image_id FROM faces WHERE student_id = %s", (student_id,))
-        image_ids = [row[0] for row in cursor.fetchall()]
-
-        # Удаление записей из faces
-        cursor.execute("DELETE FROM faces WHERE student_id = %s", (student_id,))
-
-        # Удаление файлов из Uploads
-        uploads_dir = "uploads"
-        for image_id in image_ids:
-            image_path = os.path.join(uploads_dir, f"{image_id}.png")
-            if os.path.exists(image_path):
-                os.remove(image_path)
-                logger.info(f"Удалён файл студента: {image_path}")
-            else:
-                logger.warning(f"Файл не найден: {image_path}")
-
+        image_ids = delete_student_faces(cursor, student_id)
         conn.commit()
         conn.close()
+        remove_student_files(image_ids)
         logger.info(f"Удалены фото для student_id={student_id}")
         return True
     except Exception as e:
@@ -137,63 +236,224 @@ def delete_student_photos(student_id: int) -> bool:
         return False
 
 
-# Удаление отсутствующих изображений
+# Удаление записей faces студента и его шаблона в транзакции вызывающего кода; возвращает image_id
+# для удаления файлов после фиксации
+def delete_student_faces(cursor, student_id: int) -> List[str]:
+    cursor.execute("DELETE FROM faces WHERE student_id = %s RETURNING image_id", (student_id,))
+    image_ids = [row[0] for row in cursor.fetchall()]
+    refresh_student_templates(cursor, [student_id])
+    return image_ids
+
+
+# Удаление файлов фотографий из Uploads
+def remove_student_files(image_ids: List[str]):
+    uploads_dir = "uploads"
+    for image_id in image_ids:
+        image_path = os.path.join(uploads_dir, f"{image_id}.png")
+        if remove_file(image_path):
+            logger.info(f"Удалён файл студента: {image_path}")
+        elif not os.path.exists(image_path):
+            logger.warning(f"Файл не найден: {image_path}")
+
+
+# Удаление записей faces, для которых нет файла в uploads (сверка по множествам, пакетные DELETE)
 def delete_missing_images():
+    # Импорт внутри функции: main_reconcile сам импортирует main_encoding
+    from main_reconcile import reconcile_uploads
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT image_id FROM faces")
-        image_ids = [row[0] for row in cursor.fetchall()]
-        deleted_count = 0
-        uploads_dir = "uploads"
-        for image_id in image_ids:
-            image_path = os.path.join(uploads_dir, f"{image_id}.png")
-            if not os.path.exists(image_path):
-                cursor.execute("DELETE FROM faces WHERE image_id = %s", (image_id,))
-                deleted_count += 1
-                logger.info(f"Удалена запись faces для отсутствующего image_id={image_id}")
-        conn.commit()
-        conn.close()
-        logger.info(f"Удалено {deleted_count} записей для отсутствующих изображений")
+        report = reconcile_uploads(fix_files=False)
+        logger.info(f"Удалено {report['deleted_rows']} записей для отсутствующих изображений")
+        return report
     except Exception as e:
         logger.error(f"Ошибка удаления отсутствующих изображений: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-            conn.close()
 
 
-# Обработка директории
-def process_directory(directory: str, student_id: int = None):
+# Чтение, хэш содержимого и расчёт эмбеддингов одного файла в процессе-воркере массовой загрузки.
+# Возвращает (путь, хэш, эмбеддинги, текст ошибки)
+def _encode_file(image_path: str):
+    digest = None
+    try:
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        digest = content_hash(data)
+        return image_path, digest, encode_image_data(data, digest), None
+    except Exception as e:
+        return image_path, digest, [], str(e)
+
+
+# Чтение манифеста CSV: имя файла -> student_id
+def read_manifest(manifest_path: str) -> dict:
+    manifest = {}
+    with open(manifest_path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[1].strip().isdigit():
+                # Заголовок или пустая строка
+                continue
+            manifest[row[0].strip()] = int(row[1].strip())
+    logger.info(f"Прочитан манифест {manifest_path}: {len(manifest)} файлов")
+    return manifest
+
+
+_face_encoding_type = None
+
+
+# Тип исходного столбца face_encoding: jsonb, ARRAY (FLOAT[] схемы SQL/queries.sql) или '' - столбца нет.
+# Определяется один раз на процесс
+def face_encoding_column_type(cursor) -> str:
+    global _face_encoding_type
+    if _face_encoding_type is None:
+        cursor.execute("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'faces' AND column_name = 'face_encoding'
+        """)
+        row = cursor.fetchone()
+        _face_encoding_type = row[0] if row else ''
+    return _face_encoding_type
+
+
+# Пакетная вставка эмбеддингов одним многострочным INSERT с пересчётом шаблонов затронутых студентов.
+# Копия в face_encoding пишется в формате столбца: Json для JSONB, список (ARRAY[...]) для FLOAT[]
+def insert_face_encodings(cursor, rows: List[tuple]):
+    column_type = face_encoding_column_type(cursor) if WRITE_JSONB_ENCODING else ''
+    if column_type in ('jsonb', 'ARRAY'):
+        execute_values(
+            cursor,
+            "INSERT INTO faces (student_id, face_encoding_bin, face_encoding, image_id) VALUES %s",
+            [
+                (
+                    student_id,
+                    psycopg2.Binary(pack_encoding(encoding)),
+                    Json(encoding.tolist()) if column_type == 'jsonb' else encoding.tolist(),
+                    image_id
+                )
+                for student_id, encoding, image_id in rows
+            ]
+        )
+    else:
+        execute_values(
+            cursor,
+            "INSERT INTO faces (student_id, face_encoding_bin, image_id) VALUES %s",
+            [
+                (student_id, psycopg2.Binary(pack_encoding(encoding)), image_id)
+                for student_id, encoding, image_id in rows
+            ]
+        )
+    refresh_student_templates(cursor, [row[0] for row in rows])
+
+
+# Массовая загрузка фотографий: параллельное декодирование и расчёт эмбеддингов, пакетная запись в БД
+def enroll_directory(directory: str, student_id: int = None, manifest_path: str = None,
+                     workers: int = ENCODING_WORKERS, insert_batch_size: int = ENROLL_INSERT_BATCH_SIZE) -> dict:
+    started = time.monotonic()
+    manifest = read_manifest(manifest_path) if manifest_path else {}
+    stats = {'files': 0, 'enrolled': 0, 'skipped': 0, 'failed': 0}
+    uploads_dir = "uploads"
+    os.makedirs(uploads_dir, exist_ok=True)
+
+    # Файлы без student_id (ни в манифесте, ни по умолчанию) не читаются вовсе; чтение и хэширование
+    # остальных идут в процессах-воркерах вместе с расчётом эмбеддингов
+    tasks = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        stats['files'] += 1
+        target_student_id = manifest.get(filename, student_id)
+        if not target_student_id:
+            logger.warning(f"Пропущено изображение {filename}: не указан student_id")
+            stats['skipped'] += 1
+            continue
+        tasks[os.path.join(directory, filename)] = target_student_id
+
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
-        processed_count = 0
-        uploads_dir = "uploads"
-        os.makedirs(uploads_dir, exist_ok=True)
-
-        for filename in os.listdir(directory):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_path = os.path.join(directory, filename)
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                image_id = f"{timestamp}_{os.path.splitext(filename)[0]}"
-                new_image_path = os.path.join(uploads_dir, f"{image_id}.png")
-
-                # Копирование файла в Uploads
-                from shutil import copyfile
-                copyfile(image_path, new_image_path)
-                logger.info(f"Скопировано изображение: {new_image_path}")
-
-                if student_id and process_single_image(new_image_path, student_id, image_id):
-                    processed_count += 1
-                    logger.info(f"Обработано изображение: {new_image_path}")
-                elif not student_id:
-                    logger.warning(f"Пропущено изображение {new_image_path}: не указан student_id")
+        pending = []
+        source_paths = {}
+        seen = set()
 
-        conn.commit()
+        def flush():
+            # Проверка существующих image_id одним запросом на пакет вместо запроса на каждый файл
+            cursor.execute("SELECT image_id FROM faces WHERE image_id = ANY(%s)", ([row[2] for row in pending],))
+            existing = set(row[0] for row in cursor.fetchall())
+            for image_id in existing:
+                logger.warning(f"image_id {image_id} уже существует")
+            stats['skipped'] += len(existing)
+            pending[:] = [row for row in pending if row[2] not in existing]
+            if not pending:
+                return
+            # Файлы копируются до фиксации транзакции: сверка (main_reconcile) не должна увидеть строку faces
+            # без файла. Свежий файл без строки сверка не трогает (RECONCILE_MIN_FILE_AGE), а при ошибке записи
+            # скопированные файлы удаляются
+            copied = []
+            try:
+                for _, _, image_id in pending:
+                    target_path = os.path.join(uploads_dir, f"{image_id}.png")
+                    copyfile(source_paths[image_id], target_path)
+                    copied.append(target_path)
+                insert_face_encodings(cursor, pending)
+                conn.commit()
+            except Exception:
+                for target_path in copied:
+                    if os.path.exists(target_path):
+                        os.remove(target_path)
+                raise
+            stats['enrolled'] += len(pending)
+            logger.info(f"Записано {stats['enrolled']} эмбеддингов, {stats['enrolled'] / max(time.monotonic() - started, 1e-9):.1f} изображений/с")
+            pending.clear()
+
+        with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=get_context(START_METHOD)) as executor:
+            results = executor.map(_encode_file, list(tasks), chunksize=ENROLL_CHUNK_SIZE)
+            for image_path, digest, encodings, error in results:
+                if error is not None:
+                    logger.error(f"Ошибка извлечения эмбеддингов из {image_path}: {error}")
+                    stats['failed'] += 1
+                    continue
+                target_student_id = tasks[image_path]
+                image_id = content_image_id(target_student_id, digest)
+                # Одна и та же фотография студента в директории дважды
+                if image_id in seen:
+                    logger.warning(f"image_id {image_id} уже существует")
+                    stats['skipped'] += 1
+                    continue
+                seen.add(image_id)
+                if len(encodings) != 1:
+                    logger.warning(f"Ожидалось ровно одно лицо в {image_path}, найдено {len(encodings)}")
+                    stats['failed'] += 1
+                    continue
+                source_paths[image_id] = image_path
+                pending.append((target_student_id, encodings[0], image_id))
+                if len(pending) >= insert_batch_size:
+                    flush()
+        if pending:
+            flush()
+    except Exception as e:
+        logger.error(f"Ошибка обработки директории {directory}: {e}")
+        conn.rollback()
+        raise
+    finally:
         conn.close()
-        logger.info(f"Обработано {processed_count} изображений в директории {directory}")
+
+    stats['seconds'] = round(time.monotonic() - started, 3)
+    stats['files_per_second'] = round(stats['files'] / stats['seconds'], 2) if stats['seconds'] else 0.0
+    logger.info(f"Обработано {stats['enrolled']} изображений в директории {directory}: {stats}")
+    return stats
+
+
+# Обработка директории
+def process_directory(directory: str, student_id: int = None):
+    try:
+        return enroll_directory(directory, student_id=student_id)
     except Exception as e:
         logger.error(f"Ошибка обработки директории {directory}: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-            conn.close()
\ No newline at end of file
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Массовая загрузка фотографий студентов")
+    parser.add_argument('directory', help="Директория с фотографиями")
+    parser.add_argument('--student-id', type=int, help="student_id для файлов, которых нет в манифесте")
+    parser.add_argument('--manifest', help="CSV-файл: имя файла, student_id")
+    parser.add_argument('--workers', type=int, default=ENCODING_WORKERS, help="Число процессов расчёта эмбеддингов")
+    parser.add_argument('--batch-size', type=int, default=ENROLL_INSERT_BATCH_SIZE, help="Строк в одном INSERT")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    print(json.dumps(enroll_directory(args.directory, args.student_id, args.manifest, args.workers, args.batch_size)))
@@ -0,0 +1,116 @@
+import numpy as np
+import os
+import hashlib
+import logging
+import threading
+from typing import List
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Кэш результатов обнаружения и эмбеддингов по хэшу содержимого изображения
+FACE_CACHE_DIR = "cache/faces"
+# Предельный размер кэша на диске; при превышении удаляются давно не использованные записи
+FACE_CACHE_MAX_BYTES = int(os.environ.get('FACE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+
+# SHA-256 содержимого изображения
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# Ключ кэша: хэш содержимого и параметры обнаружения, влияющие на результат
+def cache_key(digest: str, *params) -> str:
+    if not params:
+        return digest
+    return f"{digest}_{hashlib.md5(repr(params).encode('utf-8')).hexdigest()[:12]}"
+
+
+# Дисковый кэш (рамки лиц, эмбеддинги) с вытеснением по времени последнего использования
+class FaceCache:
+    def __init__(self, directory: str = FACE_CACHE_DIR, max_bytes: int = FACE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                locations = [tuple(int(v) for v in box) for box in data['locations']]
+                encodings = list(data['encodings'])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Повреждённая запись кэша лиц {path}: {e}")
+            return None
+        try:
+            # Время изменения файла служит отметкой последнего использования для LRU
+            os.utime(path)
+        except OSError:
+            pass
+        return locations, encodings
+
+    def put(self, key: str, locations: List[tuple], encodings: List[np.ndarray]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    locations=np.asarray(locations, dtype=np.int64).reshape(-1, 4),
+                    encodings=np.asarray(encodings, dtype=np.float64).reshape(-1, 128)
+                )
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Ошибка записи в кэш лиц {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size += os.path.getsize(path)
+            if self._size is None or self._size > self.max_bytes:
+                self._evict()
+
+    # Пересчёт размера по каталогу (кэш общий для нескольких процессов) и удаление старейших записей
+    def _evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.npz'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        self._size = sum(size for _, size, _ in entries)
+        if self._size <= self.max_bytes:
+            return
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        logger.info(f"Кэш лиц: удалено {removed} записей, размер {self._size} байт")
+
+
+_face_cache = None
+_face_cache_lock = threading.Lock()
+
+
+# Общий кэш лиц процесса
+def get_face_cache() -> FaceCache:
+    global _face_cache
+    with _face_cache_lock:
+        if _face_cache is None:
+            _face_cache = FaceCache()
+        return _face_cache
@@ -0,0 +1,682 @@
+import numpy as np
+import os
+import logging
+import threading
+import time
+from typing import List, Optional
+from main_db import get_db_connection
+from main_encoding import unpack_encoding, stored_encoding
+from main_ann import IVFIndex, pairwise_distances, measure_recall
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+ENCODING_SIZE = 128
+# Сколько строк галереи обрабатывается за один шаг сравнения (ограничивает память на матрицу расстояний)
+MATCH_BLOCK_ROWS = 65536
+# Значение group_id для студентов без группы (только внутри галереи, наружу отдаётся None)
+NO_GROUP = -1
+# Максимальная задержка (сек), с которой изменения таблицы faces доходят до галереи процесса
+GALLERY_SYNC_INTERVAL = 2.0
+# Сколько секунд ждать пропущенный change_id (транзакция ещё не закоммичена) перед тем как забыть о нём
+GALLERY_GAP_TIMEOUT = 60.0
+# Окно change_id, в котором при полной загрузке ищутся пропуски
+GALLERY_GAP_WINDOW = 1000
+# Срок хранения журнала faces_changes; галерея, не синхронизировавшаяся дольше, перезагружается целиком
+GALLERY_CHANGES_RETENTION_HOURS = 24
+# Как часто (сек) процесс удаляет из faces_changes записи старше срока хранения
+GALLERY_CHANGES_PRUNE_INTERVAL = 3600
+# С какого размера галереи поиск идёт через приближённый IVF-индекс, а не точным перебором
+ANN_MIN_GALLERY_SIZE = 50000
+# Файл индекса, чтобы после перезапуска не обучать его заново
+GALLERY_INDEX_PATH = "cache/face_index.npz"
+# Как часто (сек) изменённый индекс сохраняется на диск
+GALLERY_INDEX_SAVE_INTERVAL = 600
+# Пауза (сек) перед повторным построением индекса после ошибки; удваивается с каждой ошибкой подряд до предела
+GALLERY_INDEX_RETRY_DELAY = 60
+GALLERY_INDEX_RETRY_MAX_DELAY = 3600
+# Режим проверки: каждый поиск по индексу дублируется точным перебором, полнота пишется в лог
+GALLERY_VERIFY_RECALL = False
+# Режим сопоставления: faces - с каждым эмбеддингом таблицы faces, templates - с одним шаблоном на студента
+GALLERY_MATCH_MODES = ('faces', 'templates')
+GALLERY_MATCH_MODE = os.environ.get('GALLERY_MATCH_MODE', 'faces')
+# В режиме templates расстояние до найденного студента уточняется по его исходным эмбеддингам
+TEMPLATE_RERANK = os.environ.get('TEMPLATE_RERANK', '1').lower() in ('1', 'true')
+
+
+GALLERY_SELECT = """
+    SELECT f.face_id, s.student_id, s.full_name, s.group_id, f.face_encoding_bin, f.face_encoding
+    FROM faces f
+    JOIN students s ON f.student_id = s.student_id
+"""
+
+TEMPLATE_SELECT = """
+    SELECT t.student_id, s.full_name, s.group_id, t.template_bin, t.radius
+    FROM face_templates t
+    JOIN students s ON t.student_id = s.student_id
+"""
+
+
+# group_id строки галереи для результатов сопоставления: студент без группы - None, как в таблице students
+def public_group_id(group_id) -> Optional[int]:
+    return None if group_id == NO_GROUP else int(group_id)
+
+
+# Разбор строки faces в вектор галереи: bytea, а для ещё не перенесённых строк - JSONB
+def parse_encoding(row) -> np.ndarray:
+    encoding = stored_encoding(row[4], row[5])
+    if encoding.shape != (ENCODING_SIZE,):
+        raise ValueError(f"неверная размерность {encoding.shape}")
+    return encoding
+
+
+# Шаблоны студентов из face_templates: один вектор и радиус (до самого дальнего эмбеддинга без выбросов) на студента.
+# Изменения редки (только при загрузке и удалении фото), поэтому матрица для поиска
+# пересобирается целиком при первом поиске после изменения
+class StudentTemplates:
+    def __init__(self):
+        self._entries = {}
+        self._arrays = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries = {}
+        self._arrays = None
+
+    def upsert(self, db_row):
+        student_id, full_name, group_id, template_bin, radius = db_row
+        template = unpack_encoding(template_bin).astype(np.float32)
+        if template.shape != (ENCODING_SIZE,):
+            logger.error(f"Неверная размерность шаблона student_id {student_id}: {template.shape}")
+            self.remove(student_id)
+            return
+        self._entries[student_id] = (template, float(radius), full_name, group_id if group_id is not None else NO_GROUP)
+        self._arrays = None
+
+    def remove(self, student_id: int):
+        if self._entries.pop(student_id, None) is not None:
+            self._arrays = None
+
+    def _build(self) -> dict:
+        if self._arrays is None:
+            entries = list(self._entries.items())
+            encodings = np.array([entry[0] for _, entry in entries], dtype=np.float32).reshape(-1, ENCODING_SIZE)
+            group_ids = np.array([entry[3] for _, entry in entries], dtype=np.int64)
+            order = np.argsort(group_ids, kind='stable')
+            groups, starts = np.unique(group_ids[order], return_index=True)
+            self._arrays = {
+                'encodings': encodings,
+                'sq_norms': np.einsum('ij,ij->i', encodings, encodings),
+                'student_ids': np.array([student_id for student_id, _ in entries], dtype=np.int64),
+                'radii': np.array([entry[1] for _, entry in entries], dtype=np.float32),
+                'full_names': [entry[2] for _, entry in entries],
+                'group_ids': group_ids,
+                'group_rows': dict(zip(groups.tolist(), np.split(order, starts[1:])))
+            }
+        return self._arrays
+
+    # Поиск шаблонов: для каждого запроса список (строка шаблона, расстояние) по возрастанию.
+    # С margin=True порог каждого шаблона расширяется на его радиус (кандидаты для уточнения по эмбеддингам):
+    # по неравенству треугольника в кандидаты попадает каждый студент, у которого ближе tolerance
+    # эмбеддинг из радиуса шаблона
+    def search(self, queries: np.ndarray, tolerance: float, margin: bool = False, group_id: int = None) -> List[List[tuple]]:
+        arrays = self._build()
+        hits = [[] for _ in range(len(queries))]
+        if group_id is None:
+            rows = np.arange(len(arrays['student_ids']))
+        else:
+            rows = arrays['group_rows'].get(group_id, np.zeros(0, dtype=np.int64))
+        for start in range(0, len(rows), MATCH_BLOCK_ROWS):
+            block = rows[start:start + MATCH_BLOCK_ROWS]
+            distances = pairwise_distances(queries, arrays['encodings'][block], arrays['sq_norms'][block])
+            limits = tolerance + arrays['radii'][block] if margin else tolerance
+            face_idx, row_idx = np.nonzero(distances <= limits)
+            for i, j in zip(face_idx.tolist(), row_idx.tolist()):
+                hits[i].append((int(block[j]), float(distances[i, j])))
+        for face_hits in hits:
+            face_hits.sort(key=lambda hit: hit[1])
+        return hits
+
+    # Вектор и радиус шаблона
+    def template(self, row: int) -> tuple:
+        arrays = self._build()
+        return arrays['encodings'][row], float(arrays['radii'][row])
+
+    def describe(self, row: int) -> dict:
+        arrays = self._build()
+        return {
+            'student_id': int(arrays['student_ids'][row]),
+            'full_name': arrays['full_names'][row],
+            'group_id': public_group_id(arrays['group_ids'][row])
+        }
+
+
+# Галерея эмбеддингов лиц в памяти процесса
+class FaceGallery:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self._last_change_id = 0
+        self._gaps = {}
+        self._last_sync = 0.0
+        self._sync_requested = False
+        self._index = None
+        self._index_dirty = False
+        self._index_saved_at = 0.0
+        self._index_building = False
+        self._index_generation = 0
+        self._index_saved_generation = 0
+        self._index_save_lock = threading.Lock()
+        self._index_failures = 0
+        self._index_retry_at = 0.0
+        self._changes_pruned_at = None
+        self._templates = StudentTemplates()
+        self._reset(0)
+
+    def __len__(self):
+        return self._size
+
+    # Число ошибок построения IVF-индекса подряд (0 - последнее построение успешно или ещё не выполнялось)
+    def index_build_failures(self) -> int:
+        return self._index_failures
+
+    # Число шаблонов студентов (строк поиска в режиме templates)
+    def templates_count(self) -> int:
+        return len(self._templates)
+
+    # Непрерывная матрица N×128 и параллельные массивы метаданных (с запасом ёмкости под добавления)
+    def _reset(self, capacity: int):
+        capacity = max(capacity, 16)
+        self._encodings = np.zeros((capacity, ENCODING_SIZE), dtype=np.float32)
+        self._sq_norms = np.zeros(capacity, dtype=np.float32)
+        self._face_ids = np.zeros(capacity, dtype=np.int64)
+        self._student_ids = np.zeros(capacity, dtype=np.int64)
+        self._group_ids = np.zeros(capacity, dtype=np.int64)
+        self._full_names = np.empty(capacity, dtype=object)
+        self._row_of = {}
+        self._group_rows = None
+        self._student_rows = None
+        self._size = 0
+
+    def _grow(self):
+        capacity = len(self._face_ids) * 2
+        self._encodings = np.concatenate([self._encodings, np.zeros_like(self._encodings)])
+        self._sq_norms = np.resize(self._sq_norms, capacity)
+        self._face_ids = np.resize(self._face_ids, capacity)
+        self._student_ids = np.resize(self._student_ids, capacity)
+        self._group_ids = np.resize(self._group_ids, capacity)
+        full_names = np.empty(capacity, dtype=object)
+        full_names[:self._size] = self._full_names[:self._size]
+        self._full_names = full_names
+
+    @property
+    def encodings(self) -> np.ndarray:
+        return self._encodings[:self._size]
+
+    @property
+    def sq_norms(self) -> np.ndarray:
+        return self._sq_norms[:self._size]
+
+    @property
+    def face_ids(self) -> np.ndarray:
+        return self._face_ids[:self._size]
+
+    @property
+    def student_ids(self) -> np.ndarray:
+        return self._student_ids[:self._size]
+
+    @property
+    def group_ids(self) -> np.ndarray:
+        return self._group_ids[:self._size]
+
+    @property
+    def full_names(self) -> np.ndarray:
+        return self._full_names[:self._size]
+
+    def _write_row(self, row: int, face_id: int, encoding: np.ndarray, student_id: int, full_name: str, group_id):
+        self._encodings[row] = encoding
+        self._sq_norms[row] = float(np.dot(self._encodings[row], self._encodings[row]))
+        self._face_ids[row] = face_id
+        self._student_ids[row] = student_id
+        self._group_ids[row] = group_id if group_id is not None else NO_GROUP
+        self._full_names[row] = full_name
+        self._row_of[face_id] = row
+        self._group_rows = None
+        self._student_rows = None
+
+    # Добавление или замена строки по face_id
+    def _upsert_row(self, db_row):
+        face_id = db_row[0]
+        try:
+            encoding = parse_encoding(db_row)
+        except Exception as e:
+            logger.error(f"Ошибка обработки face_encoding для face_id {face_id}: {e}")
+            self._remove_row(face_id)
+            return
+        row = self._row_of.get(face_id)
+        if row is None:
+            if self._size == len(self._face_ids):
+                self._grow()
+            row = self._size
+            self._size += 1
+        self._write_row(row, face_id, encoding, db_row[1], db_row[2], db_row[3])
+        if self._index is not None:
+            self._index.add([face_id], encoding[None, :])
+            self._index_dirty = True
+
+    # Удаление строки: на её место переносится последняя строка матрицы
+    def _remove_row(self, face_id: int):
+        row = self._row_of.pop(face_id, None)
+        if row is None:
+            return
+        if self._index is not None:
+            self._index.remove([face_id])
+            self._index_dirty = True
+        last = self._size - 1
+        if row != last:
+            for array in (self._encodings, self._sq_norms, self._face_ids, self._student_ids, self._group_ids, self._full_names):
+                array[row] = array[last]
+            self._row_of[int(self._face_ids[row])] = row
+        self._full_names[last] = None
+        self._size = last
+        self._group_rows = None
+        self._student_rows = None
+
+    # Разбиение галереи по группам: group_id -> номера строк (перестраивается после изменений)
+    def _group_partition(self) -> dict:
+        if self._group_rows is None:
+            order = np.argsort(self.group_ids, kind='stable')
+            groups, starts = np.unique(self.group_ids[order], return_index=True)
+            self._group_rows = dict(zip(groups.tolist(), np.split(order, starts[1:])))
+        return self._group_rows
+
+    # Разбиение галереи по студентам: student_id -> номера строк (для уточнения совпадений с шаблонами)
+    def _student_partition(self) -> dict:
+        if self._student_rows is None:
+            order = np.argsort(self.student_ids, kind='stable')
+            students, starts = np.unique(self.student_ids[order], return_index=True)
+            self._student_rows = dict(zip(students.tolist(), np.split(order, starts[1:])))
+        return self._student_rows
+
+    # Точный перебор только по строкам одной группы
+    def _group_search(self, queries: np.ndarray, group_id: int, tolerance: float, top_k: int = None) -> List[List[tuple]]:
+        hits = [[] for _ in range(len(queries))]
+        rows = self._group_partition().get(group_id)
+        if rows is None or len(rows) == 0:
+            return hits
+        distances = pairwise_distances(queries, self._encodings[rows], self._sq_norms[rows])
+        face_idx, row_idx = np.nonzero(distances <= tolerance)
+        for i, j in zip(face_idx.tolist(), row_idx.tolist()):
+            hits[i].append((int(rows[j]), float(distances[i, j])))
+        for i, face_hits in enumerate(hits):
+            face_hits.sort(key=lambda hit: hit[1])
+            if top_k is not None:
+                hits[i] = face_hits[:top_k]
+        return hits
+
+    # Полная загрузка галереи из таблицы faces
+    def load(self):
+        with self._lock:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                # Курсор журнала берётся до чтения faces: изменения, попавшие в оба чтения, применяются идемпотентно
+                cursor.execute("SELECT COALESCE(MAX(change_id), 0) FROM faces_changes")
+                last_change_id = cursor.fetchone()[0]
+                cursor.execute(
+                    "SELECT change_id FROM faces_changes WHERE change_id > %s",
+                    (max(last_change_id - GALLERY_GAP_WINDOW, 0),)
+                )
+                recent_change_ids = [row[0] for row in cursor.fetchall()]
+                cursor.execute(GALLERY_SELECT)
+                rows = cursor.fetchall()
+                cursor.execute(TEMPLATE_SELECT)
+                template_rows = cursor.fetchall()
+            finally:
+                conn.close()
+
+            self._index = None
+            self._reset(len(rows))
+            for row in rows:
+                self._upsert_row(row)
+            self._templates.clear()
+            for row in template_rows:
+                self._templates.upsert(row)
+            self._attach_index()
+            self._last_change_id = max(last_change_id - GALLERY_GAP_WINDOW, 0)
+            self._gaps = {}
+            self._advance_cursor(recent_change_ids)
+            self._last_change_id = max(self._last_change_id, last_change_id)
+            self._last_sync = time.monotonic()
+            self._sync_requested = False
+            self.loaded = True
+            logger.info(f"Галерея лиц загружена: {len(self)} эмбеддингов, {len(self._templates)} шаблонов, change_id={self._last_change_id}")
+
+    # Продвижение курсора журнала с учётом ещё не закоммиченных change_id
+    def _advance_cursor(self, change_ids: List[int]):
+        now = time.monotonic()
+        for change_id in change_ids:
+            self._gaps.pop(change_id, None)
+        new_ids = set(change_id for change_id in change_ids if change_id > self._last_change_id)
+        if new_ids:
+            top = max(new_ids)
+            for change_id in range(self._last_change_id + 1, top):
+                if change_id not in new_ids:
+                    self._gaps[change_id] = now
+            self._last_change_id = top
+        # Пропуски от откатившихся транзакций не заполнятся никогда
+        for change_id, seen_at in list(self._gaps.items()):
+            if now - seen_at > GALLERY_GAP_TIMEOUT:
+                del self._gaps[change_id]
+
+    # Инкрементальное применение изменений из журнала faces_changes
+    def sync(self):
+        with self._lock:
+            if not self.loaded or time.monotonic() - self._last_sync > GALLERY_CHANGES_RETENTION_HOURS * 3600:
+                self.load()
+                return
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT change_id, face_id FROM faces_changes
+                    WHERE change_id > %s OR change_id = ANY(%s)
+                    ORDER BY change_id
+                """, (self._last_change_id, list(self._gaps)))
+                changes = cursor.fetchall()
+                face_ids = sorted(set(row[1] for row in changes))
+                current = {}
+                students = set()
+                templates = {}
+                if face_ids:
+                    cursor.execute(GALLERY_SELECT + " WHERE f.face_id = ANY(%s)", (face_ids,))
+                    current = {row[0]: row for row in cursor.fetchall()}
+                    # Шаблон пересчитывается в той же транзакции, что и faces: перечитываются шаблоны студентов
+                    # изменённых строк, включая прежних владельцев удалённых и перенесённых строк
+                    students.update(row[1] for row in current.values())
+                    students.update(int(self._student_ids[self._row_of[face_id]]) for face_id in face_ids if face_id in self._row_of)
+                    cursor.execute(TEMPLATE_SELECT + " WHERE t.student_id = ANY(%s)", (sorted(students),))
+                    templates = {row[0]: row for row in cursor.fetchall()}
+                # Журнал чистится и во время работы, а не только при запуске API: записи старше срока хранения
+                # не нужны ни одному процессу, так как отставшая дольше галерея перезагружается целиком
+                if self._changes_pruned_at is None or time.monotonic() - self._changes_pruned_at >= GALLERY_CHANGES_PRUNE_INTERVAL:
+                    self._prune_changes(conn)
+            finally:
+                conn.close()
+
+            # Берётся текущее состояние строки, поэтому порядок и повторы записей журнала не важны
+            for face_id in face_ids:
+                if face_id in current:
+                    self._upsert_row(current[face_id])
+                else:
+                    self._remove_row(face_id)
+            for student_id in students:
+                if student_id in templates:
+                    self._templates.upsert(templates[student_id])
+                else:
+                    self._templates.remove(student_id)
+            self._advance_cursor([row[0] for row in changes])
+            self._last_sync = time.monotonic()
+            self._sync_requested = False
+            if face_ids:
+                logger.info(f"Галерея лиц обновлена: {len(face_ids)} изменений, всего {len(self)} эмбеддингов")
+            if self._index is None:
+                self._attach_index()
+            elif self._index_dirty and time.monotonic() - self._index_saved_at >= GALLERY_INDEX_SAVE_INTERVAL:
+                self._save_index()
+
+    # Удаление записей журнала faces_changes старше GALLERY_CHANGES_RETENTION_HOURS
+    def _prune_changes(self, conn):
+        self._changes_pruned_at = time.monotonic()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM faces_changes WHERE changed_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'",
+                (GALLERY_CHANGES_RETENTION_HOURS,)
+            )
+            conn.commit()
+            if cursor.rowcount:
+                logger.info(f"Из журнала faces_changes удалено {cursor.rowcount} устаревших записей")
+        except Exception as e:
+            # Ошибка очистки не мешает синхронизации, попытка повторится через GALLERY_CHANGES_PRUNE_INTERVAL
+            logger.error(f"Ошибка очистки журнала faces_changes: {e}")
+            conn.rollback()
+
+    # Подключение IVF-индекса для большой галереи: загрузка с диска или обучение идут в фоновом потоке,
+    # а поиск до готовности индекса выполняется точным перебором. После ошибки повтор откладывается
+    def _attach_index(self):
+        if len(self) < ANN_MIN_GALLERY_SIZE or self._index_building or time.monotonic() < self._index_retry_at:
+            return
+        self._index_building = True
+        # Снимок галереи: обучение идёт без блокировки, изменения за это время учтёт сверка
+        encodings = self.encodings.copy()
+        face_ids = self.face_ids.copy()
+
+        def build():
+            try:
+                index = None
+                if os.path.exists(GALLERY_INDEX_PATH):
+                    try:
+                        index = IVFIndex.load(GALLERY_INDEX_PATH)
+                    except Exception as e:
+                        logger.error(f"Ошибка загрузки IVF-индекса {GALLERY_INDEX_PATH}: {e}")
+                if index is None:
+                    index = IVFIndex.train(encodings)
+                    index.add(face_ids, encodings)
+                with self._lock:
+                    if len(self) >= ANN_MIN_GALLERY_SIZE:
+                        self._reconcile_index(index)
+                        self._index = index
+                        self._index_dirty = True
+                        self._save_index()
+                    self._index_failures = 0
+            except Exception as e:
+                with self._lock:
+                    self._index_failures += 1
+                    delay = min(GALLERY_INDEX_RETRY_DELAY * 2 ** (self._index_failures - 1), GALLERY_INDEX_RETRY_MAX_DELAY)
+                    self._index_retry_at = time.monotonic() + delay
+                logger.error(f"Ошибка построения IVF-индекса (подряд {self._index_failures}), повтор через {delay} сек: {e}")
+            finally:
+                with self._lock:
+                    self._index_building = False
+
+        threading.Thread(target=build, name='face-index-build', daemon=True).start()
+
+    # Сверка индекса с текущей галереей (под блокировкой): строки, изменившиеся пока процесс был остановлен
+    # или пока индекс строился, переиндексируются
+    def _reconcile_index(self, index: IVFIndex):
+        exported = index.export()
+        common, index_pos, gallery_pos = np.intersect1d(exported['ids'], self.face_ids, return_indices=True)
+        changed = common[np.any(exported['vectors'][index_pos] != self.encodings[gallery_pos], axis=1)]
+        stale = np.setdiff1d(exported['ids'], self.face_ids)
+        index.remove(np.concatenate([stale, changed]).tolist())
+        missing_rows = np.flatnonzero(~np.isin(self.face_ids, common) | np.isin(self.face_ids, changed))
+        index.add(self.face_ids[missing_rows], self.encodings[missing_rows])
+        logger.info(f"IVF-индекс сверён с галереей: удалено {len(stale)}, обновлено {len(changed)}, добавлено {len(missing_rows) - len(changed)}")
+
+    # Сохранение индекса в фоновом потоке по снимку, снятому под блокировкой. Сохранения идут по очереди,
+    # а снимок, оказавшийся старее уже записанного, не сохраняется
+    def _save_index(self):
+        exported = self._index.export()
+        self._index_dirty = False
+        self._index_saved_at = time.monotonic()
+        self._index_generation += 1
+        generation = self._index_generation
+
+        def save():
+            with self._index_save_lock:
+                if generation <= self._index_saved_generation:
+                    return
+                try:
+                    IVFIndex.save_exported(exported, GALLERY_INDEX_PATH)
+                    self._index_saved_generation = generation
+                except Exception as e:
+                    logger.error(f"Ошибка сохранения IVF-индекса {GALLERY_INDEX_PATH}: {e}")
+
+        threading.Thread(target=save, daemon=True).start()
+
+    # Сброс галереи, следующий запрос перезагрузит её из БД
+    def invalidate(self):
+        with self._lock:
+            self.loaded = False
+
+    # Синхронизация при следующем запросе без ожидания интервала (после записи в этом процессе)
+    def request_sync(self):
+        self._sync_requested = True
+
+    def ensure_fresh(self):
+        with self._lock:
+            if not self.loaded:
+                self.load()
+            elif self._sync_requested or time.monotonic() - self._last_sync >= GALLERY_SYNC_INTERVAL:
+                try:
+                    self.sync()
+                except Exception as e:
+                    logger.error(f"Ошибка синхронизации галереи лиц: {e}")
+
+    # Точный перебор: для каждого запроса список (строка галереи, расстояние) по возрастанию
+    def _exact_search(self, queries: np.ndarray, tolerance: float, top_k: int = None) -> List[List[tuple]]:
+        hits = [[] for _ in range(len(queries))]
+        for start in range(0, len(self), MATCH_BLOCK_ROWS):
+            stop = min(start + MATCH_BLOCK_ROWS, len(self))
+            distances = pairwise_distances(queries, self._encodings[start:stop], self._sq_norms[start:stop])
+            face_idx, row_idx = np.nonzero(distances <= tolerance)
+            for i, j in zip(face_idx.tolist(), row_idx.tolist()):
+                hits[i].append((start + j, float(distances[i, j])))
+        for i, face_hits in enumerate(hits):
+            face_hits.sort(key=lambda hit: hit[1])
+            if top_k is not None:
+                hits[i] = face_hits[:top_k]
+        return hits
+
+    # Поиск через IVF-индекс с переводом face_id в строки галереи
+    def _index_search(self, queries: np.ndarray, tolerance: float, top_k: int = None) -> List[List[tuple]]:
+        return [
+            [(self._row_of[face_id], distance) for face_id, distance in face_hits if face_id in self._row_of]
+            for face_hits in self._index.search(queries, tolerance, top_k)
+        ]
+
+    def _search(self, queries: np.ndarray, tolerance: float, top_k: int = None) -> List[List[tuple]]:
+        if self._index is None or len(self) < ANN_MIN_GALLERY_SIZE:
+            return self._exact_search(queries, tolerance, top_k)
+        hits = self._index_search(queries, tolerance, top_k)
+        if GALLERY_VERIFY_RECALL:
+            recall = measure_recall(hits, self._exact_search(queries, tolerance, top_k))
+            logger.info(f"Полнота IVF-индекса относительно точного перебора: {recall:.3f} на {len(queries)} запросах")
+        return hits
+
+    # Проверка полноты IVF-индекса на случайной выборке эмбеддингов галереи
+    def verify_recall(self, sample_size: int = 1000, tolerance: float = 0.5, top_k: int = None, seed: int = 0) -> float:
+        self.ensure_fresh()
+        with self._lock:
+            if self._index is None or len(self) == 0:
+                return 1.0
+            rng = np.random.default_rng(seed)
+            rows = rng.choice(len(self), min(sample_size, len(self)), replace=False)
+            queries = self.encodings[rows].copy()
+            recall = measure_recall(
+                self._index_search(queries, tolerance, top_k),
+                self._exact_search(queries, tolerance, top_k)
+            )
+        logger.info(f"Полнота IVF-индекса: {recall:.3f} на {len(queries)} запросах")
+        return recall
+
+    # Эмбеддинги студента в пределах радиуса шаблона: выбросы, отброшенные при расчёте шаблона, в уточнении не участвуют
+    def _inlier_rows(self, template_row: int, rows: np.ndarray) -> np.ndarray:
+        template, radius = self._templates.template(template_row)
+        distances = np.linalg.norm(self._encodings[rows] - template, axis=1)
+        # Запас на округление радиуса, хранящегося в REAL
+        return rows[distances <= radius + 1e-4]
+
+    # Уточнение кандидатов-шаблонов по исходным эмбеддингам студента: расстояние - до ближайшего из них.
+    # Кандидаты отобраны с порогом tolerance + радиус, поэтому студент с эмбеддингом из радиуса шаблона
+    # ближе tolerance не теряется; выбросы (неудачные фото) совпадением не считаются
+    def _rerank(self, queries: np.ndarray, hits: List[List[tuple]], tolerance: float) -> List[List[tuple]]:
+        student_rows = self._student_partition()
+        reranked = []
+        for query, face_hits in zip(queries, hits):
+            candidates = [(row, student_rows.get(self._templates.describe(row)['student_id'])) for row, _ in face_hits]
+            candidates = [
+                (row, self._inlier_rows(row, rows)) for row, rows in candidates if rows is not None and len(rows)
+            ]
+            candidates = [(row, rows) for row, rows in candidates if len(rows)]
+            if not candidates:
+                reranked.append([])
+                continue
+            rows = np.concatenate([rows for _, rows in candidates])
+            distances = pairwise_distances(query[None, :], self._encodings[rows], self._sq_norms[rows])[0]
+            starts = np.cumsum([0] + [len(rows) for _, rows in candidates[:-1]])
+            nearest = np.minimum.reduceat(distances, starts)
+            face_hits = [(row, float(distance)) for (row, _), distance in zip(candidates, nearest) if distance <= tolerance]
+            face_hits.sort(key=lambda hit: hit[1])
+            reranked.append(face_hits)
+        return reranked
+
+    # Сопоставление с шаблонами: не больше одного совпадения на студента
+    def _match_templates(self, queries: np.ndarray, tolerance: float, top_k: int, group_id: int, rerank: bool) -> List[List[dict]]:
+        def search(query_rows, scope):
+            hits = self._templates.search(queries[query_rows], tolerance, margin=rerank, group_id=scope)
+            return self._rerank(queries[query_rows], hits, tolerance) if rerank else hits
+
+        hits = search(np.arange(len(queries)), group_id)
+        if group_id is not None:
+            unmatched = [i for i, face_hits in enumerate(hits) if not face_hits]
+            if unmatched:
+                for i, face_hits in zip(unmatched, search(np.asarray(unmatched), None)):
+                    hits[i] = face_hits
+        return [
+            [{**self._templates.describe(row), 'distance': distance} for row, distance in face_hits[:top_k]]
+            for face_hits in hits
+        ]
+
+    # Сопоставление всех найденных лиц с галереей одним пакетным вычислением.
+    # С group_id сначала ищется в строках группы, глобальный поиск - только для лиц без совпадения в группе.
+    # mode='templates' сравнивает с одним шаблоном на студента, rerank уточняет расстояние по его эмбеддингам
+    def match(self, encodings: List[np.ndarray], tolerance: float = 0.5, top_k: int = None, group_id: int = None,
+              mode: str = None, rerank: bool = None) -> List[List[dict]]:
+        mode = mode or GALLERY_MATCH_MODE
+        if mode not in GALLERY_MATCH_MODES:
+            raise ValueError(f"Неизвестный режим сопоставления: {mode}")
+        self.ensure_fresh()
+        if len(encodings) == 0:
+            return []
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+
+        with self._lock:
+            if mode == 'templates':
+                return self._match_templates(queries, tolerance, top_k, group_id, TEMPLATE_RERANK if rerank is None else rerank)
+            if group_id is None:
+                hits = self._search(queries, tolerance, top_k)
+            else:
+                hits = self._group_search(queries, group_id, tolerance, top_k)
+                unmatched = [i for i, face_hits in enumerate(hits) if not face_hits]
+                if unmatched:
+                    for i, face_hits in zip(unmatched, self._search(queries[unmatched], tolerance, top_k)):
+                        hits[i] = face_hits
+            return [
+                [
+                    {
+                        'student_id': int(self._student_ids[row]),
+                        'full_name': self._full_names[row],
+                        'group_id': public_group_id(self._group_ids[row]),
+                        'distance': distance
+                    }
+                    for row, distance in face_hits
+                ]
+                for face_hits in hits
+            ]
+
+
+_gallery = None
+_gallery_lock = threading.Lock()
+
+
+# Общая галерея процесса
+def get_gallery() -> FaceGallery:
+    global _gallery
+    with _gallery_lock:
+        if _gallery is None:
+            _gallery = FaceGallery()
+        return _gallery
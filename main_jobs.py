@@ -0,0 +1,141 @@
+import os
+import uuid
+import time
+import queue
+import logging
+import threading
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Сколько заданий может ждать в очереди; при переполнении новые задания отклоняются
+JOB_QUEUE_MAX_DEPTH = int(os.environ.get('JOB_QUEUE_MAX_DEPTH', '20'))
+# Сколько заданий выполняется одновременно
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+# Сколько секунд хранится результат завершённого задания
+JOB_RESULT_TTL = 600
+
+
+class QueueFullError(Exception):
+    pass
+
+
+# Задание очереди: статус, прогресс и результат
+class Job:
+    def __init__(self, func, args: tuple, kwargs: dict):
+        self.job_id = str(uuid.uuid4())
+        self.status = 'queued'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+
+    # Колбэк прогресса, передаётся в выполняемую функцию
+    def update_progress(self, stage: str, **info):
+        with self._lock:
+            self.progress = {'stage': stage, **info}
+
+    def run(self):
+        with self._lock:
+            self.status = 'running'
+        try:
+            result = self._func(*self._args, progress=self.update_progress, **self._kwargs)
+            with self._lock:
+                self.result = result
+                self.status = 'done'
+        except Exception as e:
+            logger.error(f"Ошибка выполнения задания {self.job_id}: {e}")
+            with self._lock:
+                self.error = str(e)
+                self.status = 'failed'
+        finally:
+            with self._lock:
+                self.finished_at = time.time()
+                # Входные данные (например, байты изображения) больше не нужны
+                self._args = ()
+                self._kwargs = {}
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            data = {
+                'job_id': self.job_id,
+                'status': self.status,
+                'progress': dict(self.progress),
+                'created_at': self.created_at,
+                'finished_at': self.finished_at
+            }
+            if self.status == 'done':
+                # Результат задания - словарь полей ответа (results и т.п.)
+                data.update(self.result)
+            if self.status == 'failed':
+                data['error'] = self.error
+            return data
+
+
+# Ограниченная очередь заданий с фиксированным числом потоков-исполнителей
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, max_depth: int = JOB_QUEUE_MAX_DEPTH):
+        self.workers = max(1, workers)
+        self._queue = queue.Queue(maxsize=max(1, max_depth))
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+            finally:
+                self._queue.task_done()
+
+    # Удаление завершённых заданий старше JOB_RESULT_TTL
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > JOB_RESULT_TTL:
+                del self._jobs[job_id]
+
+    def submit(self, func, *args, **kwargs) -> Job:
+        job = Job(func, args, kwargs)
+        with self._lock:
+            self._start()
+            self._prune()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError(f"Очередь заданий заполнена ({self._queue.maxsize})")
+            self._jobs[job.job_id] = job
+        logger.info(f"Задание {job.job_id} поставлено в очередь, в очереди {self._queue.qsize()}")
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+# Общая очередь заданий процесса
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
@@ -0,0 +1,127 @@
+import os
+import re
+import logging
+from datetime import datetime
+from typing import List
+from main_pagination import encode_cursor, decode_cursor, PaginationError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+# Формат строки лога: "%(asctime)s - %(levelname)s - %(message)s"
+LOG_LINE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - (\w+) - (.*)$')
+# Сколько строк отдаётся без явного limit и сколько можно запросить за раз
+LOG_DEFAULT_LIMIT = 200
+LOG_MAX_LIMIT = 5000
+# Файл читается с конца блоками такого размера
+LOG_READ_BLOCK_SIZE = 64 * 1024
+# Сколько байт просматривается за один запрос; при жёстких фильтрах страница может оказаться неполной,
+# продолжение - по next_cursor
+LOG_SCAN_MAX_BYTES = 8 * 1024 * 1024
+
+
+# Активный файл лога и ротированные копии (.1, .2, ...) от новых к старым
+def log_files(path: str, backup_count: int) -> List[str]:
+    files = [path] + [f"{path}.{i}" for i in range(1, backup_count + 1)]
+    return [file for file in files if os.path.exists(file)]
+
+
+# Строки файла от конца к началу: (смещение начала строки, байты строки). end - читать только до этого смещения
+def iter_lines_reverse(f, end: int = None, block_size: int = LOG_READ_BLOCK_SIZE):
+    f.seek(0, os.SEEK_END)
+    position = f.tell() if end is None else min(end, f.tell())
+    buffer = b''
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        f.seek(position)
+        buffer = f.read(read_size) + buffer
+        lines = buffer.split(b'\n')
+        # Первая строка блока может продолжаться в предыдущем блоке
+        buffer = lines[0]
+        line_end = position + len(buffer)
+        for line in reversed(lines[1:]):
+            line_end += len(line) + 1
+        for line in reversed(lines[1:]):
+            start = line_end - len(line)
+            yield start, line
+            line_end = start - 1
+    if buffer:
+        yield 0, buffer
+
+
+# Разбор строки лога; строки другого формата (трассировки исключений) - без времени и уровня
+def parse_log_line(line: str) -> dict:
+    match = LOG_LINE_RE.match(line)
+    if not match:
+        return {'timestamp': None, 'level': None, 'message': line}
+    return {'timestamp': match.group(1), 'level': match.group(2), 'message': match.group(3)}
+
+
+# Граница времени из параметра запроса (ISO 8601) в формате asctime для сравнения строк
+def parse_log_time(value: str) -> str:
+    try:
+        return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S,%f')[:23]
+    except ValueError:
+        raise PaginationError(f"Недопустимое время: {value}")
+
+
+# Выборка строк лога от новых к старым с фильтрами. Файлы читаются с конца и только до набора limit строк;
+# курсор - (inode файла, смещение строки), поэтому он остаётся верным после ротации
+class LogQuery:
+    def __init__(self, path: str, backup_count: int, limit: int = LOG_DEFAULT_LIMIT, levels: List[str] = None,
+                 since: str = None, until: str = None, search: str = None, cursor: str = None):
+        self.files = log_files(path, backup_count)
+        self.limit = limit
+        self.levels = set(levels) if levels else None
+        self.since = since
+        self.until = until
+        self.search = search.lower() if search else None
+        self.start = decode_cursor(cursor, (int, int)) if cursor else None
+        # Курсор проверяется сразу, до начала потоковой выдачи
+        self.first_index, self.end = self._start_position()
+        self.next_cursor = None
+
+    def _matches(self, record: dict) -> bool:
+        if self.levels is not None and record['level'] not in self.levels:
+            return False
+        if self.until is not None and (record['timestamp'] is None or record['timestamp'] > self.until):
+            return False
+        if self.search is not None and self.search not in record['message'].lower():
+            return False
+        return True
+
+    def _start_position(self) -> tuple:
+        if self.start is None:
+            return 0, None
+        inode, offset = self.start
+        for index, path in enumerate(self.files):
+            if os.stat(path).st_ino == inode:
+                return index, offset
+        raise PaginationError('Курсор устарел: файл лога удалён ротацией')
+
+    def __iter__(self):
+        first_index, end = self.first_index, self.end
+        returned = 0
+        scanned = 0
+        for index in range(first_index, len(self.files)):
+            with open(self.files[index], 'rb') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                for offset, raw in iter_lines_reverse(f, end if index == first_index else None):
+                    scanned += len(raw) + 1
+                    line = raw.decode('utf-8', errors='replace').rstrip('\r')
+                    if not line.strip():
+                        continue
+                    record = parse_log_line(line)
+                    # Записи упорядочены по времени: дальше только более старые
+                    if self.since is not None and record['timestamp'] is not None and record['timestamp'] < self.since:
+                        return
+                    if self._matches(record):
+                        yield record
+                        returned += 1
+                    if returned >= self.limit or scanned >= LOG_SCAN_MAX_BYTES:
+                        # Курсор на начало файла ведёт к следующему, более старому файлу
+                        if offset > 0 or index + 1 < len(self.files):
+                            self.next_cursor = encode_cursor([inode, offset])
+                        return
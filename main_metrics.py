@@ -0,0 +1,152 @@
+import time
+import logging
+import threading
+from typing import Dict
+from contextlib import contextmanager
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм длительности (сек) и числа лиц на изображении
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FACES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+# Значения меток в формате Prometheus
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+# Гистограмма с метками: по набору значений меток - счётчики корзин, сумма и число наблюдений
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = dict(key)
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': bound})} {count}")
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': '+Inf'})} {series['count']}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {series['sum']}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {series['count']}")
+        return lines
+
+
+# Метрики процесса: гистограммы и значения, снимаемые в момент запроса /metrics
+class Metrics:
+    def __init__(self):
+        self.stage_seconds = Histogram(
+            'face_stage_duration_seconds', 'Длительность этапа обработки изображения'
+        )
+        self.request_seconds = Histogram(
+            'face_request_duration_seconds', 'Полная длительность обработки изображения'
+        )
+        self.faces = Histogram('face_faces_per_image', 'Число лиц на изображении', FACES_BUCKETS)
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    # Значение, вычисляемое при каждом запросе /metrics (размер галереи, пул соединений и т.п.)
+    def gauge(self, name: str, help_text: str, func):
+        with self._lock:
+            self._gauges[name] = (help_text, func)
+
+    def render(self) -> str:
+        lines = self.stage_seconds.render() + self.request_seconds.render() + self.faces.render()
+        with self._lock:
+            gauges = list(self._gauges.items())
+        for name, (help_text, func) in gauges:
+            try:
+                value = func()
+            except Exception as e:
+                logger.error(f"Ошибка расчёта метрики {name}: {e}")
+                continue
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"])
+        return '\n'.join(lines) + '\n'
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+# Общие метрики процесса
+def get_metrics() -> Metrics:
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+# Замер одного этапа вне запроса (используется и как декоратор): длительность сразу попадает в гистограмму
+@contextmanager
+def observe_stage(pipeline: str, stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_metrics().stage_seconds.observe(time.perf_counter() - started, pipeline=pipeline, stage=stage)
+
+
+# Замер этапов одного запроса. Этапы, выполняемые по пакетам, суммируются;
+# в гистограммы попадают итоги запроса при вызове finish()
+class StageTimer:
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.stages: Dict[str, float] = {}
+        self.info = {}
+        self._started = time.perf_counter()
+        self._finished = None
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    # Дополнительные сведения запроса: число лиц, размер галереи и т.п.
+    def set(self, **info):
+        self.info.update(info)
+
+    def finish(self) -> dict:
+        if self._finished is None:
+            self._finished = time.perf_counter() - self._started
+            metrics = get_metrics()
+            for name, seconds in self.stages.items():
+                metrics.stage_seconds.observe(seconds, pipeline=self.pipeline, stage=name)
+            metrics.request_seconds.observe(self._finished, pipeline=self.pipeline)
+            if 'faces' in self.info:
+                metrics.faces.observe(self.info['faces'], pipeline=self.pipeline)
+        return self.to_dict()
+
+    # Блок timings ответа: длительности в миллисекундах
+    def to_dict(self) -> dict:
+        total = self._finished if self._finished is not None else time.perf_counter() - self._started
+        return {
+            'total_ms': round(total * 1000, 1),
+            'stages_ms': {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+            **self.info
+        }
@@ -0,0 +1,55 @@
+import json
+import base64
+from typing import List
+
+# Размер страницы по умолчанию и предельный размер, который может запросить клиент
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+# Ошибка параметров постраничной выдачи (ответ 400)
+class PaginationError(ValueError):
+    pass
+
+
+# Курсор - значения ключа сортировки последней строки страницы, закодированные в непрозрачную строку
+def encode_cursor(values: list) -> str:
+    data = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+# Разбор курсора; types - ожидаемые типы значений ключа по порядку
+def decode_cursor(token: str, types: tuple) -> list:
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(data.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise PaginationError('Недопустимый курсор')
+    if not isinstance(values, list) or len(values) != len(types) or \
+            not all(isinstance(value, value_type) for value, value_type in zip(values, types)):
+        raise PaginationError('Недопустимый курсор')
+    return values
+
+
+# Параметры страницы из запроса: (limit, значения ключа после курсора или None)
+def parse_page(args, types: tuple, default_limit: int = DEFAULT_PAGE_SIZE) -> tuple:
+    try:
+        limit = int(args.get('limit', default_limit))
+    except ValueError:
+        raise PaginationError('Недопустимый limit')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise PaginationError(f"limit должен быть от 1 до {MAX_PAGE_SIZE}")
+    cursor = args.get('cursor')
+    return limit, decode_cursor(cursor, types) if cursor else None
+
+
+# Набор полей ответа из параметра fields=a,b,c; без параметра - все поля
+def parse_fields(args, allowed: tuple) -> List[str]:
+    requested = args.get('fields')
+    if not requested:
+        return list(allowed)
+    fields = [field.strip() for field in requested.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        raise PaginationError(f"Неизвестные поля: {', '.join(unknown)}")
+    return fields
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import logging
+import argparse
+from main_db import get_db_connection
+from main_cleanup import remove_file
+from main_encoding import refresh_student_templates
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Каталог фотографий студентов: файл <image_id>.png на каждое значение faces.image_id
+UPLOADS_DIR = "uploads"
+UPLOAD_EXTENSION = ".png"
+# Сколько записей удаляется одним DELETE
+RECONCILE_DELETE_BATCH_SIZE = 1000
+# Файлы моложе этого возраста (сек) не считаются сиротами: загрузка могла ещё не записать строку в faces
+RECONCILE_MIN_FILE_AGE = 3600
+# Сколько image_id каждого вида попадает в отчёт
+RECONCILE_REPORT_LIMIT = 100
+
+
+# image_id файлов каталога за один проход os.scandir. Отсутствующий каталог - ошибка,
+# а не пустое множество: иначе сверка удалила бы все строки faces
+def upload_image_ids(directory: str = UPLOADS_DIR) -> set:
+    with os.scandir(directory) as entries:
+        return {
+            entry.name[:-len(UPLOAD_EXTENSION)] for entry in entries
+            if entry.name.endswith(UPLOAD_EXTENSION) and entry.is_file()
+        }
+
+
+# Сверка таблицы faces с каталогом загрузок: строки без файла и файлы без строки.
+# Обе разности считаются по множествам; исправление - пакетные DELETE и удаление файлов.
+# dry_run=True только возвращает отчёт
+def reconcile_uploads(directory: str = UPLOADS_DIR, dry_run: bool = False, fix_rows: bool = True,
+                      fix_files: bool = True, batch_size: int = RECONCILE_DELETE_BATCH_SIZE,
+                      min_file_age: float = RECONCILE_MIN_FILE_AGE) -> dict:
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT image_id FROM faces")
+        db_ids = {row[0] for row in cursor.fetchall()}
+        file_ids = upload_image_ids(directory)
+
+        # Разности перепроверяются по одному файлу: за время сверки загрузка или удаление фото могли завершиться
+        missing_files = sorted(
+            image_id for image_id in db_ids - file_ids
+            if not os.path.exists(os.path.join(directory, f"{image_id}{UPLOAD_EXTENSION}"))
+        )
+        orphan_files = []
+        recent_files = []
+        cutoff = time.time() - min_file_age
+        for image_id in sorted(file_ids - db_ids):
+            try:
+                mtime = os.stat(os.path.join(directory, f"{image_id}{UPLOAD_EXTENSION}")).st_mtime
+            except FileNotFoundError:
+                continue
+            (orphan_files if mtime < cutoff else recent_files).append(image_id)
+
+        deleted_rows = 0
+        if fix_rows and not dry_run:
+            affected_students = set()
+            for i in range(0, len(missing_files), batch_size):
+                cursor.execute(
+                    "DELETE FROM faces WHERE image_id = ANY(%s) RETURNING student_id",
+                    (missing_files[i:i + batch_size],)
+                )
+                affected_students.update(row[0] for row in cursor.fetchall() if row[0] is not None)
+                deleted_rows += cursor.rowcount
+            refresh_student_templates(cursor, affected_students)
+            conn.commit()
+        # Файлы удаляются после фиксации транзакции: при ошибке БД сиротами остаются только файлы
+        deleted_files = 0
+        if fix_files and not dry_run:
+            deleted_files = sum(
+                remove_file(os.path.join(directory, f"{image_id}{UPLOAD_EXTENSION}")) for image_id in orphan_files
+            )
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    report = {
+        'dry_run': dry_run,
+        'db_images': len(db_ids),
+        'files': len(file_ids),
+        'missing_files': len(missing_files),
+        'orphan_files': len(orphan_files),
+        'recent_files': len(recent_files),
+        'deleted_rows': deleted_rows,
+        'deleted_files': deleted_files,
+        'missing_files_sample': missing_files[:RECONCILE_REPORT_LIMIT],
+        'orphan_files_sample': orphan_files[:RECONCILE_REPORT_LIMIT],
+        'elapsed_s': round(time.perf_counter() - started, 3)
+    }
+    logger.info(
+        f"Сверка faces и {directory}{' (без изменений)' if dry_run else ''}: строк без файла {len(missing_files)}, "
+        f"файлов без строки {len(orphan_files)}, удалено строк {deleted_rows}, файлов {deleted_files}"
+    )
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сверка таблицы faces с каталогом загрузок")
+    parser.add_argument('--directory', default=UPLOADS_DIR, help="Каталог фотографий студентов")
+    parser.add_argument('--dry-run', action='store_true', help="Только отчёт, без удаления")
+    parser.add_argument('--rows-only', action='store_true', help="Удалять только строки faces без файла")
+    parser.add_argument('--files-only', action='store_true', help="Удалять только файлы без строки faces")
+    parser.add_argument('--batch-size', type=int, default=RECONCILE_DELETE_BATCH_SIZE, help="Строк в одном DELETE")
+    parser.add_argument('--min-file-age', type=float, default=RECONCILE_MIN_FILE_AGE,
+                        help="Не удалять файлы моложе этого возраста (сек)")
+    args = parser.parse_args()
+    if args.rows_only and args.files_only:
+        parser.error("--rows-only и --files-only взаимоисключающие")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    print(json.dumps(reconcile_uploads(
+        args.directory, dry_run=args.dry_run, fix_rows=not args.files_only, fix_files=not args.rows_only,
+        batch_size=args.batch_size, min_file_age=args.min_file_age
+    ), ensure_ascii=False, indent=2))
@@ -0,0 +1,122 @@
+import logging
+from datetime import date, timedelta
+from main_db import get_db_connection
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Разрезы отчёта: ключ группировки и справочник с названием
+REPORT_GROUPINGS = {
+    'student': ('student_id', "LEFT JOIN students n ON n.student_id = c.student_id", "n.full_name", 'full_name'),
+    'subject': ('subject_id', "LEFT JOIN subjects n ON n.subject_id = c.subject_id", "n.subject_name", 'subject_name'),
+    'group': ('group_id', "LEFT JOIN groups n ON n.group_id = c.group_id", "n.group_name", 'group_name')
+}
+
+
+# Первое число месяца
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+# Первое число следующего месяца
+def next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+# Разбиение диапазона [date_from, date_to] на полные месяцы из сводки и неполные края из attendance.
+# Возвращает (первый полный месяц, месяц после последнего полного, диапазоны дат для attendance); None - без границы
+def split_range(date_from: date = None, date_to: date = None) -> tuple:
+    full_from = None if date_from is None else (date_from if date_from.day == 1 else next_month(date_from))
+    full_to = None if date_to is None else month_start(date_to + timedelta(days=1))
+    if full_from is not None and full_to is not None and full_from >= full_to:
+        return None, None, [(date_from, date_to)]
+    raw_ranges = []
+    if date_from is not None and date_from < full_from:
+        raw_ranges.append((date_from, full_from - timedelta(days=1)))
+    if date_to is not None and full_to <= date_to:
+        raw_ranges.append((full_to, date_to))
+    return full_from, full_to, raw_ranges
+
+
+# Отчёт о посещаемости: число отметок present/absent и доля присутствия в разрезе студента, предмета или группы.
+# Полные месяцы берутся из attendance_monthly_summary (поддерживается триггером), неполные края - из attendance.
+# Учитываются только сделанные отметки: студент без отметки за занятие в отчёт не попадает
+def attendance_report(group_by: str, date_from: date = None, date_to: date = None,
+                      group_id: int = None, subject_id: int = None, student_id: int = None) -> list:
+    if group_by not in REPORT_GROUPINGS:
+        raise ValueError(f"Неизвестный разрез отчёта: {group_by}")
+    key, join, name_column, name_field = REPORT_GROUPINGS[group_by]
+
+    filters = []
+    filter_params = []
+    for column, value in (('group_id', group_id), ('subject_id', subject_id), ('student_id', student_id)):
+        if value is not None:
+            filters.append(f"{column} = %s")
+            filter_params.append(value)
+
+    full_from, full_to, raw_ranges = split_range(date_from, date_to)
+    parts = []
+    params = []
+
+    if not (full_from is None and full_to is None and raw_ranges):
+        conditions = list(filters)
+        part_params = list(filter_params)
+        if full_from is not None:
+            conditions.append("month >= %s")
+            part_params.append(full_from)
+        if full_to is not None:
+            conditions.append("month < %s")
+            part_params.append(full_to)
+        parts.append(f"""
+            SELECT {key}, present, absent FROM attendance_monthly_summary
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        """)
+        params.extend(part_params)
+
+    for range_from, range_to in raw_ranges:
+        conditions = list(filters)
+        part_params = list(filter_params)
+        if range_from is not None:
+            conditions.append("attendance_date >= %s")
+            part_params.append(range_from)
+        if range_to is not None:
+            conditions.append("attendance_date <= %s")
+            part_params.append(range_to)
+        parts.append(f"""
+            SELECT {key}, (status = 'present')::int AS present, (status = 'absent')::int AS absent FROM attendance
+            WHERE {' AND '.join(conditions)}
+        """)
+        params.extend(part_params)
+
+    query = f"""
+        SELECT c.{key}, {name_column}, c.present, c.absent
+        FROM (
+            SELECT {key}, SUM(present) AS present, SUM(absent) AS absent
+            FROM ({' UNION ALL '.join(parts)}) counts
+            GROUP BY {key}
+            HAVING SUM(present + absent) > 0
+        ) c
+        {join}
+        ORDER BY {name_column}, c.{key}
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    report = []
+    for row_key, name, present, absent in rows:
+        total = present + absent
+        report.append({
+            key: row_key,
+            name_field: name,
+            'present': present,
+            'absent': absent,
+            'total': total,
+            'rate': round(present / total, 4)
+        })
+    logger.info(f"Отчёт о посещаемости по {group_by}: {len(report)} строк, {len(parts)} частей запроса")
+    return report
@@ -0,0 +1,110 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from functools import wraps
+from collections import OrderedDict
+from flask import request, make_response
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Время жизни закэшированного ответа (сек). Сброс при записи действует в своём процессе,
+# остальные процессы API видят изменения не позже чем через TTL
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '60'))
+# Предельное число закэшированных ответов (разные фильтры и страницы - разные записи)
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+
+
+# ETag по содержимому ответа
+def make_etag(body: bytes) -> str:
+    return hashlib.sha1(body).hexdigest()
+
+
+# Кэш ответов GET-маршрутов справочных данных с TTL и сбросом по тегу
+class ResponseCache:
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Версия тега растёт при каждом сбросе: ответ, посчитанный до сброса, не попадает в кэш
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, tag: str) -> int:
+        with self._lock:
+            return self._versions.get(tag, 0)
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, tag, version, body, etag = entry
+            if expires_at < time.monotonic() or version != self._versions.get(tag, 0):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return body, etag
+
+    def put(self, key: tuple, tag: str, version: int, body: bytes, etag: str):
+        with self._lock:
+            if version != self._versions.get(tag, 0):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, tag, version, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Сброс всех ответов с указанными тегами (вызывается маршрутами, изменяющими данные)
+    def invalidate(self, *tags: str):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+            self._entries = OrderedDict(
+                (key, entry) for key, entry in self._entries.items() if entry[1] not in tags
+            )
+        logger.info(f"Сброшен кэш ответов: {', '.join(tags)}")
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+# Общий кэш ответов процесса
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+
+# Декоратор GET-маршрута: успешный ответ кэшируется по пути и параметрам запроса,
+# ETag позволяет браузеру получить 304 без тела при совпадении If-None-Match
+def cached_response(tag: str):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_response_cache()
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            cached = cache.get(key)
+            if cached is not None:
+                body, etag = cached
+                response = make_response(body)
+                response.mimetype = 'application/json'
+            else:
+                version = cache.version(tag)
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                etag = make_etag(body)
+                cache.put(key, tag, version, body, etag)
+            response.set_etag(etag)
+            # Браузер хранит ответ, но перепроверяет его при каждом запросе через If-None-Match
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
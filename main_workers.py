@@ -0,0 +1,131 @@
+import face_recognition
+import numpy as np
+import os
+import math
+import atexit
+import logging
+import threading
+from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, get_all_start_methods, shared_memory
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Число процессов для расчёта эмбеддингов (по умолчанию - все ядра)
+ENCODING_WORKERS = int(os.environ.get('ENCODING_WORKERS', os.cpu_count() or 1))
+# Максимальный размер пакета лиц, отправляемого одному процессу
+ENCODING_BATCH_SIZE = int(os.environ.get('ENCODING_BATCH_SIZE', '50'))
+# Воркеры запускаются из чистого процесса forkserver, а не форком многопоточного Flask
+START_METHOD = 'forkserver' if 'forkserver' in get_all_start_methods() else 'spawn'
+
+
+# Расчёт эмбеддингов пакета лиц
+def _encode_batch(image: np.ndarray, batch_locations: List[tuple]) -> List[np.ndarray]:
+    return face_recognition.face_encodings(image, known_face_locations=batch_locations)
+
+
+# Вызов функции в процессе-воркере над изображением из общей памяти
+def _call_on_shared_image(func, shm_name: str, shape: tuple, dtype: str, args: tuple):
+    # resource_tracker общий с родителем: сегмент удаляет только родительский процесс после сбора результатов
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        image = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        result = func(image, *args)
+        del image
+        return result
+    finally:
+        shm.close()
+
+
+# Параллельный расчёт эмбеддингов: пакеты лиц распределяются по процессам, порядок результата сохраняется
+class EncodingEngine:
+    def __init__(self, workers: int = ENCODING_WORKERS, batch_size: int = ENCODING_BATCH_SIZE):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context(START_METHOD))
+                logger.info(f"Запущен пул расчёта эмбеддингов: {self.workers} процессов ({START_METHOD})")
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    # Разбиение на пакеты: не больше batch_size лиц и не меньше одного пакета на воркер
+    def split(self, locations: List[tuple]) -> List[List[tuple]]:
+        size = min(self.batch_size, max(1, math.ceil(len(locations) / self.workers)))
+        return [locations[i:i + size] for i in range(0, len(locations), size)]
+
+    def encode(self, image: np.ndarray, locations: List[tuple]) -> List[np.ndarray]:
+        encodings = []
+        for _, batch_encodings in self.iter_encode(image, locations):
+            encodings.extend(batch_encodings)
+        return encodings
+
+    # Эмбеддинги по пакетам в исходном порядке: (рамки пакета, эмбеддинги), каждый пакет - как только готов
+    def iter_encode(self, image: np.ndarray, locations: List[tuple]):
+        batches = self.split(locations)
+        results = self.imap_image(_encode_batch, image, [(batch,) for batch in batches])
+        for batch_index, (batch, batch_encodings) in enumerate(zip(batches, results)):
+            logger.info(f"Обработан пакет {batch_index}: найдено {len(batch_encodings)} лиц")
+            yield batch, batch_encodings
+
+    # Параллельный вызов func(image, *args) для каждого набора аргументов; изображение передаётся через общую память
+    def map_image(self, func, image: np.ndarray, args_list: List[tuple]) -> list:
+        return list(self.imap_image(func, image, args_list))
+
+    # То же, что map_image, но результаты отдаются по мере готовности в порядке args_list
+    def imap_image(self, func, image: np.ndarray, args_list: List[tuple]):
+        if self.workers == 1 or len(args_list) <= 1:
+            for args in args_list:
+                yield func(image, *args)
+            return
+
+        image = np.ascontiguousarray(image)
+        shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+        futures = []
+        try:
+            np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+            executor = self._get_executor()
+            futures = [
+                executor.submit(_call_on_shared_image, func, shm.name, image.shape, image.dtype.str, args)
+                for args in args_list
+            ]
+            for future in futures:
+                yield future.result()
+        except BrokenProcessPool:
+            logger.error("Пул расчёта эмбеддингов аварийно завершён, будет перезапущен")
+            self._reset_executor()
+            raise
+        finally:
+            # Если потребитель остановился раньше (клиент закрыл поток), ещё не начатые пакеты отменяются
+            for future in futures:
+                future.cancel()
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        self._reset_executor()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+# Общий движок расчёта эмбеддингов процесса
+def get_encoding_engine() -> EncodingEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = EncodingEngine()
+            atexit.register(_engine.shutdown)
+        return _engine
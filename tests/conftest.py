@@ -0,0 +1,13 @@
+import os
+import sys
+import types
+
+# Модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Чистым функциям face_recognition (dlib) не нужен: без установленного пакета модули импортируются
+# с пустым модулем, а тесты, которым нужно обнаружение, подменяют его функции
+try:
+    import face_recognition  # noqa: F401
+except ImportError:
+    sys.modules['face_recognition'] = types.ModuleType('face_recognition')
@@ -0,0 +1,45 @@
+import io
+import time
+import numpy as np
+from PIL import Image
+from main_crops import CropStore
+
+IMAGE_KEY = 'a' * 64 + '_' + 'b' * 12
+
+
+def png_image():
+    image = np.zeros((200, 300, 3), dtype=np.uint8)
+    image[50:150, 100:200] = 200
+    output = io.BytesIO()
+    Image.fromarray(image).save(output, format='PNG')
+    return output.getvalue(), image
+
+
+def test_thumbnail_from_other_process(tmp_path):
+    data, image = png_image()
+    CropStore(directory=str(tmp_path)).put(IMAGE_KEY, data, image, [(50, 200, 150, 100)])
+    # Другой процесс: пустая память, общий каталог
+    other = CropStore(directory=str(tmp_path))
+    thumbnail = other.thumbnail(IMAGE_KEY, 0, size=40)
+    assert Image.open(io.BytesIO(thumbnail)).size == (40, 40)
+    assert other.thumbnail(IMAGE_KEY, 1) is None
+    assert len(other) == 1
+
+
+def test_thumbnail_expires_and_rejects_unknown_keys(tmp_path):
+    data, image = png_image()
+    CropStore(directory=str(tmp_path)).put(IMAGE_KEY, data, image, [(50, 200, 150, 100)])
+    store = CropStore(ttl=0.01, directory=str(tmp_path))
+    time.sleep(0.05)
+    assert store.thumbnail(IMAGE_KEY, 0) is None
+    assert store.thumbnail('../' + IMAGE_KEY, 0) is None
+
+
+def test_thumbnails_count_against_memory_limit(tmp_path):
+    data, image = png_image()
+    store = CropStore(max_bytes=image.nbytes * 2, directory=str(tmp_path))
+    store.put(IMAGE_KEY, data, image, [(50, 200, 150, 100)])
+    store.thumbnail(IMAGE_KEY, 0, size=64, fmt='jpeg')
+    store.thumbnail(IMAGE_KEY, 0, size=64, fmt='webp')
+    entry = store._entries[IMAGE_KEY]
+    assert store._size == image.nbytes + sum(len(thumbnail) for thumbnail in entry['thumbnails'].values())
@@ -0,0 +1,67 @@
+import numpy as np
+import main_detection
+from main_detection import tile_grid, merge_locations, map_locations, detect_faces, DETECTION_TILE_OVERLAP
+from main_workers import EncodingEngine
+
+
+# Детектор-заглушка: лицо - квадрат со значением 255, находится только целиком попавшим в изображение
+def fake_face_locations(image, number_of_times_to_upsample=1, model='hog'):
+    ys, xs = np.nonzero(image[:, :, 0] == 255)
+    if len(ys) == 0:
+        return []
+    top, bottom, left, right = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+    if top == 0 or left == 0 or bottom == image.shape[0] or right == image.shape[1]:
+        return []
+    return [(int(top), int(right), int(bottom), int(left))]
+
+
+def test_tile_grid_single_tile():
+    assert tile_grid((600, 800), tile_size=1024) == [(0, 0, 600, 800)]
+
+
+def test_tile_grid_covers_image_with_even_overlap():
+    for width in (1025, 1500, 2000, 2048, 4000, 6000):
+        tiles = tile_grid((500, width), tile_size=1024, overlap=320)
+        xs = [(x, tile_width) for _, x, _, tile_width in tiles]
+        assert xs[0][0] == 0
+        assert xs[-1][0] + xs[-1][1] == width
+        assert all(tile_width <= 1024 for _, tile_width in xs)
+        overlaps = [xs[i][0] + xs[i][1] - xs[i + 1][0] for i in range(len(xs) - 1)]
+        # Равный шаг: перекрытия отличаются не больше чем на пиксель округления
+        assert min(overlaps) >= 320
+        assert max(overlaps) - min(overlaps) <= 1
+
+
+def test_tile_grid_has_no_near_duplicate_tiles():
+    # Раньше для ширины 2000 получались начала 0, 832, 976
+    starts = [x for _, x, _, _ in tile_grid((500, 2000), tile_size=1024, overlap=192)]
+    steps = [b - a for a, b in zip(starts, starts[1:])]
+    assert len(starts) == 3
+    assert max(steps) - min(steps) <= 1
+
+
+def test_every_face_up_to_overlap_fits_in_one_tile():
+    tiles = tile_grid((500, 3000))
+    for left in range(0, 3000 - DETECTION_TILE_OVERLAP, 7):
+        right = left + DETECTION_TILE_OVERLAP
+        assert any(x <= left and right <= x + width for _, x, _, width in tiles)
+
+
+def test_merge_locations_keeps_larger_box():
+    full = (100, 400, 400, 100)
+    partial = (100, 400, 400, 250)
+    other = (100, 900, 300, 700)
+    assert merge_locations([partial, full, other]) == [full, other]
+
+
+def test_map_locations_scales_and_clips():
+    assert map_locations([(10, 20, 30, 5)], 0.5, 100, 200, (120, 300)) == [(120, 240, 120, 210)]
+
+
+def test_tiles_find_face_straddling_tile_edge(monkeypatch):
+    monkeypatch.setattr(main_detection.face_recognition, 'face_locations', fake_face_locations, raising=False)
+    monkeypatch.setattr(main_detection, 'get_encoding_engine', lambda: EncodingEngine(workers=1))
+    image = np.zeros((600, 2000, 3), dtype=np.uint8)
+    # Лицо первого ряда 300px на границе первого тайла (x = 1024)
+    image[150:450, 820:1120] = 255
+    assert detect_faces(image, mode='tiles') == [(150, 1120, 450, 820)]
@@ -0,0 +1,34 @@
+import json
+import numpy as np
+from main_encoding import pack_encoding, unpack_encoding, stored_encoding, content_image_id
+
+
+def test_pack_is_big_endian_float32():
+    encoding = np.arange(128, dtype=np.float64) / 128
+    data = pack_encoding(encoding)
+    assert len(data) == 512
+    # Тот же порядок байт, что у float4send в PostgreSQL
+    assert data[4:8] == np.array([1 / 128], dtype='>f4').tobytes()
+
+
+def test_pack_unpack_round_trip():
+    encoding = np.random.default_rng(0).standard_normal(128).astype(np.float32)
+    assert np.array_equal(unpack_encoding(pack_encoding(encoding)), encoding)
+    assert np.array_equal(unpack_encoding(memoryview(pack_encoding(encoding))), encoding)
+
+
+def test_unpack_float64_by_length():
+    encoding = np.random.default_rng(1).standard_normal(128)
+    assert np.array_equal(unpack_encoding(encoding.astype('>f8').tobytes()), encoding)
+
+
+def test_stored_encoding_prefers_binary_then_jsonb_or_array():
+    encoding = np.linspace(-1, 1, 128).astype(np.float32)
+    values = encoding.tolist()
+    assert np.array_equal(stored_encoding(pack_encoding(encoding), json.dumps([0.0] * 128)), encoding)
+    assert np.allclose(stored_encoding(None, json.dumps(values)), encoding)
+    assert np.allclose(stored_encoding(None, values), encoding)
+
+
+def test_content_image_id():
+    assert content_image_id(7, 'ab' * 32) == '7_' + 'ab' * 8
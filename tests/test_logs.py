@@ -0,0 +1,58 @@
+import io
+import pytest
+from main_logs import iter_lines_reverse, parse_log_line, parse_log_time, LogQuery
+from main_pagination import PaginationError
+
+
+def write_log(path, records):
+    path.write_text(''.join(f"2024-05-01 10:00:{second:02d},000 - {level} - {message}\n"
+                            for second, level, message in records), encoding='utf-8')
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 7, 64 * 1024])
+def test_iter_lines_reverse_offsets(block_size):
+    data = b"first\nsecond line\n\nthird"
+    lines = list(iter_lines_reverse(io.BytesIO(data), block_size=block_size))
+    assert lines == [(19, b'third'), (18, b''), (6, b'second line'), (0, b'first')]
+    for offset, line in lines:
+        assert data[offset:offset + len(line)] == line
+
+
+def test_iter_lines_reverse_stops_at_end():
+    data = b"a\nbb\nccc\n"
+    # Строки после смещения end (курсор) не читаются
+    assert list(iter_lines_reverse(io.BytesIO(data), end=5, block_size=2)) == [(5, b''), (2, b'bb'), (0, b'a')]
+
+
+def test_parse_log_line_and_time():
+    assert parse_log_line("2024-05-01 10:00:00,123 - ERROR - boom") == {
+        'timestamp': '2024-05-01 10:00:00,123', 'level': 'ERROR', 'message': 'boom'
+    }
+    assert parse_log_line("Traceback (most recent call last):")['level'] is None
+    assert parse_log_time('2024-05-01T10:00:05') == '2024-05-01 10:00:05,000'
+    with pytest.raises(PaginationError):
+        parse_log_time('yesterday')
+
+
+def test_log_query_filters_newest_first(tmp_path):
+    path = tmp_path / 'app.log'
+    write_log(path, [(1, 'INFO', 'start'), (2, 'ERROR', 'db down'), (3, 'INFO', 'ok'), (4, 'ERROR', 'DB again')])
+    records = list(LogQuery(str(path), 0, levels=['ERROR'], search='db'))
+    assert [record['message'] for record in records] == ['DB again', 'db down']
+    since = parse_log_time('2024-05-01T10:00:03')
+    assert [record['message'] for record in LogQuery(str(path), 0, since=since)] == ['DB again', 'ok']
+
+
+def test_log_query_cursor_pages_across_rotated_files(tmp_path):
+    path = tmp_path / 'app.log'
+    write_log(tmp_path / 'app.log.1', [(1, 'INFO', 'one'), (2, 'INFO', 'two')])
+    write_log(path, [(3, 'INFO', 'three'), (4, 'INFO', 'four')])
+    messages = []
+    cursor = None
+    while True:
+        query = LogQuery(str(path), 1, limit=3, cursor=cursor)
+        messages.extend(record['message'] for record in query)
+        cursor = query.next_cursor
+        if cursor is None:
+            break
+    assert messages == ['four', 'three', 'two', 'one']
@@ -0,0 +1,32 @@
+import pytest
+from main_pagination import encode_cursor, decode_cursor, parse_page, parse_fields, PaginationError, MAX_PAGE_SIZE
+
+
+def test_cursor_round_trip():
+    token = encode_cursor(['Иванов Иван', 42])
+    assert '=' not in token
+    assert decode_cursor(token, (str, int)) == ['Иванов Иван', 42]
+
+
+@pytest.mark.parametrize('token', ['not-base64!', encode_cursor({'a': 1}), encode_cursor(['x']), encode_cursor([1, 2])])
+def test_decode_cursor_rejects_malformed_tokens(token):
+    with pytest.raises(PaginationError):
+        decode_cursor(token, (str, int))
+
+
+def test_parse_page():
+    assert parse_page({}, (str, int), default_limit=50) == (50, None)
+    cursor = encode_cursor(['b', 2])
+    assert parse_page({'limit': '10', 'cursor': cursor}, (str, int)) == (10, ['b', 2])
+    for limit in ('0', str(MAX_PAGE_SIZE + 1), 'ten'):
+        with pytest.raises(PaginationError):
+            parse_page({'limit': limit}, (str, int))
+
+
+def test_parse_fields():
+    allowed = ('student_id', 'full_name', 'group_id')
+    assert parse_fields({}, allowed) == list(allowed)
+    assert parse_fields({'fields': 'full_name, student_id'}, allowed) == ['full_name', 'student_id']
+    for fields in ('password', ' , '):
+        with pytest.raises(PaginationError):
+            parse_fields({'fields': fields}, allowed)
@@ -0,0 +1,28 @@
+from datetime import date
+from main_reports import split_range, next_month
+
+
+def test_next_month():
+    assert next_month(date(2024, 1, 31)) == date(2024, 2, 1)
+    assert next_month(date(2024, 12, 15)) == date(2025, 1, 1)
+
+
+def test_split_range_full_months_only():
+    assert split_range(date(2024, 1, 1), date(2024, 3, 31)) == (date(2024, 1, 1), date(2024, 4, 1), [])
+
+
+def test_split_range_partial_edges():
+    assert split_range(date(2024, 1, 15), date(2024, 4, 10)) == (
+        date(2024, 2, 1), date(2024, 4, 1),
+        [(date(2024, 1, 15), date(2024, 1, 31)), (date(2024, 4, 1), date(2024, 4, 10))]
+    )
+
+
+def test_split_range_within_one_month():
+    assert split_range(date(2024, 2, 3), date(2024, 2, 20)) == (None, None, [(date(2024, 2, 3), date(2024, 2, 20))])
+
+
+def test_split_range_open_bounds():
+    assert split_range(None, None) == (None, None, [])
+    assert split_range(date(2024, 1, 10), None) == (date(2024, 2, 1), None, [(date(2024, 1, 10), date(2024, 1, 31))])
+    assert split_range(None, date(2024, 3, 5)) == (None, date(2024, 3, 1), [(date(2024, 3, 1), date(2024, 3, 5))])
@@ -0,0 +1,56 @@
+import numpy as np
+from main_encoding import compute_template, pack_encoding
+from main_gallery import FaceGallery
+
+
+def student_encodings(rng, count=6, noise=0.02):
+    center = rng.standard_normal(128).astype(np.float32) * 0.09
+    return center + rng.standard_normal((count, 128)).astype(np.float32) * noise
+
+
+def test_compute_template_drops_outlier():
+    rng = np.random.default_rng(0)
+    encodings = student_encodings(rng)
+    outlier = rng.standard_normal(128).astype(np.float32) * 0.09
+    template, radius, inliers = compute_template(np.vstack([encodings, outlier]))
+    assert inliers == len(encodings)
+    assert np.allclose(template, encodings.mean(axis=0), atol=1e-6)
+    assert radius == np.linalg.norm(encodings - template, axis=1).max()
+    assert np.linalg.norm(outlier - template) > radius
+
+
+def test_compute_template_keeps_small_sets():
+    encodings = np.array([[0.0] * 128, [0.2] + [0.0] * 127], dtype=np.float32)
+    template, radius, inliers = compute_template(encodings)
+    assert inliers == 2
+    assert np.isclose(radius, 0.1)
+
+
+# Галерея без БД: строки и шаблоны задаются напрямую
+def template_gallery(encodings_by_student):
+    gallery = FaceGallery()
+    face_id = 0
+    for student_id, encodings in encodings_by_student.items():
+        for encoding in encodings:
+            face_id += 1
+            gallery._upsert_row((face_id, student_id, f"student_{student_id}", 1, pack_encoding(encoding), None))
+        template, radius, _ = compute_template(encodings)
+        gallery._templates.upsert((student_id, f"student_{student_id}", 1, pack_encoding(template), radius))
+    gallery.loaded = True
+    gallery._last_sync = float('inf')
+    return gallery
+
+
+def test_rerank_matches_inliers_and_ignores_outlier_photo():
+    rng = np.random.default_rng(1)
+    encodings = student_encodings(rng)
+    outlier = rng.standard_normal(128).astype(np.float32) * 0.09
+    gallery = template_gallery({1: np.vstack([encodings, outlier]), 2: student_encodings(rng)})
+    near_inlier = encodings[0] + 0.01
+    near_outlier = outlier + 0.01
+
+    matches = gallery.match([near_inlier, near_outlier], tolerance=0.5, mode='templates', rerank=True)
+    assert [match['student_id'] for match in matches[0]] == [1]
+    assert matches[1] == []
+    # Режим faces находит студента и по неудачному фото
+    assert [match['student_id'] for match in gallery.match([near_outlier], tolerance=0.5)[0]] == [1]